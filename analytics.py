@@ -0,0 +1,192 @@
+"""Auswertungen aus dem Preisverlauf: Renditen, Volatilität, Drawdown und Korrelation"""
+import numpy as np
+import pandas as pd
+
+from timeseries import DAY
+
+# Fenster der rollierenden Volatilität in Tagen, Kryptos handeln auch am Wochenende
+VOLATILITY_WINDOW = 30
+PERIODS_PER_YEAR = 365
+
+
+def daily_prices(history, names, bars=None, symbols=None):
+    """Tagesschlusskurse (letzter Preis pro Tag) als Frame Tage x Assets, Lücken vorwärts gefüllt
+
+    Mit bars (ohlc.DailyBars) und dem Symbol pro Asset dienen die geladenen
+    Schlusskurse als Grundlage, eigene Kurse aus history haben am selben Tag Vorrang.
+    """
+    symbols = list(symbols) if symbols is not None else [None] * len(names)
+    arrays = []
+    for name, symbol in zip(names, symbols):
+        # Tagesschlusskurse zuerst, damit ein Punkt aus history am selben Tag gewinnt
+        closes = bars.get(symbol) if bars is not None and symbol is not None else None
+        series = history.get(name)
+        parts = []
+        if closes is not None and len(closes[0]):
+            parts.append((closes[0].astype(np.float64) * DAY, closes[1]))
+        if series is not None and len(series):
+            parts.append(series.to_arrays())
+        if parts:
+            arrays.append((name, np.concatenate([ts for ts, _ in parts]), np.concatenate([p for _, p in parts])))
+    if not arrays:
+        return pd.DataFrame()
+    names = [name for name, _, _ in arrays]
+    lengths = np.array([len(ts) for _, ts, _ in arrays])
+    codes = np.repeat(np.arange(len(names)), lengths)
+    days = np.concatenate([ts for _, ts, _ in arrays]) // DAY
+    prices = np.concatenate([p for _, _, p in arrays])
+
+    first_day = int(days.min())
+    n_days = int(days.max()) - first_day + 1
+    # Punkte sind pro Asset chronologisch, der letzte Punkt pro (Tag, Asset) gewinnt
+    cell = (days.astype(np.int64) - first_day) * len(names) + codes
+    _, last = np.unique(cell[::-1], return_index=True)
+    last = len(cell) - 1 - last
+    matrix = np.full(n_days * len(names), np.nan)
+    matrix[cell[last]] = prices[last]
+
+    index = pd.to_datetime((first_day + np.arange(n_days)) * DAY, unit="s")
+    return pd.DataFrame(matrix.reshape(n_days, len(names)), index=index, columns=names).ffill()
+
+
+def max_drawdown(values):
+    """Grösster Rückgang vom bisherigen Höchststand, pro Spalte (negativ, 0 = kein Rückgang)"""
+    values = np.asarray(values, dtype=np.float64)
+    peaks = np.fmax.accumulate(values, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drawdown = values / peaks - 1
+    return np.nan_to_num(drawdown, nan=0.0).min(axis=0)
+
+
+def annualized_volatility(returns, window=VOLATILITY_WINDOW):
+    """Rollierende Volatilität der Tagesrenditen, auf ein Jahr hochgerechnet"""
+    return returns.rolling(window, min_periods=max(window // 2, 2)).std() * np.sqrt(PERIODS_PER_YEAR)
+
+
+def pairwise_correlation(returns, min_periods=2):
+    """Korrelation über jeweils gemeinsam vorhandene Tage, mit Matrixprodukten statt Paar-Schleife"""
+    x = returns.to_numpy(dtype=np.float64)
+    mask = np.isfinite(x).astype(np.float64)
+    # Zentrieren verbessert die Genauigkeit der Summenformel
+    # Mittelwert selbst bilden: nanmean warnt bei Spalten ganz ohne Renditen
+    counts = mask.sum(axis=0)
+    means = np.where(mask > 0, x, 0.0).sum(axis=0) / np.maximum(counts, 1)
+    x = np.where(mask > 0, x - means, 0.0)
+    n = mask.T @ mask
+    sum_x = x.T @ mask
+    sum_xx = (x * x).T @ mask
+    sum_xy = x.T @ x
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = n * sum_xy - sum_x * sum_x.T
+        var = n * sum_xx - sum_x ** 2
+        corr = cov / np.sqrt(var * var.T)
+    corr[n < min_periods] = np.nan
+    np.fill_diagonal(corr, np.where(np.diag(n) >= min_periods, 1.0, np.nan))
+    return pd.DataFrame(np.clip(corr, -1, 1), index=returns.columns, columns=returns.columns)
+
+
+def money_weighted_return(amounts, times, iterations=100, tol=1e-10):
+    """Interner Zinsfuss (XIRR) für Zahlungen amounts zu times (in Jahren), nan ohne Lösung"""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    if not (amounts < 0).any() or not (amounts > 0).any():
+        return float("nan")
+    rate = 0.1
+    for _ in range(iterations):
+        discount = (1 + rate) ** -times
+        value = np.dot(amounts, discount)
+        slope = np.dot(-times * amounts, discount / (1 + rate))
+        if slope == 0:
+            break
+        step = value / slope
+        rate = max(rate - step, -0.9999)
+        if abs(step) < tol:
+            return rate
+    return float("nan")
+
+
+class AnalyticsResult:
+    """Kennzahlen des Portfolios und der einzelnen Assets"""
+
+    def __init__(self, prices, values, performance, twr, mwr, volatility, portfolio_volatility, drawdowns, correlation):
+        self.prices = prices
+        self.values = values
+        self.performance = performance
+        self.twr = twr
+        self.mwr = mwr
+        self.volatility = volatility
+        self.portfolio_volatility = portfolio_volatility
+        self.drawdowns = drawdowns
+        self.correlation = correlation
+
+    @property
+    def max_drawdown(self):
+        # Auf dem TWR-Index, damit Käufe nicht als Erholung zählen
+        return float(max_drawdown(self.performance.to_numpy()))
+
+
+def compute_analytics(frame, history, rates=None, window=VOLATILITY_WINDOW, bars=None):
+    """Werte alle Positionen eines Portfolio-Frames über den Preisverlauf aus
+
+    bars (ohlc.DailyBars) ergänzt den eigenen Verlauf um geladene Tagesschlusskurse.
+    Gibt None zurück, solange weniger als zwei Tage Verlauf vorhanden sind.
+    """
+    prices = daily_prices(history, frame.index, bars, frame["symbol"])
+    if len(prices) < 2:
+        return None
+    holdings = frame.loc[prices.columns]
+    factors = rates.factors(holdings["currency"]) if rates is not None else np.ones(len(holdings))
+    quantity = holdings["quantity"].to_numpy(dtype=np.float64) * factors
+    matrix = prices.to_numpy()
+
+    # Eine Position zählt ab ihrem Kaufdatum (oder ab Beginn des Verlaufs), frühestens
+    # ab ihrem ersten Kurs: der Wert an diesem Tag ist ein Zufluss, keine Rendite
+    purchase = pd.to_datetime(holdings["purchase_date"], errors="coerce").to_numpy(dtype="datetime64[ns]")
+    start = np.searchsorted(prices.index.to_numpy(), purchase)
+    start = np.where(np.isnat(purchase), 0, np.minimum(start, len(prices) - 1))
+    start = np.maximum(start, np.isfinite(matrix).argmax(axis=0))
+    active = np.arange(len(prices))[:, None] >= start[None, :]
+    position_values = np.where(active, np.nan_to_num(matrix) * quantity, 0.0)
+    values = position_values.sum(axis=1)
+
+    # TWR: Tagesrenditen ohne die Zuflüsse neu eröffneter Positionen verketten
+    entering = np.zeros_like(active)
+    entering[start, np.arange(len(start))] = True
+    inflows = np.where(entering, position_values, 0.0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth = (values[1:] - inflows[1:]) / values[:-1]
+    growth = np.where(np.isfinite(growth), growth, 1.0)
+    performance = np.cumprod(np.append(1.0, growth))
+    twr = float(performance[-1] - 1)
+
+    # MWR: Kaufkosten als Abflüsse, heutiger Wert als Rückfluss
+    cost = holdings["quantity"].to_numpy(dtype=np.float64) * holdings["purchase_price"].to_numpy(dtype=np.float64) * factors
+    flow_dates = np.where(np.isnat(purchase), prices.index[0].to_datetime64(), purchase)
+    end = prices.index[-1].to_datetime64()
+    years = (np.append(flow_dates, end) - flow_dates.min()) / np.timedelta64(1, "D") / PERIODS_PER_YEAR
+    mwr = money_weighted_return(np.append(-cost, values[-1]), years)
+
+    values = pd.Series(values, index=prices.index)
+    returns = prices.pct_change(fill_method=None)
+    portfolio_returns = pd.Series(np.append(np.nan, growth - 1), index=prices.index)
+    return AnalyticsResult(
+        prices=prices,
+        values=values,
+        performance=pd.Series(performance, index=prices.index),
+        twr=twr,
+        mwr=mwr,
+        volatility=annualized_volatility(returns, window),
+        portfolio_volatility=annualized_volatility(portfolio_returns, window),
+        drawdowns=pd.Series(max_drawdown(matrix), index=prices.columns),
+        correlation=pairwise_correlation(returns, min_periods=max(window // 2, 2)),
+    )
+
+
+def portfolio_analytics(store, history, rates=None, bars=None):
+    """Auswertung eines PortfolioStore, neu berechnet nur bei neuer Portfolio-, Verlaufs- oder Tageskursversion"""
+    return store.cached("analytics", _build_analytics, history, history.version, rates,
+                        bars, bars.version if bars is not None else None)
+
+
+def _build_analytics(store, history, history_version, rates, bars, bars_version):
+    return compute_analytics(store.frame(), history, rates, bars=bars)
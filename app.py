@@ -4,11 +4,23 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-import io
-import re
-import time
-import requests
+import functools
 import json
+import os
+from portfolio_engine import (
+    PortfolioEngine, build_fx_engine, build_history_provider, build_live_provider, build_quote_cache
+)
+from valuation import CURRENT_VALUE, GAIN, GAIN_PERCENT, portfolio_metrics
+from simulation import simulate_portfolio
+from charts import GROUPINGS, line_figure, portfolio_figures, portfolio_history_figure
+from ledger import BUY, DIVIDEND, FEE, SELL, Transaction
+from storage import PortfolioDatabase
+from instrumentation import METRICS, span
+from scheduler import DEFAULT_INTERVAL, PriceScheduler
+from fx import CURRENCIES
+from ohlc import DEFAULT_DAYS
+from export import FORMATS, TABLES, available_formats, file_name, mime_type
+from rebalance import group_keys
 
 # App-Konfiguration
 st.set_page_config(
@@ -321,371 +333,326 @@ st.markdown("""
 # Titel der App
 st.markdown('<h1 class="main-header">🌿 Finanz Portfolio Tracker</h1>', unsafe_allow_html=True)
 
-# Portfolio-Daten initialisieren
-if 'portfolio' not in st.session_state:
-    st.session_state.portfolio = {}
-if 'last_price_update' not in st.session_state:
-    st.session_state.last_price_update = None
-if 'price_history' not in st.session_state:
-    st.session_state.price_history = {}
-
-# Beispiel-Daten für Demo-Zwecke
-if not st.session_state.portfolio:
-    st.session_state.portfolio = {
-        "Vanguard FTSE All-World (VWRA)": {
-            "symbol": "VWRA.AS",
-            "quantity": 15.5,
-            "purchase_price": 95.40,
-            "purchase_date": "2023-05-15",
-            "current_price": 102.30,
-            "type": "ETF",
-            "currency": "EUR",
-            "sector": "Global"
-        },
-        "Bitcoin (BTC)": {
-            "symbol": "BTC-USD",
-            "quantity": 0.25,
-            "purchase_price": 38500.00,
-            "purchase_date": "2023-08-10",
-            "current_price": 42000.00,
-            "type": "Krypto",
-            "currency": "USD",
-            "sector": "Kryptowährung"
-        },
-        "Apple Inc. (AAPL)": {
-            "symbol": "AAPL",
-            "quantity": 5,
-            "purchase_price": 170.50,
-            "purchase_date": "2023-10-05",
-            "current_price": 185.20,
-            "type": "Aktie",
-            "currency": "USD",
-            "sector": "Technology"
-        },
-        "iShares Core S&P 500 (IVV)": {
-            "symbol": "IVV",
-            "quantity": 8,
-            "purchase_price": 420.75,
-            "purchase_date": "2023-03-22",
-            "current_price": 455.30,
-            "type": "ETF",
-            "currency": "USD",
-            "sector": "US Large Cap"
-        },
-        "Nestlé SA (NESN)": {
-            "symbol": "NESN.SW",
-            "quantity": 10,
-            "purchase_price": 105.20,
-            "purchase_date": "2023-07-18",
-            "current_price": 112.50,
-            "type": "Aktie",
-            "currency": "CHF",
-            "sector": "Consumer Goods"
-        }
-    }
+@st.cache_resource
+def get_database():
+    """Gemeinsame Datenbankverbindung dieses Server-Prozesses"""
+    return PortfolioDatabase()
 
-# Funktion zum Abrufen aktueller Preise von einer öffentlichen API
-def get_crypto_price(symbol):
-    """Hole Krypto-Preise von einer öffentlichen API"""
-    crypto_map = {
-        "BTC-USD": "bitcoin",
-        "ETH-USD": "ethereum",
-        "XRP-USD": "ripple",
-        "LTC-USD": "litecoin",
-        "ADA-USD": "cardano"
-    }
-    
-    if symbol in crypto_map:
-        try:
-            url = f"https://api.coingecko.com/api/v3/simple/price?ids={crypto_map[symbol]}&vs_currencies=usd"
-            response = requests.get(url, timeout=10)
-            data = response.json()
-            return data[crypto_map[symbol]]['usd']
-        except:
-            return None
-    return None
-
-# Funktion zum Simulieren von Aktienpreisen basierend auf historischen Trends
-def simulate_stock_price(symbol, purchase_price):
-    """Simuliere realistische Aktienpreise basierend auf dem Kaufpreis"""
-    # Verschiedene Szenarien basierend auf Symbol und Kaufpreis
-    if "AAPL" in symbol:
-        volatility = 0.08  # Apple ist relativ stabil
-    elif "TSLA" in symbol:
-        volatility = 0.15  # Tesla ist volatiler
-    elif "NVDA" in symbol:
-        volatility = 0.12  # NVIDIA ist mittel volatil
-    else:
-        volatility = 0.10  # Standard Volatilität
-    
-    # Zufällige Preisänderung basierend auf Volatilität
-    change_percent = np.random.normal(0, volatility)
-    new_price = purchase_price * (1 + change_percent)
-    
-    # Sicherstellen, dass der Preis nicht negativ wird
-    return max(new_price, purchase_price * 0.5)
+@st.cache_resource
+def get_quote_cache():
+    """Gemeinsamer Kurs-Cache für alle Sessions dieses Server-Prozesses"""
+    return build_quote_cache()
+
+@st.cache_resource
+def get_live_provider():
+    """Live-Kursquelle, gelesen durch den gemeinsamen Cache"""
+    return build_live_provider(get_quote_cache())
+
+@st.cache_resource
+def get_fx_engine():
+    """Gemeinsame Wechselkurse für alle Sessions, Quelle über FX_PROVIDER"""
+    return build_fx_engine()
+
+@st.cache_resource
+def get_daily_bars():
+    """Historische Tageskurse, einmal pro Server-Prozess geladen und von allen Sessions gelesen"""
+    return get_database().load_bars()
+
+@st.cache_resource
+def get_history_provider():
+    return build_history_provider()
+
+database = get_database()
+live_provider = get_live_provider()
+fx_engine = get_fx_engine()
+
+# Portfolio-Daten initialisieren, gespeicherter Stand wird einmal pro Session geladen
+if 'engine' not in st.session_state:
+    st.session_state.engine = PortfolioEngine(database, live_provider, fx_engine, get_daily_bars(), get_history_provider())
+    # Beispiel-Daten für Demo-Zwecke
+    if not st.session_state.engine.store:
+        st.session_state.engine.load_demo()
+    # Bestände ohne Transaktionen (Demo-Daten, ältere Datenbanken) einmal als Eröffnungskäufe erfassen
+    st.session_state.engine.open_missing()
+
+engine = st.session_state.engine
+
+# Hintergrund-Aktualisierung der Live-Kurse aller Sessions in Sekunden, 0 = nur über den Button
+PRICE_REFRESH_INTERVAL = float(os.environ.get("PRICE_REFRESH_INTERVAL", DEFAULT_INTERVAL))
+
+@st.cache_resource
+def get_price_scheduler():
+    """Ein Scheduler pro Server-Prozess, eine Abfrage pro Intervall unabhängig von der Anzahl Sessions"""
+    return PriceScheduler(get_live_provider(), interval=PRICE_REFRESH_INTERVAL).start()
+
+price_scheduler = get_price_scheduler() if PRICE_REFRESH_INTERVAL else None
+if price_scheduler is not None:
+    # Liest nur den letzten Snapshot, gewartet wird nie auf die Quelle
+    engine.follow(price_scheduler)
 
-# Funktion zum Aktualisieren der Preise
 def update_prices():
     """Aktualisiere Preise für alle Assets im Portfolio"""
-    if st.session_state.portfolio:
+    if engine.store:
         with st.spinner("Aktualisiere Preise..."):
             progress_bar = st.progress(0)
-            assets = list(st.session_state.portfolio.keys())
-            
-            for i, asset_name in enumerate(assets):
-                asset_data = st.session_state.portfolio[asset_name]
-                symbol = asset_data['symbol']
-                purchase_price = asset_data['purchase_price']
-                
-                # Versuche Krypto-Preis zuerst
-                if asset_data['type'] == 'Krypto':
-                    new_price = get_crypto_price(symbol)
-                    if new_price is not None:
-                        st.session_state.portfolio[asset_name]['current_price'] = new_price
-                    else:
-                        # Fallback: Simulation wenn API nicht verfügbar
-                        st.session_state.portfolio[asset_name]['current_price'] = simulate_stock_price(symbol, purchase_price)
-                else:
-                    # Für Aktien und ETFs: Realistische Simulation
-                    st.session_state.portfolio[asset_name]['current_price'] = simulate_stock_price(symbol, purchase_price)
-                
-                # Preisverlauf speichern
-                if asset_name not in st.session_state.price_history:
-                    st.session_state.price_history[asset_name] = []
-                
-                st.session_state.price_history[asset_name].append({
-                    'date': datetime.now().strftime("%Y-%m-%d %H:%M"),
-                    'price': st.session_state.portfolio[asset_name]['current_price']
-                })
-                
-                # Fortschritt aktualisieren
-                progress_bar.progress((i + 1) / len(assets))
-                time.sleep(0.1)  # Kurze Pause
-            
-            st.session_state.last_price_update = datetime.now()
+            engine.refresh_prices(on_progress=lambda done, total: progress_bar.progress(done / total if total else 1.0))
+            progress_bar.progress(1.0)
+            # Kein st.rerun(): Der Button steht vor den Seiten, die neuen Kurse erscheinen noch in diesem Lauf
             st.success("Preise erfolgreich aktualisiert!")
-            st.rerun()
 
 # CSV-Upload und Verarbeitung für verschiedene Formate
 def process_csv(uploaded_file):
-    try:
-        # CSV Datei lesen mit korrekter Kodierung
-        content = uploaded_file.read().decode('utf-8-sig')
-        df = pd.read_csv(io.StringIO(content), sep=';|,', engine='python')
-        
-        assets_added = 0
-        for _, row in df.iterrows():
-            try:
-                # Verschiedene CSV-Formate unterstützen
-                if 'Ticker' in df.columns and 'Quantity' in df.columns and 'Price' in df.columns:
-                    # Standardformat
-                    asset_name = row['Ticker']
-                    symbol = row['Ticker']
-                    quantity = float(row['Quantity'])
-                    price = float(row['Price'])
-                    asset_type = row.get('Type', 'Aktie')
-                    currency = row.get('Currency', 'USD')
-                    date = row.get('Date', datetime.now().strftime('%Y-%m-%d'))
-                    sector = row.get('Sector', 'Allgemein')
-                
-                elif 'ACTIVITY TYPE' in df.columns and df['ACTIVITY TYPE'].str.contains('INVEST_ORDER_EXECUTED').any():
-                    # Yuh-Format
-                    if row['ACTIVITY TYPE'] != 'INVEST_ORDER_EXECUTED':
-                        continue
-                    
-                    activity_name = str(row['ACTIVITY NAME'])
-                    quantity_match = re.search(r'([\d,\.]+)x', activity_name)
-                    name_match = re.search(r'x\s+(.+)', activity_name)
-                    
-                    if quantity_match and name_match:
-                        quantity_str = quantity_match.group(1).replace(',', '')
-                        quantity = float(quantity_str)
-                        asset_name = name_match.group(1).strip()
-                        symbol = row['ASSET'] if pd.notna(row['ASSET']) else asset_name
-                        price = float(row['PRICE PER UNIT']) if pd.notna(row['PRICE PER UNIT']) else 0
-                        currency = row['DEBIT CURRENCY'] if pd.notna(row['DEBIT CURRENCY']) else 'CHF'
-                        date = row['DATE']
-                        sector = 'Allgemein'
-                        
-                        # Asset-Typ bestimmen
-                        asset_name_upper = asset_name.upper()
-                        if any(x in asset_name_upper for x in ['VANGUARD', 'ISHARES', 'ETF', 'FONDS']):
-                            asset_type = "ETF"
-                        elif any(x in asset_name_upper for x in ['XBT', 'XRP', 'XLM', 'LNK', 'BTC', 'ETH']):
-                            asset_type = "Krypto"
-                        elif 'GOLD' in asset_name_upper or 'SILVER' in asset_name_upper:
-                            asset_type = "Rohstoffe"
-                        else:
-                            asset_type = "Aktie"
-                
-                else:
-                    # Einfaches Format: Name, Symbol, Quantity, Price
-                    asset_name = row.iloc[0] if len(row) > 0 else "Unbekannt"
-                    symbol = row.iloc[1] if len(row) > 1 else asset_name
-                    quantity = float(row.iloc[2]) if len(row) > 2 else 0
-                    price = float(row.iloc[3]) if len(row) > 3 else 0
-                    asset_type = row.iloc[4] if len(row) > 4 else "Aktie"
-                    currency = row.iloc[5] if len(row) > 5 else "USD"
-                    date = row.iloc[6] if len(row) > 6 else datetime.now().strftime('%Y-%m-%d')
-                    sector = row.iloc[7] if len(row) > 7 else "Allgemein"
-                
-                # Einzigartigen Schlüssel erstellen
-                asset_key = f"{asset_name} ({symbol})"
-                
-                # Prüfen ob Asset bereits existiert und Menge addieren
-                if asset_key in st.session_state.portfolio:
-                    st.session_state.portfolio[asset_key]['quantity'] += quantity
-                    # Durchschnittspreis berechnen
-                    old_value = st.session_state.portfolio[asset_key]['quantity'] * st.session_state.portfolio[asset_key]['purchase_price']
-                    new_value = quantity * price
-                    total_quantity = st.session_state.portfolio[asset_key]['quantity']
-                    st.session_state.portfolio[asset_key]['purchase_price'] = (old_value + new_value) / total_quantity
-                else:
-                    # Neues Asset hinzufügen
-                    st.session_state.portfolio[asset_key] = {
-                        "symbol": symbol,
-                        "quantity": quantity,
-                        "purchase_price": price,
-                        "purchase_date": date,
-                        "current_price": price,  # Startet mit Kaufpreis
-                        "type": asset_type,
-                        "currency": currency,
-                        "sector": sector
-                    }
-                
-                assets_added += 1
-                    
-            except Exception as e:
-                st.warning(f"Konnte Transaktion nicht verarbeiten: {str(row)}. Fehler: {str(e)}")
-                continue
-        
-        return assets_added
-        
-    except Exception as e:
-        st.error(f"Fehler beim Verarbeiten der CSV-Datei: {str(e)}")
-        return 0
-
-# Funktion zum Exportieren des Portfolios als CSV
-def export_portfolio():
-    """Exportiere Portfolio als CSV"""
-    if st.session_state.portfolio:
-        portfolio_df = pd.DataFrame.from_dict(st.session_state.portfolio, orient='index')
-        return portfolio_df.to_csv(index=True)
-    return None
+    """Importiere eine hochgeladene Datei einmal pro Upload
+
+    Die Datei bleibt über Reruns hochgeladen, danach wird nur das gemerkte
+    Ergebnis angezeigt. Gibt (Anzahl Transaktionen, neu importiert) zurück.
+    """
+    previous = st.session_state.get("csv_import")
+    fresh = previous is None or previous[0] != uploaded_file.file_id
+    if fresh:
+        try:
+            result = engine.import_csv(uploaded_file)
+        except Exception as e:
+            result = e
+        st.session_state.csv_import = (uploaded_file.file_id, result)
+    else:
+        result = previous[1]
+    
+    if isinstance(result, Exception):
+        st.error(f"Fehler beim Verarbeiten der CSV-Datei: {str(result)}")
+        return 0, fresh
+    if result.duplicates:
+        st.info(f"{result.duplicates} Zeilen waren bereits importiert und wurden übersprungen.")
+    if result.skipped:
+        st.warning(f"{result.skipped} Transaktionen konnten nicht verarbeitet werden (fehlende oder ungültige Menge/Preis/Datum).")
+    return result.transactions, fresh
+
+# Export erst beim Klick auf den Download erzeugen, nicht bei jedem Seitenaufbau
+def export_portfolio(fmt, tables):
+    """Liefert eine Funktion, die den Export beim Download erzeugt (zwischengespeichert pro Version)"""
+    return functools.partial(engine.export, fmt, tuple(tables))
+
+# Auswahl im Formular "Asset hinzufügen"
+TRANSACTION_KINDS = {"Kauf": BUY, "Verkauf": SELL, "Gebühr": FEE, "Dividende": DIVIDEND}
+
+# Portfolio Management: Sortierung, Seitengrößen und Spalten der Tabelle
+SORT_FIELDS = {
+    None: "Reihenfolge der Erfassung",
+    "name": "Name",
+    "symbol": "Symbol",
+    "type": "Typ",
+    "sector": "Sektor",
+    "quantity": "Menge",
+    "current_price": "Aktueller Preis",
+    "purchase_date": "Kaufdatum",
+}
+PAGE_SIZES = [25, 50, 100, 250]
+MANAGEMENT_COLUMNS = {
+    "symbol": "Symbol",
+    "type": "Typ",
+    "sector": "Sektor",
+    "currency": "Währung",
+    "purchase_date": "Kaufdatum",
+    "quantity": "Menge",
+    "purchase_price": "Kaufpreis",
+    "current_price": "Aktueller Preis",
+    GAIN: "Gewinn/Verlust",
+    GAIN_PERCENT: "Gewinn/Verlust %",
+}
+
+# Spaltenformate der Asset-Tabelle im Dashboard
+def detail_columns(base_currency):
+    return {
+        'symbol': st.column_config.TextColumn("Symbol"),
+        'quantity': st.column_config.NumberColumn("Menge"),
+        'purchase_price': st.column_config.NumberColumn("Kaufpreis", format="%.2f"),
+        'current_price': st.column_config.NumberColumn("Aktueller Preis", format="%.2f"),
+        'currency': st.column_config.TextColumn("Währung"),
+        'Investiert': st.column_config.NumberColumn(f"Investiert ({base_currency})", format="%.2f"),
+        'Aktueller Wert': st.column_config.NumberColumn(f"Aktueller Wert ({base_currency})", format="%.2f"),
+        'Gewinn/Verlust': st.column_config.NumberColumn(f"Gewinn/Verlust ({base_currency})", format="%.2f"),
+        'Gewinn/Verlust %': st.column_config.NumberColumn("Gewinn/Verlust %", format="%+.2f%%"),
+    }
 
 # Navigation
 st.sidebar.markdown('<p class="sidebar-header">🌿 Navigation</p>', unsafe_allow_html=True)
-page = st.sidebar.radio("", ["Dashboard", "Asset hinzufügen", "CSV Import", "Portfolio Management", "Analysen", "Einstellungen"], label_visibility="collapsed")
+page = st.sidebar.radio("", ["Dashboard", "Asset hinzufügen", "CSV Import", "Portfolio Management", "Analysen", "Rebalancing", "Einstellungen"], label_visibility="collapsed")
 
 # Preise aktualisieren Button in der Sidebar
 st.sidebar.markdown("---")
 if st.sidebar.button("🔄 Preise aktualisieren", use_container_width=True):
     update_prices()
 
-if st.session_state.last_price_update:
-    st.sidebar.caption(f"Letzte Aktualisierung: {st.session_state.last_price_update.strftime('%d.%m.%Y %H:%M')}")
+if engine.last_price_update:
+    st.sidebar.caption(f"Letzte Aktualisierung: {engine.last_price_update.strftime('%d.%m.%Y %H:%M')}")
+    stale_count = int(engine.store.column('stale').sum())
+    if stale_count:
+        st.sidebar.caption(f"⚠️ {stale_count} Preise veraltet (Zeitüberschreitung)")
+if price_scheduler is not None:
+    st.sidebar.caption(f"Live-Kurse im Hintergrund alle {PRICE_REFRESH_INTERVAL:g} s")
+    if price_scheduler.failures:
+        st.sidebar.caption(f"⚠️ Kursquelle nicht erreichbar, nächster Versuch in {price_scheduler.delay():g} s")
 
-# Dashboard Seite
-if page == "Dashboard":
-    st.header("📊 Portfolio Übersicht")
+# Dashboard-Bausteine
+def render_metrics(totals, base):
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.markdown('<p class="metric-label">Gesamt investiert</p>', unsafe_allow_html=True)
+        st.markdown(f'<p class="metric-value">{base} {totals.invested:,.2f}</p>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
     
-    if st.session_state.portfolio:
-        portfolio_df = pd.DataFrame.from_dict(st.session_state.portfolio, orient='index')
-        portfolio_df['Investiert'] = portfolio_df['quantity'] * portfolio_df['purchase_price']
-        portfolio_df['Aktueller Wert'] = portfolio_df['quantity'] * portfolio_df['current_price']
-        portfolio_df['Gewinn/Verlust'] = portfolio_df['Aktueller Wert'] - portfolio_df['Investiert']
-        portfolio_df['Gewinn/Verlust %'] = (portfolio_df['Gewinn/Verlust'] / portfolio_df['Investiert']) * 100
-        
-        total_invested = portfolio_df['Investiert'].sum()
-        total_current = portfolio_df['Aktueller Wert'].sum()
-        total_gain = total_current - total_invested
-        gain_percentage = (total_gain / total_invested * 100) if total_invested > 0 else 0
-        
-        # Metriken anzeigen
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.markdown('<p class="metric-label">Gesamt investiert</p>', unsafe_allow_html=True)
-            st.markdown(f'<p class="metric-value">CHF {total_invested:,.2f}</p>', unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
+    with col2:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.markdown('<p class="metric-label">Aktueller Wert</p>', unsafe_allow_html=True)
+        st.markdown(f'<p class="metric-value">{base} {totals.current:,.2f}</p>', unsafe_allow_html=True)
+        change_class = "metric-change-positive" if totals.gain_percent >= 0 else "metric-change-negative"
+        st.markdown(f'<p class="{change_class}">{totals.gain_percent:+.2f}%</p>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+    
+    with col3:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.markdown('<p class="metric-label">Gesamtgewinn/verlust</p>', unsafe_allow_html=True)
+        st.markdown(f'<p class="metric-value">{base} {totals.gain:,.2f}</p>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
         
-        with col2:
-            st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.markdown('<p class="metric-label">Aktueller Wert</p>', unsafe_allow_html=True)
-            st.markdown(f'<p class="metric-value">CHF {total_current:,.2f}</p>', unsafe_allow_html=True)
-            change_class = "metric-change-positive" if gain_percentage >= 0 else "metric-change-negative"
-            st.markdown(f'<p class="{change_class}">{gain_percentage:+.2f}%</p>', unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
+    with col4:
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.markdown('<p class="metric-label">Anzahl Assets</p>', unsafe_allow_html=True)
+        st.markdown(f'<p class="metric-value">{totals.count}</p>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
+def render_charts(rates):
+    group_label = st.radio("Gruppieren nach", list(GROUPINGS), horizontal=True, key="dashboard_grouping")
+    # Grafiken werden nur nach Preis- oder Bestandsänderungen neu gebaut, mit höchstens TOP_N Segmenten
+    allocation, performance = portfolio_figures(engine.store, rates, GROUPINGS[group_label])
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("Asset-Verteilung nach Wert")
+        st.plotly_chart(allocation, use_container_width=True)
+    
+    with col2:
+        st.subheader("Performance nach Asset")
+        st.plotly_chart(performance, use_container_width=True)
+
+def render_history(portfolio_df):
+    history = engine.price_history
+    names = [
+        name for name, symbol in portfolio_df.sort_values('Aktueller Wert', ascending=False)['symbol'].items()
+        if name in history or symbol in engine.bars
+    ]
+    if not names:
+        return
+    st.subheader("Preisverlauf")
+    selected = st.multiselect("Assets", names, default=names[:3], key="history_assets")
+    if selected:
+        st.plotly_chart(portfolio_history_figure(engine.store, history, selected, engine.bars), use_container_width=True)
+
+def render_details(portfolio_df, base):
+    st.subheader("Asset Details")
+    
+    # Formatierung im Browser über column_config statt String-Kopien der Tabelle
+    st.dataframe(
+        portfolio_df,
+        column_order=['symbol', 'quantity', 'purchase_price', 'current_price', 'currency',
+                      'Investiert', 'Aktueller Wert', 'Gewinn/Verlust', 'Gewinn/Verlust %'],
+        column_config=detail_columns(base),
+        use_container_width=True,
+        height=400
+    )
+
+# Automatische Aktualisierung des Dashboards in Sekunden, 0 = nur über den Button
+LIVE_REFRESH_SECONDS = float(os.environ.get("LIVE_REFRESH_SECONDS", 0))
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS or None)
+def render_dashboard():
+    """Dashboard als Fragment: Live-Ticks führen nur diesen Teil erneut aus, nicht das ganze Skript"""
+    last_update = engine.last_price_update
+    if LIVE_REFRESH_SECONDS:
+        if price_scheduler is not None:
+            # Der Scheduler fragt die Quelle ab, der Tick übernimmt nur dessen neuesten Snapshot
+            engine.follow(price_scheduler)
+        elif last_update is None or (datetime.now() - last_update).total_seconds() >= LIVE_REFRESH_SECONDS:
+            engine.refresh_prices()
+        if engine.last_price_update:
+            st.caption(f"Live-Kurse alle {LIVE_REFRESH_SECONDS:g} s, zuletzt aktualisiert: {engine.last_price_update.strftime('%H:%M:%S')}")
+    
+    # Kennzahlen werden nur nach Preis- oder Bestandsänderungen neu berechnet
+    base = engine.base_currency
+    rates = engine.rates(base)
+    with span("dashboard.metrics"):
+        portfolio_df, totals = engine.metrics(base)
+        render_metrics(totals, base)
+    with span("dashboard.charts"):
+        render_charts(rates)
+    with span("dashboard.details"):
+        render_details(portfolio_df, base)
+    with span("dashboard.history"):
+        render_history(portfolio_df)
+
+@st.fragment
+def render_risk(base, rates):
+    """Monte-Carlo-Abschnitt als Fragment, das Absenden des Formulars rechnet nur diesen Teil neu"""
+    st.subheader("Risiko (Monte-Carlo-Simulation)")
+    with st.form("montecarlo_form"):
+        col1, col2, col3 = st.columns(3)
+        n_paths = col1.number_input("Anzahl Pfade", min_value=1000, max_value=200000, value=10000, step=1000)
+        steps = col2.number_input("Horizont (Kursaktualisierungen)", min_value=1, max_value=250, value=10)
+        level = col3.selectbox("Konfidenzniveau", [0.95, 0.99], format_func=lambda x: f"{x:.0%}")
+        col4, col5 = st.columns(2)
+        correlation = col4.slider("Korrelation zwischen Assets", min_value=0.0, max_value=0.95, value=0.3, step=0.05)
+        seed = col5.number_input("Seed", min_value=0, value=42, step=1)
+        if st.form_submit_button("Simulation starten"):
+            st.session_state.montecarlo_params = (int(n_paths), int(steps), float(correlation), int(seed))
+            st.session_state.montecarlo_level = level
+    
+    params = st.session_state.get('montecarlo_params')
+    if params:
+        level = st.session_state.montecarlo_level
+        # Ergebnis pro Portfolio-Version, Kurstabelle und Parametern nur einmal berechnen
+        result = engine.store.cached(
+            "montecarlo",
+            lambda store, rates, params: simulate_portfolio(portfolio_metrics(store, rates)[0], CURRENT_VALUE, *params),
+            rates, params
+        )
         
-        with col3:
-            st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.markdown('<p class="metric-label">Gesamtgewinn/verlust</p>', unsafe_allow_html=True)
-            st.markdown(f'<p class="metric-value">CHF {total_gain:,.2f}</p>', unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
-            
-        with col4:
-            st.markdown('<div class="metric-card">', unsafe_allow_html=True)
-            st.markdown('<p class="metric-label">Anzahl Assets</p>', unsafe_allow_html=True)
-            st.markdown(f'<p class="metric-value">{len(portfolio_df)}</p>', unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Aktueller Wert", f"{base} {result.initial_value:,.2f}")
+        col2.metric(f"Value at Risk ({level:.0%})", f"{base} {result.value_at_risk(level):,.2f}")
+        col3.metric(f"Expected Shortfall ({level:.0%})", f"{base} {result.expected_shortfall(level):,.2f}")
         
-        # Performance Diagramme
         col1, col2 = st.columns(2)
-        
         with col1:
-            st.subheader("Asset-Verteilung nach Wert")
-            if not portfolio_df.empty:
-                fig = px.pie(portfolio_df, values='Aktueller Wert', names=portfolio_df.index, 
-                             color_discrete_sequence=px.colors.qualitative.Pastel)
-                fig.update_layout(
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font=dict(size=16, color='#FFFFFF'),
-                    showlegend=True,
-                    legend=dict(
-                        orientation="h", 
-                        yanchor="bottom", 
-                        y=1.02, 
-                        xanchor="center", 
-                        x=0.5,
-                        font=dict(size=14)
-                    )
-                )
-                st.plotly_chart(fig, use_container_width=True)
-        
+            # Histogramm vorab zählen statt alle Pfade an Plotly zu übergeben
+            counts, edges = np.histogram(result.pnl, bins=60)
+            fig = px.bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=counts,
+                labels={'x': f"Gewinn/Verlust ({base})", 'y': "Pfade"},
+                title="Verteilung Gewinn/Verlust"
+            )
+            fig.add_vline(x=-result.value_at_risk(level), line_dash="dash", line_color="#E22134")
+            fig.update_layout(bargap=0)
+            st.plotly_chart(fig, use_container_width=True)
         with col2:
-            st.subheader("Performance nach Asset")
-            if not portfolio_df.empty:
-                fig = px.bar(portfolio_df.sort_values('Gewinn/Verlust %', ascending=False), 
-                             x=portfolio_df.index, y='Gewinn/Verlust %', 
-                             title="Gewinn/Verlust in %",
-                             color='Gewinn/Verlust %',
-                             color_continuous_scale=['#E22134', '#1DB954'])
-                fig.update_layout(
-                    paper_bgcolor='rgba(0,0,0,0)',
-                    plot_bgcolor='rgba(0,0,0,0)',
-                    font=dict(size=16, color='#FFFFFF'),
-                    xaxis_title="Asset",
-                    yaxis_title="Gewinn/Verlust %",
-                    showlegend=False
-                )
-                st.plotly_chart(fig, use_container_width=True)
-        
-        # Detaillierte Asset-Tabelle
-        st.subheader("Asset Details")
-        display_df = portfolio_df[['symbol', 'quantity', 'purchase_price', 'current_price', 
-                                  'Investiert', 'Aktueller Wert', 'Gewinn/Verlust', 'Gewinn/Verlust %']].copy()
-        display_df.columns = ['Symbol', 'Menge', 'Kaufpreis', 'Aktueller Preis', 
-                             'Investiert (CHF)', 'Aktueller Wert (CHF)', 'Gewinn/Verlust (CHF)', 'Gewinn/Verlust %']
-        
-        # Formatierung
-        for col in ['Kaufpreis', 'Aktueller Preis', 'Investiert (CHF)', 'Aktueller Wert (CHF)', 'Gewinn/Verlust (CHF)']:
-            display_df[col] = display_df[col].apply(lambda x: f"{x:,.2f}")
-        display_df['Gewinn/Verlust %'] = display_df['Gewinn/Verlust %'].apply(lambda x: f"{x:+.2f}%")
-        
-        st.dataframe(display_df, use_container_width=True, height=400)
-        
+            fig = go.Figure()
+            for path in result.sample_paths:
+                fig.add_trace(go.Scatter(y=path, mode="lines", line=dict(width=1), opacity=0.4, showlegend=False))
+            fig.update_layout(
+                title=f"{len(result.sample_paths)} von {len(result):,} Pfaden",
+                xaxis_title="Schritt",
+                yaxis_title=f"Portfoliowert ({base})"
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+# Dashboard Seite
+if page == "Dashboard":
+    st.header("📊 Portfolio Übersicht")
+    
+    if engine.store:
+        render_dashboard()
     else:
         st.info("❌ Noch keine Assets vorhanden. Gehen Sie zu 'CSV Import' oder 'Asset hinzufügen' um Investments hinzuzufügen.")
 
@@ -694,6 +661,8 @@ elif page == "Asset hinzufügen":
     st.header("➕ Neues Asset hinzufügen")
     
     with st.form("add_asset_form"):
+        kind_label = st.selectbox("Transaktion", list(TRANSACTION_KINDS))
+        
         col1, col2 = st.columns(2)
         
         name = col1.text_input("Name des Assets (z.B. 'Vanguard ETF')", placeholder="Apple Inc.")
@@ -701,14 +670,14 @@ elif page == "Asset hinzufügen":
         
         col3, col4 = st.columns(2)
         quantity = col3.number_input("Menge", min_value=0.0001, format="%.4f", value=1.0, step=0.0001)
-        price = col4.number_input("Kaufpreis pro Stück", min_value=0.01, format="%.2f", value=100.0, step=0.01)
+        price = col4.number_input("Preis pro Stück (bei Gebühr/Dividende: Betrag)", min_value=0.01, format="%.2f", value=100.0, step=0.01)
         
         col5, col6 = st.columns(2)
-        date = col5.date_input("Kaufdatum", value=datetime.now())
+        date = col5.date_input("Datum", value=datetime.now())
         asset_type = col6.selectbox("Typ", ["Aktie", "ETF", "Krypto", "Fonds", "Rohstoffe", "Anleihe", "Andere"])
         
         col7, col8 = st.columns(2)
-        currency = col7.selectbox("Währung", ["CHF", "USD", "EUR", "GBP", "JPY", "CNY"])
+        currency = col7.selectbox("Währung", CURRENCIES)
         sector = col8.selectbox("Sektor", ["Technology", "Healthcare", "Financial", "Consumer", "Energy", "Industrial", "Other"])
         
         submitted = st.form_submit_button("Asset hinzufügen")
@@ -717,22 +686,19 @@ elif page == "Asset hinzufügen":
             if not name or not symbol:
                 st.error("Bitte geben Sie einen Namen und ein Symbol für das Asset ein!")
             else:
-                # Aktuellen Preis setzen
-                current_price = price
-                
                 asset_key = f"{name} ({symbol})"
-                st.session_state.portfolio[asset_key] = {
-                    "symbol": symbol,
-                    "quantity": quantity,
-                    "purchase_price": price,
-                    "purchase_date": str(date),
-                    "current_price": current_price,
-                    "type": asset_type,
-                    "currency": currency,
-                    "sector": sector
-                }
-                st.success(f"✅ {asset_key} wurde erfolgreich hinzugefügt!")
-                st.balloons()
+                kind = TRANSACTION_KINDS[kind_label]
+                try:
+                    engine.record(asset_key, symbol, kind, quantity, price, date=str(date),
+                                  type=asset_type, currency=currency, sector=sector)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    if kind == BUY:
+                        st.success(f"✅ {asset_key} wurde erfolgreich hinzugefügt!")
+                        st.balloons()
+                    else:
+                        st.success(f"✅ {kind_label} für {asset_key} wurde erfasst!")
 
 # CSV Import Seite
 elif page == "CSV Import":
@@ -750,11 +716,12 @@ elif page == "CSV Import":
         
         if uploaded_file is not None:
             with st.spinner("Verarbeite CSV-Datei..."):
-                assets_added = process_csv(uploaded_file)
+                transactions_added, fresh = process_csv(uploaded_file)
                 
-            if assets_added > 0:
-                st.success(f"✅ {assets_added} Assets wurden erfolgreich importiert!")
-                st.balloons()
+            if transactions_added > 0:
+                st.success(f"✅ {transactions_added} Transaktionen wurden erfolgreich importiert!")
+                if fresh:
+                    st.balloons()
                 st.info("Wechseln Sie zum Dashboard um Ihre Portfolio-Übersicht zu sehen.")
             else:
                 st.warning("Keine neuen Transaktionen in der CSV-Datei gefunden oder Format nicht erkannt.")
@@ -772,46 +739,356 @@ elif page == "CSV Import":
 elif page == "Portfolio Management":
     st.header("⚙️ Portfolio Management")
     
-    if st.session_state.portfolio:
-        # Export-Button
-        csv_data = export_portfolio()
-        if csv_data:
-            st.download_button(
-                label="📥 Portfolio exportieren",
-                data=csv_data,
-                file_name="portfolio_export.csv",
-                mime="text/csv",
+    if engine.store:
+        # Export: Format und Tabellen wählen, erzeugt wird erst beim Download
+        with st.expander("📥 Portfolio exportieren", expanded=False):
+            col1, col2 = st.columns(2)
+            with col1:
+                export_format = st.radio(
+                    "Format", available_formats(),
+                    format_func=lambda fmt: FORMATS[fmt].label, horizontal=True
+                )
+            with col2:
+                export_tables = st.multiselect(
+                    "Tabellen", list(TABLES), default=["portfolio"], format_func=TABLES.get
+                )
+            if export_tables:
+                st.download_button(
+                    label="📥 Herunterladen",
+                    data=export_portfolio(export_format, export_tables),
+                    file_name=file_name(export_format, export_tables),
+                    mime=mime_type(export_format, export_tables),
+                    use_container_width=True
+                )
+            else:
+                st.caption("Mindestens eine Tabelle auswählen.")
+        
+        st.subheader("Aktuelle Assets")
+        
+        # Suche, Sortierung und Seitengröße; pro Lauf wird nur eine Seite dargestellt
+        col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+        with col1:
+            search = st.text_input("Suche (Name oder Symbol)", key="pm_search")
+        with col2:
+            sort = st.selectbox("Sortieren nach", list(SORT_FIELDS), format_func=SORT_FIELDS.get, key="pm_sort")
+        with col3:
+            page_size = st.selectbox("Pro Seite", PAGE_SIZES, index=1, key="pm_page_size")
+        with col4:
+            descending = st.toggle("Absteigend", key="pm_descending")
+        
+        matches = len(engine.store.query(search, sort, descending))
+        pages = max(1, -(-matches // page_size))
+        # Nach neuer Suche oder Löschungen kann die gemerkte Seite zu gross sein
+        if st.session_state.get("pm_page", 1) > pages:
+            st.session_state.pm_page = pages
+        pm_page = st.number_input("Seite", min_value=1, max_value=pages, step=1, key="pm_page")
+        page_frame, matches = engine.positions_page(search, pm_page - 1, page_size, sort, descending)
+        st.caption(f"{matches} von {len(engine.store)} Assets · Seite {pm_page} von {pages}")
+        
+        # Der Editor ordnet Änderungen der Zeilenposition zu: solange welche ausstehen,
+        # bleiben die Zeilen der letzten Darstellung, auch wenn Kurse die Sortierung ändern
+        editor_key = f"pm_editor_{pm_page}_{page_size}_{search}_{sort}_{descending}"
+        rows = st.session_state.get("pm_rows")
+        pending = st.session_state.get(editor_key, {}).get("edited_rows")
+        if pending and rows is not None and rows[0] == editor_key:
+            page_frame = engine.positions_rows(rows[1])
+        st.session_state.pm_rows = (editor_key, page_frame.index.tolist())
+        
+        if matches:
+            table = page_frame[list(MANAGEMENT_COLUMNS)].rename(columns=MANAGEMENT_COLUMNS)
+            table["Löschen"] = False
+            table.index.name = "Asset"
+            
+            # Änderungen werden erst mit dem Absenden übernommen, nicht bei jeder Zelle
+            with st.form("pm_edit"):
+                edited = st.data_editor(
+                    table,
+                    key=editor_key,
+                    disabled=[col for col in table.columns if col not in ("Menge", "Kaufpreis", "Löschen")],
+                    column_config={
+                        "Menge": st.column_config.NumberColumn(min_value=0.0, format="%.4f"),
+                        "Kaufpreis": st.column_config.NumberColumn(min_value=0.0, format="%.2f"),
+                        "Aktueller Preis": st.column_config.NumberColumn(format="%.2f"),
+                        "Gewinn/Verlust": st.column_config.NumberColumn(format="%.2f"),
+                        "Gewinn/Verlust %": st.column_config.NumberColumn(format="%+.2f%%"),
+                        "Löschen": st.column_config.CheckboxColumn(help="Position schliessen, das Journal bleibt erhalten"),
+                    },
+                    use_container_width=True
+                )
+                submitted = st.form_submit_button("Änderungen speichern")
+            
+            if submitted:
+                removals = edited.index[edited["Löschen"].to_numpy(dtype=bool)].tolist()
+                changed = (
+                    (edited["Menge"].to_numpy(dtype=np.float64) != table["Menge"].to_numpy(dtype=np.float64))
+                    | (edited["Kaufpreis"].to_numpy(dtype=np.float64) != table["Kaufpreis"].to_numpy(dtype=np.float64))
+                )
+                adjustments = {
+                    name: (quantity, price)
+                    for name, quantity, price in zip(edited.index[changed], edited["Menge"][changed], edited["Kaufpreis"][changed])
+                }
+                try:
+                    transactions = engine.apply_edits(adjustments, removals)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    # Übernommene Änderungen nicht auf die neu geladenen Zeilen anwenden
+                    st.session_state.pop(editor_key, None)
+                    if transactions:
+                        st.success(f"{len(adjustments)} Assets aktualisiert, {len(removals)} gelöscht.")
+                        st.rerun()
+                    st.info("Keine Änderungen.")
+            
+            # Journal nur für ein ausgewähltes Asset der Seite
+            selected = st.selectbox("Transaktionen anzeigen für", page_frame.index.tolist(), key="pm_details")
+            position = engine.ledger.get(selected)
+            if position is not None:
+                currency = page_frame.at[selected, "currency"]
+                st.write(
+                    f"**Realisiert:** {position.realized:,.2f} {currency} · "
+                    f"**Dividenden:** {position.dividends:,.2f} · **Gebühren:** {position.fees:,.2f} · "
+                    f"**Offene Lots:** {len(position.lots)}"
+                )
+                st.dataframe(
+                    pd.DataFrame(position.transactions, columns=Transaction._fields)[['date', 'kind', 'quantity', 'price', 'amount']],
+                    hide_index=True,
+                    use_container_width=True
+                )
+        else:
+            st.info("Keine Assets gefunden.")
+    else:
+        st.info("❌ Noch keine Assets vorhanden.")
+
+# Analysen Seite
+elif page == "Analysen":
+    st.header("🔬 Analysen")
+    
+    if engine.store:
+        base = engine.base_currency
+        rates = engine.rates(base)
+        portfolio_df, totals = engine.metrics(base)
+        
+        st.subheader("Performance")
+        analytics = engine.analytics(base)
+        if analytics is None:
+            st.info("Für Auswertungen werden Kurse von mindestens zwei Tagen benötigt. Aktualisiere die Preise regelmässig oder lade historische Kurse unter 'Einstellungen'.")
+        else:
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Zeitgewichtete Rendite", f"{analytics.twr:+.2%}")
+            col2.metric("Geldgewichtete Rendite p.a.", "–" if np.isnan(analytics.mwr) else f"{analytics.mwr:+.2%}")
+            col3.metric("Max. Drawdown", f"{analytics.max_drawdown:.2%}")
+            latest_volatility = analytics.portfolio_volatility.iloc[-1]
+            col4.metric("Volatilität p.a.", "–" if np.isnan(latest_volatility) else f"{latest_volatility:.2%}")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                fig = line_figure(
+                    {"Portfoliowert": (analytics.values.index, analytics.values.to_numpy())},
+                    title="Portfoliowert", yaxis_title=f"Portfoliowert ({base})"
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            with col2:
+                fig = line_figure(
+                    {"Volatilität": (analytics.portfolio_volatility.index, analytics.portfolio_volatility.to_numpy())},
+                    title="Rollierende Volatilität (30 Tage)", yaxis_title="Volatilität p.a."
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            
+            if len(analytics.correlation) > 1:
+                fig = px.imshow(
+                    analytics.correlation,
+                    zmin=-1, zmax=1,
+                    color_continuous_scale="RdBu",
+                    title="Korrelation der Tagesrenditen"
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            
+            st.dataframe(
+                pd.DataFrame({
+                    'Max. Drawdown': analytics.drawdowns,
+                    'Volatilität p.a.': analytics.volatility.iloc[-1],
+                }),
+                column_config={
+                    'Max. Drawdown': st.column_config.NumberColumn(format="percent"),
+                    'Volatilität p.a.': st.column_config.NumberColumn(format="percent"),
+                },
+                use_container_width=True
+            )
+        
+        render_risk(base, rates)
+    else:
+        st.info("❌ Noch keine Assets vorhanden.")
+
+# Rebalancing Seite
+elif page == "Rebalancing":
+    st.header("⚖️ Rebalancing")
+    
+    if engine.store:
+        base = engine.base_currency
+        portfolio_df, totals = engine.metrics(base)
+        
+        group_label = st.radio("Zielgewichte pro", list(GROUPINGS), horizontal=True, key="rebalance_grouping")
+        by = GROUPINGS[group_label]
+        current = portfolio_df[CURRENT_VALUE].groupby(group_keys(portfolio_df, by), sort=False).sum()
+        current_weights = current / current.sum() * 100 if current.sum() > 0 else current * 0
+        
+        # Berechnet wird erst beim Absenden, nicht bei jeder Änderung im Formular
+        with st.form("rebalance_form"):
+            targets = st.data_editor(
+                pd.DataFrame({"Aktuell %": current_weights, "Ziel %": current_weights}).rename_axis(group_label),
+                key=f"rebalance_targets_{group_label}",
+                disabled=["Aktuell %"],
+                column_config={
+                    "Aktuell %": st.column_config.NumberColumn(format="%.2f"),
+                    "Ziel %": st.column_config.NumberColumn(min_value=0.0, max_value=100.0, format="%.2f"),
+                },
                 use_container_width=True
             )
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                cash = st.number_input(f"Zusätzliche Liquidität ({base})", value=0.0, step=100.0,
+                                       help="Negativ für eine Entnahme")
+                min_trade = st.number_input(f"Mindestgrösse pro Trade ({base})", min_value=0.0, value=0.0, step=10.0)
+            with col2:
+                fee_rate = st.number_input("Gebühr in % des Betrags", min_value=0.0, value=0.0, step=0.05, format="%.2f")
+                fee_fixed = st.number_input(f"Gebühr pro Trade ({base})", min_value=0.0, value=0.0, step=1.0)
+            with col3:
+                lot_size = st.number_input("Handelseinheit (0 = Bruchteile)", min_value=0.0, value=0.0, step=1.0)
+                no_sell = st.multiselect("Nicht verkaufen", engine.store.names())
+            
+            submitted = st.form_submit_button("Trades berechnen", use_container_width=True)
         
-        st.subheader("Aktuelle Assets")
+        if submitted:
+            target_sum = targets["Ziel %"].sum()
+            if target_sum > 0 and abs(target_sum - 100) > 0.01:
+                st.info(f"Die Zielgewichte ergeben {target_sum:.2f} % und werden auf 100 % skaliert.")
+            try:
+                st.session_state.rebalance_plan = (group_label, engine.rebalance(
+                    targets["Ziel %"].to_dict(), by, base,
+                    cash=cash, lot_size=lot_size or None, fee_rate=fee_rate / 100,
+                    fee_fixed=fee_fixed, min_trade=min_trade, no_sell=no_sell
+                ))
+            except ValueError as e:
+                st.error(str(e))
+                st.session_state.rebalance_plan = None
         
-        for asset_name, asset_data in list(st.session_state.portfolio.items()):
-            with st.expander(f"{asset_name}", expanded=False):
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.write(f"**Symbol:** {asset_data['symbol']}")
-                    st.write(f"**Menge:** {asset_data['quantity']}")
-                    st.write(f"**Kaufpreis:** {asset_data['purchase_price']} {asset_data['currency']}")
-                    st.write(f"**Sektor:** {asset_data.get('sector', 'Nicht angegeben')}")
-                
-                with col2:
-                    st.write(f"**Aktueller Preis:** {asset_data['current_price']} {asset_data['currency']}")
-                    st.write(f"**Kaufdatum:** {asset_data['purchase_date']}")
-                    st.write(f"**Typ:** {asset_data['type']}")
-                
-                # Gewinn/Verlust berechnen
-                invested = asset_data['quantity'] * asset_data['purchase_price']
-                current = asset_data['quantity'] * asset_data['current_price']
-                gain = current - invested
-                gain_percent = (gain / invested) * 100 if invested > 0 else 0
-                
-                change_class = "metric-change-positive" if gain >= 0 else "metric-change-negative"
-                st.markdown(f"**Gewinn/Verlust:** <span class='{change_class}'>{gain:,.2f} {asset_data['currency']} ({gain_percent:+.2f}%)</span>", unsafe_allow_html=True)
-                
-                # Bearbeiten und Löschen Buttons
-                col3, col4 = st.columns(2)
-                
-                with col3:
-                    if st.button(f"Bearbeiten", key=f"edit_{asset_name}"):
+        result = st.session_state.get("rebalance_plan")
+        if result is not None and result[0] == group_label:
+            plan = result[1]
+            if plan.unreachable:
+                st.warning(f"Ohne kaufbares Asset, Gewicht auf die übrigen verteilt: {', '.join(plan.unreachable)}")
+            
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Trades", len(plan))
+            col2.metric("Umschlag", f"{base} {plan.turnover:,.2f}")
+            col3.metric("Gebühren", f"{base} {plan.fees:,.2f}")
+            col4.metric("Verbleibende Liquidität", f"{base} {plan.cash:,.2f}")
+            
+            if len(plan):
+                kinds = {kind: label for label, kind in TRANSACTION_KINDS.items()}
+                st.dataframe(
+                    plan.trades.assign(kind=plan.trades["kind"].map(kinds)).rename(columns={
+                        "symbol": "Symbol", "kind": "Aktion", "quantity": "Menge", "price": "Kurs",
+                        "currency": "Währung", "value": f"Betrag ({base})", "fee": f"Gebühr ({base})",
+                    }).rename_axis("Asset"),
+                    column_config={
+                        "Menge": st.column_config.NumberColumn(format="%.4f"),
+                        "Kurs": st.column_config.NumberColumn(format="%.2f"),
+                        f"Betrag ({base})": st.column_config.NumberColumn(format="%.2f"),
+                        f"Gebühr ({base})": st.column_config.NumberColumn(format="%.2f"),
+                    },
+                    use_container_width=True
+                )
+            else:
+                st.success("Das Portfolio entspricht bereits den Zielgewichten.")
+            
+            st.dataframe(
+                plan.groups.rename(columns={
+                    "current_weight": "Aktuell", "target_weight": "Ziel", "new_weight": "Nach Umschichtung",
+                }).rename_axis(group_label),
+                column_config={
+                    col: st.column_config.NumberColumn(format="percent")
+                    for col in ("Aktuell", "Ziel", "Nach Umschichtung")
+                },
+                use_container_width=True
+            )
+    else:
+        st.info("❌ Noch keine Assets vorhanden.")
+
+# Einstellungen Seite
+elif page == "Einstellungen":
+    st.header("🔧 Einstellungen")
+    
+    st.subheader("Basiswährung")
+    base_currency = st.selectbox(
+        "Alle Summen und Werte im Dashboard werden in diese Währung umgerechnet",
+        CURRENCIES,
+        index=CURRENCIES.index(engine.base_currency) if engine.base_currency in CURRENCIES else 0
+    )
+    if base_currency != engine.base_currency:
+        engine.set_base_currency(base_currency)
+        st.success(f"Basiswährung auf {base_currency} gesetzt.")
+    
+    rates = fx_engine.table(engine.base_currency)
+    st.caption(f"Wechselkurse: Quelle {rates.source}, geladen {datetime.fromtimestamp(rates.fetched_at).strftime('%d.%m.%Y %H:%M')}")
+    if fx_engine.last_error:
+        st.warning(f"Wechselkurse konnten nicht aktualisiert werden: {fx_engine.last_error}")
+    st.dataframe(
+        pd.DataFrame({'Kurs': [rates.rate(c) for c in CURRENCIES]}, index=CURRENCIES),
+        column_config={'Kurs': st.column_config.NumberColumn(f"1 Einheit in {rates.base}", format="%.4f")}
+    )
+    if st.button("Wechselkurse neu laden"):
+        fx_engine.refresh(force=True)
+        st.rerun()
+    
+    st.subheader("Historische Kurse")
+    bars = engine.bars
+    st.caption(f"{len(bars):,} Tageskurse für {len(bars.symbols)} Symbole ({bars.nbytes / 1024 / 1024:.1f} MB im Speicher)")
+    with st.form("backfill_form"):
+        years = st.number_input("Zeitraum in Jahren", min_value=1, max_value=20, value=DEFAULT_DAYS // 365)
+        archive = st.file_uploader("Kursarchiv (optional, Spalten symbol, date, open, high, low, close)", type=["csv", "parquet"])
+        if st.form_submit_button("Historische Kurse laden"):
+            with st.spinner("Lade Tageskurse..."):
+                try:
+                    result = engine.backfill_history(days=int(years) * 365, archive=archive)
+                except (ValueError, ImportError) as e:
+                    st.error(f"Fehler beim Laden der Tageskurse: {str(e)}")
+                else:
+                    st.success(f"✅ {result.added:,} neue Tageskurse geladen.")
+                    if result.errors:
+                        st.warning(f"Für {len(result.errors)} Symbole konnten keine Tageskurse abgerufen werden: {', '.join(sorted(result.errors))}")
+    
+    st.subheader("Diagnose")
+    st.caption("Laufzeiten und Zähler dieses Server-Prozesses seit dem Start oder dem letzten Zurücksetzen")
+    snapshot = METRICS.snapshot()
+    if snapshot['spans']:
+        st.dataframe(
+            pd.DataFrame({
+                'Anzahl': [s['count'] for s in snapshot['spans'].values()],
+                'Ø ms': [s['mean_s'] * 1000 for s in snapshot['spans'].values()],
+                'Max ms': [s['max_s'] * 1000 for s in snapshot['spans'].values()],
+                'Letzte ms': [s['last_s'] * 1000 for s in snapshot['spans'].values()],
+            }, index=pd.Index(list(snapshot['spans']), name='Messstelle')).sort_index(),
+            column_config={c: st.column_config.NumberColumn(c, format="%.1f") for c in ['Ø ms', 'Max ms', 'Letzte ms']}
+        )
+    else:
+        st.info("Noch keine Messungen vorhanden.")
+    
+    counters = snapshot['counters'] + snapshot['gauges']
+    if counters:
+        st.dataframe(pd.DataFrame({
+            'Zähler': [c['name'] for c in counters],
+            'Labels': [", ".join(f"{k}={v}" for k, v in c['labels'].items()) for c in counters],
+            'Wert': [c['value'] for c in counters],
+        }), hide_index=True)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("📥 Prometheus", data=METRICS.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+    with col2:
+        st.download_button("📥 JSON", data=METRICS.to_json(), file_name="metrics.json", mime="application/json")
+    with col3:
+        if st.button("Zurücksetzen"):
+            METRICS.reset()
+            st.rerun()
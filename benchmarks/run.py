@@ -0,0 +1,243 @@
+"""Benchmarks für Import, Kursaktualisierung, Export, Dashboard und Rebalancing ohne Streamlit-Server
+
+Gemessen wird die PortfolioEngine direkt, Kurse kommen vom lokalen
+Mock-Server. Ergebnisse (Zeit und Spitzenspeicher) landen als JSON.
+
+    python benchmarks/run.py                          # schreibt benchmarks/baseline.json
+    python benchmarks/run.py --sizes 10 1000 --output /tmp/neu.json --compare benchmarks/baseline.json
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent
+sys.path.insert(0, str(ROOT))
+
+DEFAULT_SIZES = (10, 1_000, 100_000)
+DEFAULT_OUTPUT = HERE / "baseline.json"
+# Relative Verschlechterung, ab der --compare einen Fehler meldet
+DEFAULT_TOLERANCE = 0.25
+
+CRYPTO_SYMBOLS = ["BTC-USD", "ETH-USD", "SOL-USD", "ADA-USD", "XRP-USD", "DOGE-USD", "DOT-USD", "LTC-USD"]
+TYPES = ["Aktie", "ETF", "Fonds", "Anleihe"]
+CURRENCIES = ["CHF", "USD", "EUR", "GBP"]
+SECTORS = ["Technology", "Healthcare", "Financial", "Consumer", "Energy", "Industrial"]
+
+
+def generate_portfolio(n, seed=0):
+    """n Assets, jedes zehnte ist eine Kryptowährung (Kurs vom Mock-Server)"""
+    from portfolio_store import PortfolioStore
+
+    rng = np.random.default_rng(seed)
+    crypto = np.arange(n) % 10 == 0
+    symbols = np.where(crypto, np.array(CRYPTO_SYMBOLS)[np.arange(n) % len(CRYPTO_SYMBOLS)],
+                       np.char.add("STK", np.arange(n).astype(str)))
+    price = rng.uniform(1, 500, n).round(2)
+    frame = pd.DataFrame({
+        "symbol": symbols,
+        "quantity": rng.integers(1, 100, n).astype(np.float64),
+        "purchase_price": price,
+        "purchase_date": "2024-01-15",
+        "current_price": price,
+        "type": np.where(crypto, "Krypto", np.array(TYPES)[rng.integers(0, len(TYPES), n)]),
+        "currency": np.where(crypto, "USD", np.array(CURRENCIES)[rng.integers(0, len(CURRENCIES), n)]),
+        "sector": np.array(SECTORS)[rng.integers(0, len(SECTORS), n)],
+        "stale": False,
+    }, index=pd.Index([f"Asset {i} ({s})" for i, s in enumerate(symbols)], name="name"))
+    return PortfolioStore.from_frame(frame)
+
+
+def generate_csv(n, seed=0):
+    """n Transaktionen im Standardformat über höchstens 500 verschiedene Ticker"""
+    rng = np.random.default_rng(seed)
+    tickers = np.char.add(f"T{seed}_", (np.arange(n) % 500).astype(str))
+    frame = pd.DataFrame({
+        "Ticker": tickers,
+        "Quantity": rng.integers(1, 50, n),
+        "Price": rng.uniform(1, 500, n).round(2),
+        "Type": np.array(TYPES)[rng.integers(0, len(TYPES), n)],
+        "Currency": np.array(CURRENCIES)[rng.integers(0, len(CURRENCIES), n)],
+        "Date": "2024-02-01",
+    })
+    return frame.to_csv(index=False).encode("utf-8")
+
+
+def generate_archive(path, n_symbols, days=5 * 365, seed=0):
+    """Kursarchiv als CSV: n_symbols Symbole mit je days Tageskursen bis gestern"""
+    from ohlc import today
+
+    rng = np.random.default_rng(seed)
+    dates = pd.to_datetime(np.arange(today() - days, today()) * 86400, unit="s").strftime("%Y-%m-%d").to_numpy()
+    close = (100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n_symbols, days)), axis=1))).ravel()
+    pd.DataFrame({
+        "symbol": np.repeat(np.char.add("STK", np.arange(n_symbols).astype(str)), days),
+        "date": np.tile(dates, n_symbols),
+        "open": close,
+        "high": close * 1.01,
+        "low": close * 0.99,
+        "close": close,
+    }).to_csv(path, index=False)
+    return path
+
+
+def measure(func, setup=None, repeat=3):
+    """Beste und mittlere Laufzeit über repeat Läufe, danach ein Lauf mit tracemalloc"""
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        gc.collect()
+        started = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - started)
+    args = setup() if setup else ()
+    gc.collect()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "best_s": min(timings),
+        "median_s": statistics.median(timings),
+        "peak_mb": peak / 1024 / 1024,
+    }
+
+
+def open_engine(database_path, quote_url):
+    """PortfolioEngine mit eigener Datenbank und Mock-Kursserver, ohne Kurs-Cache"""
+    # Vor dem Import setzen, portfolio_engine liest die Konfiguration beim Laden
+    os.environ["COINGECKO_BASE_URL"] = quote_url
+    os.environ.setdefault("FX_PROVIDER", "static")
+    os.environ["QUOTE_CACHE_TTL"] = "0"
+    from portfolio_engine import PortfolioEngine
+
+    return PortfolioEngine.open(database_path)
+
+
+def run_benchmarks(sizes, repeat=3, latency=0.02):
+    from mock_quote_server import MockQuoteServer
+    from ohlc import DEFAULT_DAYS, DailyBars, backfill, today
+    from portfolio_engine import PortfolioEngine
+    from storage import PortfolioDatabase
+    from charts import portfolio_figures
+    from valuation import portfolio_metrics
+
+    server = MockQuoteServer(("127.0.0.1", 0), latency=latency, seed=1)
+    server.start_background()
+    # Datenbanken und Archive nur für diesen Lauf, danach samt Verzeichnis gelöscht
+    with tempfile.TemporaryDirectory(prefix="portfolio-bench-") as workdir:
+        engine = open_engine(os.path.join(workdir, "bench.db"), server.base_url)
+        rates = engine.rates()
+        results = {}
+
+        for n in sizes:
+            case = results[str(n)] = {}
+            print(f"== {n} Assets/Transaktionen", flush=True)
+
+            # CSV-Import: jeder Lauf in eine leere Datenbank, sonst greift die Duplikaterkennung
+            runs = iter(range(1_000_000))
+
+            def import_setup():
+                database = PortfolioDatabase(os.path.join(workdir, f"import-{n}-{next(runs)}.db"))
+                target = PortfolioEngine(database, engine.live_provider, engine.fx_engine)
+                return target, io.BytesIO(generate_csv(n))
+
+            case["process_csv"] = measure(lambda target, data: target.import_csv(data), import_setup, repeat)
+
+            # Ab hier ein generiertes Portfolio mit n Assets
+            store = generate_portfolio(n)
+            engine.store = store
+
+            def refresh_setup():
+                engine.live_provider.cache.clear()
+                return ()
+
+            case["update_prices"] = measure(engine.refresh_prices, refresh_setup, repeat)
+            # Ohne Cache der Engine, sonst misst nur der erste Lauf die Serialisierung
+            case["export_portfolio"] = measure(lambda: engine.export_to(io.BytesIO(), "csv"), repeat=repeat)
+
+            def dashboard_setup():
+                # Ein neuer Kurs verwirft Frame, Kennzahlen und Grafiken wie nach einer Aktualisierung
+                store.apply_quotes({CRYPTO_SYMBOLS[0]: float(np.random.uniform(1, 500))})
+                return ()
+
+            def dashboard():
+                portfolio_metrics(store, rates)
+                portfolio_figures(store, rates, None)
+
+            case["dashboard"] = measure(dashboard, dashboard_setup, repeat)
+            case["rebalance"] = measure(
+                lambda: engine.rebalance({sector: 1.0 for sector in SECTORS}, "sector", lot_size=1, fee_fixed=1.0),
+                repeat=repeat
+            )
+
+            # Tageskurse aus einem Archiv, höchstens 500 Symbole über 5 Jahre
+            n_symbols = min(n, 500)
+            archive = generate_archive(os.path.join(workdir, f"archive-{n_symbols}.csv"), n_symbols)
+            symbols = [f"STK{i}" for i in range(n_symbols)]
+            case["backfill_archive"] = measure(
+                lambda bars: backfill(bars, symbols, today() - DEFAULT_DAYS, today() - 1, archive=archive),
+                lambda: (DailyBars(),), repeat
+            )
+            for name, values in case.items():
+                print(f"   {name:18s} {values['best_s'] * 1000:10.1f} ms  {values['peak_mb']:8.1f} MB", flush=True)
+
+        engine.database.close()
+
+    server.shutdown()
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "mock_latency_s": latency,
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Liste der Fälle, die um mehr als tolerance langsamer geworden sind"""
+    regressions = []
+    for size, cases in current["results"].items():
+        for name, values in cases.items():
+            reference = baseline.get("results", {}).get(size, {}).get(name)
+            if reference and values["best_s"] > reference["best_s"] * (1 + tolerance):
+                regressions.append((size, name, reference["best_s"], values["best_s"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02, help="Antwortzeit des Mock-Servers in Sekunden")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", type=Path, help="Baseline, gegen die verglichen wird")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.sizes, repeat=args.repeat, latency=args.latency)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Ergebnisse gespeichert in {args.output}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.tolerance)
+        for size, name, before, after in regressions:
+            print(f"LANGSAMER: {name} ({size}) {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Plotly-Grafiken mit begrenzter Grösse, zwischengespeichert pro Datenversion"""
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from timeseries import DAY
+from valuation import CURRENT_VALUE, GAIN, INVESTED, percent_change, portfolio_metrics
+
+# Höchstzahl einzelner Segmente/Balken, der Rest wird unter OTHER zusammengefasst
+TOP_N = 12
+OTHER = "Andere"
+# Höchstzahl Punkte pro Linie im Preisverlauf
+MAX_POINTS = 2000
+
+# Gruppierung im Dashboard: Beschriftung -> Spalte (None = einzelne Assets)
+GROUPINGS = {"Asset": None, "Typ": "type", "Sektor": "sector", "Währung": "currency"}
+
+LAYOUT = dict(
+    paper_bgcolor='rgba(0,0,0,0)',
+    plot_bgcolor='rgba(0,0,0,0)',
+    font=dict(size=16, color='#FFFFFF'),
+)
+
+
+def group_totals(metrics, group_by=None):
+    """Investiert, Wert und Gewinn pro Asset oder pro Gruppe, absteigend nach Wert"""
+    columns = [INVESTED, CURRENT_VALUE, GAIN]
+    if group_by is None:
+        totals = metrics[columns]
+    else:
+        totals = metrics.groupby(metrics[group_by].astype(object).fillna("Nicht angegeben"), sort=False)[columns].sum()
+    return totals.sort_values(CURRENT_VALUE, ascending=False)
+
+
+def top_n_with_other(values, top_n=TOP_N):
+    """Die top_n grössten Werte, der Rest summiert als OTHER"""
+    values = values.sort_values(ascending=False)
+    if len(values) <= top_n:
+        return values
+    head = values.iloc[:top_n - 1]
+    return pd.concat([head, pd.Series([values.iloc[top_n - 1:].sum()], index=[OTHER])])
+
+
+def allocation_figure(metrics, group_by=None, top_n=TOP_N):
+    values = top_n_with_other(group_totals(metrics, group_by)[CURRENT_VALUE], top_n)
+    fig = go.Figure(go.Pie(
+        labels=values.index.astype(str),
+        values=values.to_numpy(),
+        marker=dict(colors=px.colors.qualitative.Pastel),
+        sort=False
+    ))
+    fig.update_layout(
+        **LAYOUT,
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5, font=dict(size=14))
+    )
+    return fig
+
+
+def performance_figure(metrics, group_by=None, top_n=TOP_N):
+    """Gewinn/Verlust in % pro Asset oder Gruppe, bei vielen nur die besten und schlechtesten"""
+    totals = group_totals(metrics, group_by)
+    gain_percent = pd.Series(
+        percent_change(totals[GAIN].to_numpy(), totals[INVESTED].to_numpy()),
+        index=totals.index.astype(str)
+    ).sort_values(ascending=False)
+    if len(gain_percent) > top_n:
+        gain_percent = pd.concat([gain_percent.iloc[:top_n // 2], gain_percent.iloc[-(top_n - top_n // 2):]])
+    fig = go.Figure(go.Bar(
+        x=gain_percent.index,
+        y=gain_percent.to_numpy(),
+        marker=dict(color=gain_percent.to_numpy(), colorscale=['#E22134', '#1DB954'], cmid=0)
+    ))
+    fig.update_layout(
+        **LAYOUT,
+        title="Gewinn/Verlust in %",
+        xaxis_title="Asset" if group_by is None else "Gruppe",
+        yaxis_title="Gewinn/Verlust %",
+        showlegend=False
+    )
+    return fig
+
+
+def downsample(x, y, max_points=MAX_POINTS):
+    """Gleichmässig ausgedünnte Punkte, erster und letzter Punkt bleiben erhalten"""
+    if len(x) <= max_points:
+        return x, y
+    keep = np.unique(np.linspace(0, len(x) - 1, max_points).astype(np.int64))
+    return x[keep], y[keep]
+
+
+def line_figure(series_by_name, title=None, yaxis_title=None, max_points=MAX_POINTS):
+    """Linien als WebGL-Traces (Scattergl), jede auf max_points begrenzt"""
+    fig = go.Figure()
+    for name, (x, y) in series_by_name.items():
+        x, y = downsample(np.asarray(x), np.asarray(y), max_points)
+        fig.add_trace(go.Scattergl(x=x, y=y, mode="lines", name=str(name)))
+    fig.update_layout(**LAYOUT, title=title, yaxis_title=yaxis_title, showlegend=len(series_by_name) > 1)
+    return fig
+
+
+def history_figure(history, names, max_points=MAX_POINTS, bars=None, symbols=None):
+    """Preisverlauf ausgewählter Assets aus dem PriceHistory
+
+    Mit bars (ohlc.DailyBars) und dem Symbol pro Asset werden die geladenen
+    Tagesschlusskurse vor dem ersten eigenen Punkt vorangestellt.
+    """
+    symbols = list(symbols) if symbols is not None else [None] * len(names)
+    series = {}
+    for name, symbol in zip(names, symbols):
+        prices = history.get(name)
+        ts, values = prices.to_arrays() if prices is not None else (np.empty(0), np.empty(0))
+        closes = bars.get(symbol) if bars is not None and symbol is not None else None
+        if closes is not None and len(closes[0]):
+            bar_ts = closes[0].astype(np.float64) * DAY
+            before = bar_ts < ts[0] if len(ts) else slice(None)
+            ts, values = np.concatenate([bar_ts[before], ts]), np.concatenate([closes[1][before], values])
+        if len(ts):
+            series[name] = (pd.to_datetime(ts, unit="s"), values)
+    return line_figure(series, title="Preisverlauf", yaxis_title="Preis", max_points=max_points)
+
+
+def portfolio_figures(store, rates, group_by=None):
+    """(Verteilung, Performance) eines PortfolioStore, einmal pro Version, Kurstabelle und Gruppierung"""
+    return store.cached(("figures", group_by), _build_figures, rates, group_by)
+
+
+def _build_figures(store, rates, group_by):
+    metrics, _ = portfolio_metrics(store, rates)
+    return allocation_figure(metrics, group_by), performance_figure(metrics, group_by)
+
+
+def portfolio_history_figure(store, history, names, bars=None):
+    """Preisverlauf, neu gebaut nur bei neuer Verlaufs- oder Tageskursversion oder anderer Auswahl"""
+    return store.cached("history_figure", _build_history_figure, history, history.version, tuple(names),
+                        bars, bars.version if bars is not None else None)
+
+
+def _build_history_figure(store, history, version, names, bars, bars_version):
+    symbols = [store[name]['symbol'] for name in names] if bars is not None else None
+    return history_figure(history, names, bars=bars, symbols=symbols)
@@ -0,0 +1,362 @@
+"""Blockweiser CSV-Import für Broker-Exporte, vektorisiert normalisiert zu einer Zeile pro Kauf"""
+import csv
+from datetime import datetime
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# Zeilen pro Block beim Einlesen
+CHUNK_SIZE = 50_000
+
+# Bytes, die zur Erkennung von Trennzeichen und Format gelesen werden
+SNIFF_BYTES = 64 * 1024
+
+# Normalisierte Spalten einer Transaktion
+TRANSACTION_COLUMNS = ["name", "symbol", "quantity", "price", "type", "currency", "date", "sector"]
+
+# Spalten der importierten Käufe, asset ist der Schlüssel im PortfolioStore ("Name (Symbol)")
+ROW_COLUMNS = ["asset", "symbol", "quantity", "price", "date", "type", "currency", "sector"]
+
+
+class ImportResult:
+    """Importierte Käufe (eine Zeile pro gültiger CSV-Zeile) und Zähler eines Imports
+
+    fingerprints enthält die Fingerprints aller neu verarbeiteten Zeilen, auch
+    der übersprungenen und vom Format ausgefilterten, damit ein erneuter Import
+    nur noch neue Zeilen verarbeitet. Sie werden erst nach erfolgreichem
+    Speichern in die Menge der bekannten übernommen.
+    """
+
+    def __init__(self, rows, transactions, skipped, format_name, duplicates=0, fingerprints=None):
+        self.rows = rows
+        self.transactions = transactions
+        self.skipped = skipped
+        self.format_name = format_name
+        self.duplicates = duplicates
+        self.fingerprints = np.empty(0, dtype=np.uint64) if fingerprints is None else fingerprints
+
+
+class FingerprintSet:
+    """Sortierte Menge bekannter Zeilen-Fingerprints (8 Byte pro Zeile, exakt statt Bloom-Filter)"""
+
+    def __init__(self, fingerprints=()):
+        self._values = np.unique(np.asarray(fingerprints, dtype=np.uint64))
+
+    def __len__(self):
+        return len(self._values)
+
+    def contains(self, fingerprints):
+        fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+        if not len(self._values):
+            return np.zeros(len(fingerprints), dtype=bool)
+        positions = np.searchsorted(self._values, fingerprints)
+        found = self._values[np.minimum(positions, len(self._values) - 1)]
+        return found == fingerprints
+
+    def add(self, fingerprints):
+        self._values = np.union1d(self._values, np.asarray(fingerprints, dtype=np.uint64))
+
+    def to_array(self):
+        return self._values
+
+
+def row_fingerprints(chunk, occurrences):
+    """Inhalts-Hash pro Rohzeile, identische Zeilen werden über ihre Vorkommensnummer unterschieden
+
+    occurrences zählt die Hashes über alle Blöcke einer Datei und wird fortgeschrieben.
+    So ergibt derselbe Export beim erneuten Hochladen dieselben Fingerprints.
+    """
+    # Zahlen einheitlich als float64 hashen, die Typ-Erkennung kann pro Block int oder float liefern
+    numeric = chunk.select_dtypes("number").columns
+    if len(numeric):
+        chunk = chunk.astype({column: np.float64 for column in numeric})
+    content = pd.Series(pd.util.hash_pandas_object(chunk, index=False).to_numpy())
+    earlier = occurrences.reindex(content.to_numpy(), fill_value=0).to_numpy()
+    occurrence = content.groupby(content, sort=False).cumcount().to_numpy() + earlier
+    fingerprints = pd.util.hash_pandas_object(
+        pd.DataFrame({"content": content.to_numpy(), "occurrence": occurrence.astype(np.uint64)}),
+        index=False
+    ).to_numpy()
+    counts = content.value_counts(sort=False)
+    occurrences = counts.add(occurrences, fill_value=0) if len(occurrences) else counts
+    return pd.Series(fingerprints, index=chunk.index), occurrences
+
+
+def sniff_delimiter(sample):
+    """Erkenne ';' oder ',' als Trennzeichen anhand der ersten Zeilen"""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=";,").delimiter
+    except csv.Error:
+        header = sample.splitlines()[0] if sample else ""
+        return ";" if header.count(";") > header.count(",") else ","
+
+
+def _today():
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+def _column(chunk, name, default):
+    if name is not None and name in chunk.columns:
+        if default is None:
+            return chunk[name]
+        return chunk[name].where(chunk[name].notna(), default)
+    return pd.Series(default, index=chunk.index, dtype=object)
+
+
+class TypeClassifier:
+    """Ordnet Asset-Namen per vorkompilierten Regeln vektorisiert einem Typ zu"""
+
+    def __init__(self, rules, default="Aktie"):
+        # rules: [(Liste von Stichworten, Typ)], die erste passende Regel gewinnt
+        self.patterns = [
+            re.compile("|".join(re.escape(word) for word in words), re.IGNORECASE)
+            for words, _ in rules
+        ]
+        self.types = [asset_type for _, asset_type in rules]
+        self.default = default
+
+    def classify(self, names):
+        names = names.fillna("").astype(str)
+        return np.select(
+            [names.str.contains(pattern) for pattern in self.patterns],
+            self.types,
+            default=self.default
+        )
+
+
+class ImportFormat:
+    """Broker-Format mit Kopfzeilen-Signatur und vektorisierter Umwandlung
+
+    Ein neues Format wird als Unterklasse angelegt und mit register_format()
+    registriert. Die Erkennung vergleicht nur die Kopfzeile mit `signature`.
+    """
+
+    name = None
+    signature = frozenset()
+    priority = 0
+    # Mehrdeutige Daten wie 01.02.2024 als Tag.Monat lesen
+    dayfirst = True
+
+    def matches(self, columns):
+        return self.signature <= set(columns)
+
+    def transform(self, chunk):
+        """Wandle einen Block der Datei in normalisierte Transaktionen um"""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+
+class ColumnMappedFormat(ImportFormat):
+    """Format, dessen Felder direkt aus benannten Spalten kommen"""
+
+    # Feld -> (Spaltenname, Standardwert)
+    columns = {}
+
+    def transform(self, chunk):
+        frame = pd.DataFrame({
+            field: _column(chunk, *self.columns.get(field, (None, None)))
+            for field in TRANSACTION_COLUMNS
+        })
+        frame["date"] = frame["date"].fillna(_today())
+        frame["quantity"] = pd.to_numeric(frame["quantity"], errors="coerce")
+        frame["price"] = pd.to_numeric(frame["price"], errors="coerce")
+        return frame
+
+
+class StandardFormat(ColumnMappedFormat):
+    name = "standard"
+    signature = frozenset({"Ticker", "Quantity", "Price"})
+    priority = 10
+    columns = {
+        "name": ("Ticker", None),
+        "symbol": ("Ticker", None),
+        "quantity": ("Quantity", None),
+        "price": ("Price", None),
+        "type": ("Type", "Aktie"),
+        "currency": ("Currency", "USD"),
+        "date": ("Date", None),
+        "sector": ("Sector", "Allgemein"),
+    }
+
+
+class YuhFormat(ImportFormat):
+    """Yuh-Export: nur ausgeführte Aufträge, Menge und Name stecken in ACTIVITY NAME"""
+
+    name = "yuh"
+    signature = frozenset({"ACTIVITY TYPE", "ACTIVITY NAME"})
+    priority = 10
+    quantity_pattern = re.compile(r'([\d,\.]+)x')
+    name_pattern = re.compile(r'x\s+(.+)')
+    classifier = TypeClassifier([
+        (["VANGUARD", "ISHARES", "ETF", "FONDS"], "ETF"),
+        (["XBT", "XRP", "XLM", "LNK", "BTC", "ETH"], "Krypto"),
+        (["GOLD", "SILVER"], "Rohstoffe"),
+    ])
+
+    def transform(self, chunk):
+        chunk = chunk[chunk["ACTIVITY TYPE"] == "INVEST_ORDER_EXECUTED"]
+        activity = chunk["ACTIVITY NAME"].astype(str)
+        quantity = activity.str.extract(self.quantity_pattern, expand=False).str.replace(",", "", regex=False)
+        name = activity.str.extract(self.name_pattern, expand=False).str.strip()
+
+        return pd.DataFrame({
+            "name": name,
+            "symbol": chunk["ASSET"].where(chunk["ASSET"].notna(), name) if "ASSET" in chunk.columns else name,
+            "quantity": pd.to_numeric(quantity, errors="coerce"),
+            "price": pd.to_numeric(_column(chunk, "PRICE PER UNIT", 0), errors="coerce"),
+            "type": self.classifier.classify(name),
+            "currency": _column(chunk, "DEBIT CURRENCY", "CHF"),
+            "date": _column(chunk, "DATE", _today()),
+            "sector": "Allgemein",
+        }, index=chunk.index)
+
+
+class PositionalFormat(ImportFormat):
+    """Einfaches Format: Name, Symbol, Menge, Kaufpreis, Typ, Währung, Datum, Sektor"""
+
+    name = "positional"
+    priority = -1
+
+    def transform(self, chunk):
+        defaults = [None, None, 0, 0, "Aktie", "USD", _today(), "Allgemein"]
+        columns = {}
+        for position, (field, default) in enumerate(zip(TRANSACTION_COLUMNS, defaults)):
+            if position < chunk.shape[1]:
+                values = chunk.iloc[:, position]
+                columns[field] = values if default is None else values.where(values.notna(), default)
+            else:
+                columns[field] = pd.Series(default, index=chunk.index, dtype=object)
+        if columns["name"].isna().all():
+            columns["name"] = pd.Series("Unbekannt", index=chunk.index)
+        if chunk.shape[1] < 2:
+            columns["symbol"] = columns["name"]
+        frame = pd.DataFrame(columns)
+        frame["quantity"] = pd.to_numeric(frame["quantity"], errors="coerce")
+        frame["price"] = pd.to_numeric(frame["price"], errors="coerce")
+        return frame
+
+
+# Registrierte Formate, nach Priorität sortiert
+FORMATS = []
+
+
+def register_format(import_format):
+    """Nimm ein Format in die Erkennung auf"""
+    FORMATS.append(import_format)
+    FORMATS.sort(key=lambda f: -f.priority)
+    return import_format
+
+
+def get_format(name):
+    for import_format in FORMATS:
+        if import_format.name == name:
+            return import_format
+    raise KeyError(name)
+
+
+def detect_format(columns):
+    """Bestimme das Format einmal pro Datei anhand der Kopfzeile"""
+    for import_format in FORMATS:
+        if import_format.matches(columns):
+            return import_format
+    raise ValueError("Unbekanntes CSV-Format")
+
+
+register_format(StandardFormat())
+register_format(YuhFormat())
+register_format(PositionalFormat())
+
+
+def measure_throughput(import_format, chunk, repeat=5):
+    """Transaktionen pro Sekunde, die ein Format aus einem Block erzeugt"""
+    best = float("inf")
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(import_format.transform(chunk))
+        best = min(best, time.perf_counter() - started)
+    return rows / best if best > 0 else float("inf")
+
+
+def normalize_dates(dates, dayfirst=True):
+    """Daten als ISO-Text (YYYY-MM-DD), nicht lesbare als NaN
+
+    Jedes unterschiedliche Datum wird nur einmal umgewandelt.
+    """
+    codes, uniques = pd.factorize(dates.astype(str))
+    if not len(uniques):
+        return pd.Series(np.nan, index=dates.index, dtype=object)
+    uniques = pd.Series(uniques)
+    # ISO zuerst (nur der Datumsteil), dayfirst würde 2024-01-05 sonst als 1. Mai lesen
+    iso_like = uniques.str.match(r"\d{4}-\d{2}-\d{2}")
+    parsed = pd.to_datetime(uniques.str.slice(0, 10).where(iso_like), format="%Y-%m-%d", errors="coerce")
+    if (~iso_like).any():
+        other = pd.to_datetime(uniques[~iso_like], format="mixed", dayfirst=dayfirst, errors="coerce", utc=True)
+        parsed[~iso_like] = other.dt.tz_localize(None)
+    iso = parsed.dt.strftime('%Y-%m-%d').to_numpy(dtype=object)
+    return pd.Series(iso[codes], index=dates.index, dtype=object).where(dates.notna() & (codes >= 0))
+
+
+def purchase_rows(transactions):
+    """Normalisierte Transaktionen als Käufe mit Asset-Schlüssel in den Spalten ROW_COLUMNS"""
+    asset = transactions["name"].astype(str) + " (" + transactions["symbol"].astype(str) + ")"
+    return transactions.assign(asset=asset.to_numpy(), date=transactions["date"].fillna(_today()).astype(str))[ROW_COLUMNS]
+
+
+def import_csv(fileobj, chunksize=CHUNK_SIZE, seen=None):
+    """Lies eine CSV-Datei blockweise und gib jede gültige Zeile als Kauf zurück
+
+    Zeilen werden nicht pro Asset zusammengefasst, damit Lots, Kaufdaten und
+    realisierte Gewinne im Journal stimmen. Mit einer FingerprintSet `seen`
+    werden bereits importierte Zeilen übersprungen.
+    """
+    head = fileobj.read(SNIFF_BYTES)
+    if isinstance(head, bytes):
+        head = head.decode("utf-8-sig", errors="ignore")
+    fileobj.seek(0)
+    delimiter = sniff_delimiter(head)
+
+    reader = pd.read_csv(
+        fileobj, sep=delimiter, engine="c", chunksize=chunksize,
+        encoding="utf-8-sig", skipinitialspace=True
+    )
+
+    parts = []
+    import_format = None
+    transactions = 0
+    skipped = 0
+    duplicates = 0
+    occurrences = pd.Series(dtype=np.int64)
+    new_fingerprints = []
+    for chunk in reader:
+        if import_format is None:
+            import_format = detect_format(chunk.columns)
+        if seen is not None:
+            fingerprints, occurrences = row_fingerprints(chunk, occurrences)
+            known = seen.contains(fingerprints.to_numpy())
+            duplicates += int(known.sum())
+            chunk = chunk[~known]
+            new_fingerprints.append(fingerprints.to_numpy()[~known])
+        frame = import_format.transform(chunk)
+        # FIFO sortiert nach Datum, deshalb einheitlich als ISO-Text speichern
+        frame["date"] = normalize_dates(frame["date"], import_format.dayfirst)
+        # Nur Käufe mit positiver Menge und lesbarem Datum, sonst stimmen die Lots nicht
+        valid = (frame["quantity"] > 0) & frame["price"].notna() & frame["name"].notna() & frame["date"].notna()
+        skipped += int((~valid).sum())
+        frame = frame[valid]
+        transactions += len(frame)
+        if frame.empty:
+            continue
+        parts.append(purchase_rows(frame))
+
+    rows = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=ROW_COLUMNS)
+    return ImportResult(
+        rows, transactions, skipped, import_format.name if import_format else None,
+        duplicates=duplicates,
+        fingerprints=np.concatenate(new_fingerprints) if new_fingerprints else None
+    )
+
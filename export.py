@@ -0,0 +1,168 @@
+"""Export von Portfolio, Transaktionen und Preisverlauf als CSV, Parquet oder Excel
+
+Die Tabellen werden erst beim Schreiben aufgebaut und blockweise in ein
+Dateiobjekt geschrieben, damit auch große Exporte nie als Ganzes als Text
+im Speicher liegen. Mehrere Tabellen landen bei CSV und Parquet als je eine
+Datei in einem ZIP-Archiv, bei Excel als je ein Tabellenblatt.
+"""
+from collections import namedtuple
+import importlib.util
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from ledger import Transaction
+
+# Zeilen pro Block beim Schreiben (CSV-Abschnitt, Parquet-Row-Group, Excel-Schreibvorgang)
+CHUNK_ROWS = 50_000
+# Excel erlaubt 1'048'576 Zeilen pro Blatt inklusive Kopfzeile
+EXCEL_MAX_ROWS = 1_048_575
+
+ExportFormat = namedtuple("ExportFormat", ["label", "extension", "mime"])
+
+FORMATS = {
+    "csv": ExportFormat("CSV", "csv", "text/csv"),
+    "parquet": ExportFormat("Parquet", "parquet", "application/vnd.apache.parquet"),
+    "xlsx": ExportFormat("Excel", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+# Optionale Pakete je Format, eines davon genügt
+REQUIRES = {"parquet": ("pyarrow",), "xlsx": ("openpyxl", "xlsxwriter")}
+
+# Exportierbare Tabellen mit Anzeigenamen
+TABLES = {
+    "portfolio": "Portfolio",
+    "transactions": "Transaktionen",
+    "price_history": "Preisverlauf",
+}
+
+
+def available_formats():
+    """Formate, deren optionale Abhängigkeit installiert ist"""
+    return [fmt for fmt in FORMATS
+            if not REQUIRES.get(fmt) or any(importlib.util.find_spec(pkg) for pkg in REQUIRES[fmt])]
+
+
+def portfolio_frame(store):
+    """Aktuelle Positionen, der Asset-Name als erste Spalte"""
+    return store.frame().rename_axis("name").reset_index()
+
+
+def transactions_frame(ledger):
+    """Alle Transaktionen des Journals in Erfassungsreihenfolge"""
+    rows = [tx for position in ledger.positions.values() for tx in position.transactions]
+    rows.sort(key=lambda tx: tx.id)
+    return pd.DataFrame.from_records(rows, columns=Transaction._fields)
+
+
+def price_history_frame(history):
+    """Preisverlauf aller Assets im Langformat (name, time, price)"""
+    names, timestamps, prices = [], [], []
+    for name in history:
+        ts, price = history.get(name).to_arrays()
+        names.append(np.full(len(ts), len(names)))
+        timestamps.append(ts)
+        prices.append(price)
+    if not names:
+        return pd.DataFrame({"name": pd.Series(dtype=object), "time": pd.Series(dtype="datetime64[s]"),
+                             "price": pd.Series(dtype=np.float64)})
+    # Namen als Kategorie, damit sie nicht pro Punkt als String im Speicher liegen
+    codes = np.concatenate(names)
+    return pd.DataFrame({
+        "name": pd.Categorical.from_codes(codes, categories=list(history)),
+        "time": pd.to_datetime(np.concatenate(timestamps), unit="s").floor("s"),
+        "price": np.concatenate(prices),
+    })
+
+
+def build_tables(tables, store, ledger, history):
+    """Frames der gewünschten Tabellen, in der Reihenfolge von tables"""
+    builders = {
+        "portfolio": lambda: portfolio_frame(store),
+        "transactions": lambda: transactions_frame(ledger),
+        "price_history": lambda: price_history_frame(history),
+    }
+    unknown = [table for table in tables if table not in builders]
+    if unknown:
+        raise ValueError(f"Unbekannte Tabelle: {', '.join(unknown)}")
+    return {table: builders[table]() for table in tables}
+
+
+def file_name(fmt, tables):
+    """Dateiname des Exports, ZIP sobald CSV oder Parquet mehrere Tabellen enthält"""
+    if len(tables) > 1:
+        extension = FORMATS[fmt].extension if fmt == "xlsx" else "zip"
+        return f"portfolio_export.{extension}"
+    return f"{tables[0]}_export.{FORMATS[fmt].extension}"
+
+
+def mime_type(fmt, tables):
+    if len(tables) > 1 and fmt != "xlsx":
+        return "application/zip"
+    return FORMATS[fmt].mime
+
+
+def _chunks(frame, chunk_rows):
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows]
+
+
+def iter_csv(frame, chunk_rows=CHUNK_ROWS):
+    """CSV als Folge von UTF-8-Blöcken, die Kopfzeile steht im ersten Block"""
+    if frame.empty:
+        yield frame.to_csv(index=False).encode("utf-8")
+        return
+    for i, chunk in enumerate(_chunks(frame, chunk_rows)):
+        yield chunk.to_csv(index=False, header=i == 0).encode("utf-8")
+
+
+def write_csv(frame, target, chunk_rows=CHUNK_ROWS):
+    for block in iter_csv(frame, chunk_rows):
+        target.write(block)
+
+
+def write_parquet(frame, target, chunk_rows=CHUNK_ROWS):
+    """Parquet mit einer Row-Group pro Block, benötigt pyarrow"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet-Export benötigt pyarrow (pip install pyarrow)") from e
+    schema = pa.Schema.from_pandas(frame, preserve_index=False)
+    with pq.ParquetWriter(target, schema) as writer:
+        for chunk in _chunks(frame, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def write_excel(frames, target, chunk_rows=CHUNK_ROWS):
+    """Ein Tabellenblatt pro Tabelle, zu lange Tabellen werden auf Folgeblätter verteilt"""
+    try:
+        writer = pd.ExcelWriter(target)
+    except (ImportError, ValueError) as e:
+        raise ImportError("Excel-Export benötigt openpyxl (pip install openpyxl)") from e
+    with writer:
+        for table, frame in frames.items():
+            for sheet, start in enumerate(range(0, max(len(frame), 1), EXCEL_MAX_ROWS)):
+                name = TABLES[table] if sheet == 0 else f"{TABLES[table]} {sheet + 1}"
+                part = frame.iloc[start:start + EXCEL_MAX_ROWS]
+                part.iloc[:0].to_excel(writer, sheet_name=name, index=False)
+                for row, chunk in zip(range(1, len(part) + 1, chunk_rows), _chunks(part, chunk_rows)):
+                    chunk.to_excel(writer, sheet_name=name, index=False, header=False, startrow=row)
+
+
+def write_export(target, fmt, frames, chunk_rows=CHUNK_ROWS):
+    """Schreibe frames ({Tabelle: Frame}) im Format fmt in das binäre Dateiobjekt target"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unbekanntes Exportformat: {fmt}")
+    if fmt == "xlsx":
+        write_excel(frames, target, chunk_rows)
+        return
+    write = write_csv if fmt == "csv" else write_parquet
+    if len(frames) == 1:
+        write(next(iter(frames.values())), target, chunk_rows)
+        return
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as archive:
+        for table, frame in frames.items():
+            with archive.open(f"{table}.{FORMATS[fmt].extension}", "w", force_zip64=True) as member:
+                write(frame, member, chunk_rows)
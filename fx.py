@@ -0,0 +1,169 @@
+"""Währungsumrechnung mit zwischengespeicherten Kurstabellen"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+from providers import COINGECKO_URL
+
+# Unterstützte Währungen, erste ist die Standard-Basiswährung
+CURRENCIES = ["CHF", "USD", "EUR", "GBP", "JPY", "CNY"]
+DEFAULT_BASE_CURRENCY = "CHF"
+
+# Näherungswerte (Einheiten pro 1 USD), wenn keine Quelle erreichbar ist
+FALLBACK_RATES = {
+    "USD": 1.0,
+    "CHF": 0.88,
+    "EUR": 0.92,
+    "GBP": 0.79,
+    "JPY": 150.0,
+    "CNY": 7.2,
+}
+
+
+class RateTable:
+    """Wechselkurse relativ zu einer Basiswährung
+
+    rates[c] ist der Wert einer Einheit der Währung c in der Basiswährung.
+    """
+
+    def __init__(self, base, rates, source, fetched_at=None):
+        self.base = base
+        self.rates = rates
+        self.source = source
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    @classmethod
+    def from_quotes(cls, base, units_per_pivot, source):
+        """Baue die Tabelle aus 'Einheiten pro 1 Pivot-Währung' (z.B. pro USD)"""
+        units_per_pivot = {c.upper(): float(v) for c, v in units_per_pivot.items() if v}
+        base_units = units_per_pivot[base]
+        rates = {c: base_units / units for c, units in units_per_pivot.items()}
+        return cls(base, rates, source)
+
+    def rate(self, currency):
+        return self.rates.get(str(currency).upper())
+
+    def factors(self, currencies):
+        """Umrechnungsfaktor pro Zeile, unbekannte Währungen werden mit 1 gerechnet"""
+        if isinstance(currencies, pd.Series) and isinstance(currencies.dtype, pd.CategoricalDtype):
+            codes = currencies.cat.codes.to_numpy()
+            categories = currencies.cat.categories
+        else:
+            codes, categories = pd.factorize(pd.Series(currencies))
+        lookup = np.array([self.rate(c) or 1.0 for c in categories] + [1.0], dtype=np.float64)
+        return lookup[codes]
+
+    def convert(self, values, currencies):
+        """Rechne eine ganze Wertespalte in einem Schritt in die Basiswährung um"""
+        return np.asarray(values, dtype=np.float64) * self.factors(currencies)
+
+    def missing(self, currencies):
+        """Währungen ohne Kurs in dieser Tabelle"""
+        return sorted({str(c) for c in pd.unique(pd.Series(currencies).dropna()) if self.rate(c) is None})
+
+
+class StaticRateProvider:
+    """Feste Kurse, z.B. FALLBACK_RATES"""
+
+    name = "static"
+
+    def __init__(self, units_per_usd=FALLBACK_RATES):
+        self.units_per_usd = units_per_usd
+
+    def fetch(self):
+        return self.units_per_usd
+
+
+class FileRateProvider:
+    """Kurse aus einer lokalen JSON-Datei {"USD": 1.0, "CHF": 0.88, ...} (Einheiten pro 1 USD)"""
+
+    name = "file"
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+class CoinGeckoRateProvider:
+    """Kurse vom CoinGecko-kompatiblen /exchange_rates-Endpunkt (auch vom lokalen Stub)"""
+
+    name = "coingecko"
+
+    def __init__(self, base_url=COINGECKO_URL, timeout=5.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def fetch(self):
+        response = requests.get(f"{self.base_url}/exchange_rates", timeout=self.timeout)
+        response.raise_for_status()
+        # Werte sind pro 1 BTC angegeben, für from_quotes reicht jede gemeinsame Pivot-Währung
+        return {c.upper(): entry["value"] for c, entry in response.json()["rates"].items()}
+
+
+class FxEngine:
+    """Lädt Kurstabellen höchstens einmal pro TTL, bei Fehlern gelten die Fallback-Kurse"""
+
+    def __init__(self, provider, ttl=3600.0):
+        self.provider = provider
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._quotes = None
+        self._source = None
+        self._loaded_at = 0.0
+        self._tables = {}
+        self.version = 0
+        self.last_error = None
+
+    def refresh(self, force=False):
+        """Lade die Kurse neu, wenn die TTL abgelaufen ist (oder force gesetzt ist)"""
+        with self._lock:
+            if not force and self._quotes is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return
+            try:
+                quotes = self.provider.fetch()
+                source = self.provider.name
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                if self._quotes is not None:
+                    # Letzte gültige Tabelle behalten, später erneut versuchen
+                    self._loaded_at = time.monotonic()
+                    return
+                quotes = FALLBACK_RATES
+                source = "fallback"
+            self._quotes = quotes
+            self._source = source
+            self._loaded_at = time.monotonic()
+            self._tables = {}
+            self.version += 1
+
+    def table(self, base):
+        """Kurstabelle für die Basiswährung, bis zum nächsten Neuladen dasselbe Objekt"""
+        self.refresh()
+        with self._lock:
+            table = self._tables.get(base)
+            if table is None:
+                quotes = {c.upper(): v for c, v in self._quotes.items()}
+                source = self._source
+                if base not in quotes:
+                    quotes, source = FALLBACK_RATES, "fallback"
+                table = self._tables[base] = RateTable.from_quotes(base, quotes, source)
+            return table
+
+
+def build_fx_provider():
+    """Kursquelle aus FX_PROVIDER (coingecko, file oder static)"""
+    name = os.environ.get("FX_PROVIDER", "coingecko")
+    if name == "file":
+        return FileRateProvider(os.environ.get("FX_RATES_FILE", "fx_rates.json"))
+    if name == "static":
+        return StaticRateProvider()
+    return CoinGeckoRateProvider(os.environ.get("COINGECKO_BASE_URL", COINGECKO_URL))
@@ -0,0 +1,190 @@
+"""Leichtgewichtige Zeitmessung und Zähler für die heissen Pfade, exportierbar für Prometheus"""
+import functools
+import json
+import threading
+import time
+
+# Obergrenzen der Histogramm-Buckets in Sekunden
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "portfolio_"
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class SpanStats:
+    """Anzahl, Summe, Maximum, letzter Wert und Histogramm einer Messstelle"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {"count": self.count, "total_s": self.total, "mean_s": self.mean, "max_s": self.max, "last_s": self.last}
+
+
+class Span:
+    """Misst die Dauer eines Blocks, auch als Dekorator verwendbar (pro Aufruf eine eigene Messung)"""
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self._started)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(self.metrics, self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class Metrics:
+    """Prozessweite Sammlung von Messstellen (spans), Zählern und abgefragten Werten
+
+    Abgefragte Werte werden erst beim Export gelesen: Gauges sind aktuelle
+    Werte, abgefragte Zähler (z.B. Cache-Treffer) steigen nur und werden mit
+    ihrer reset-Funktion zurückgesetzt.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._gauges = {}
+        self._read_counters = {}
+        self._resets = {}
+
+    def span(self, name):
+        return Span(self, name)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = SpanStats()
+            stats.observe(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_gauge(self, name, read, **labels):
+        """read() wird erst beim Export aufgerufen, z.B. für die Anzahl Symbole"""
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = read
+
+    def register_counter(self, name, read, reset=None, **labels):
+        """Wie register_gauge für stetig steigende Werte (*_total), reset() setzt sie auf 0"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._read_counters[key] = read
+            if reset is not None:
+                self._resets[key] = reset
+
+    def reset(self):
+        """Setze Messstellen und alle Zähler zurück, auch die abgefragten"""
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            resets = list(self._resets.values())
+        for reset in resets:
+            reset()
+
+    def snapshot(self):
+        """Aktuelle Werte als Dict, Gauges werden dabei ausgelesen"""
+        with self._lock:
+            spans = {name: stats.to_dict() for name, stats in self._spans.items()}
+            counters = [(name, dict(key), value) for (name, key), value in self._counters.items()]
+            read_counters = list(self._read_counters.items())
+            gauges = list(self._gauges.items())
+        counters += [(name, dict(key), read()) for (name, key), read in read_counters]
+        return {
+            "spans": spans,
+            "counters": [{"name": name, "labels": labels, "value": value} for name, labels, value in counters],
+            "gauges": [{"name": name, "labels": dict(key), "value": read()} for (name, key), read in gauges],
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Prometheus-Textformat: Spans als Histogramm in Sekunden, Zähler und Gauges"""
+        lines = []
+        with self._lock:
+            spans = [(name, stats.buckets, list(stats.bucket_counts), stats.count, stats.total)
+                     for name, stats in sorted(self._spans.items())]
+            counters = sorted(self._counters.items())
+            read_counters = sorted(self._read_counters.items())
+            gauges = sorted(self._gauges.items())
+
+        if spans:
+            metric = f"{PREFIX}span_duration_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, buckets, bucket_counts, count, total in spans:
+                key = (("span", name),)
+                for bound, bucket_count in zip(buckets, bucket_counts):
+                    lines.append(f"{metric}_bucket{_format_labels(key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{metric}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{metric}_sum{_format_labels(key)} {total}")
+                lines.append(f"{metric}_count{_format_labels(key)} {count}")
+
+        typed = set()
+        counters = sorted(counters + [(key, read()) for key, read in read_counters])
+        for (name, key), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}{_format_labels(key)} {value}")
+        for (name, key), read in gauges:
+            if name not in typed:
+                lines.append(f"# TYPE {PREFIX}{name} gauge")
+                typed.add(name)
+            lines.append(f"{PREFIX}{name}{_format_labels(key)} {read()}")
+        return "\n".join(lines) + "\n"
+
+
+# Gemeinsame Instanz für den ganzen Prozess
+METRICS = Metrics()
+
+
+def span(name):
+    return METRICS.span(name)
+
+
+def increment(name, amount=1, **labels):
+    METRICS.increment(name, amount, **labels)
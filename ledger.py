@@ -0,0 +1,240 @@
+"""Transaktionsjournal mit laufend nachgeführten Positionen (Einstandspreis, FIFO-Lots, G/V)"""
+from bisect import bisect_right
+from collections import deque, namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+import pandas as pd
+
+# Transaktionsarten
+BUY = "buy"
+SELL = "sell"
+FEE = "fee"
+DIVIDEND = "dividend"
+# Setzt Menge und Einstandspreis direkt (Korrektur im Portfolio Management, 0 = Position schliessen)
+ADJUST = "adjust"
+KINDS = (BUY, SELL, FEE, DIVIDEND, ADJUST)
+
+Transaction = namedtuple("Transaction", ["id", "asset", "symbol", "kind", "quantity", "price", "amount", "date"])
+
+
+def _today():
+    return datetime.now().strftime('%Y-%m-%d')
+
+
+@lru_cache(maxsize=4096)
+def date_key(date):
+    """Datum als ISO-Text (YYYY-MM-DD) zum Sortieren, Tag vor Monat wie in der Schweiz üblich
+
+    Nicht lesbare Daten bleiben unverändert.
+    """
+    date = str(date)
+    if len(date) >= 10 and date[4] == "-" and date[7] == "-":
+        return date[:10]
+    parsed = pd.to_datetime(date, dayfirst=True, errors="coerce")
+    return date if pd.isna(parsed) else parsed.strftime('%Y-%m-%d')
+
+
+def _order_key(tx):
+    return (date_key(tx.date), tx.id)
+
+
+class Position:
+    """Bestand eines Assets, aufgebaut aus seinen Transaktionen in Datumsreihenfolge
+
+    Offene Käufe liegen als FIFO-Lots [Menge, Preis, Datum] vor, Verkäufe
+    verbrauchen die ältesten Lots zuerst.
+    """
+
+    def __init__(self, asset, symbol):
+        self.asset = asset
+        self.symbol = symbol
+        self.transactions = []
+        self._order = []
+        self._reset()
+
+    def _reset(self):
+        self.lots = deque()
+        self.quantity = 0.0
+        self.cost = 0.0
+        self.realized = 0.0
+        self.fees = 0.0
+        self.dividends = 0.0
+
+    @property
+    def average_cost(self):
+        return self.cost / self.quantity if self.quantity > 0 else 0.0
+
+    @property
+    def first_date(self):
+        """Kaufdatum des ältesten offenen Lots"""
+        return self.lots[0][2] if self.lots else ""
+
+    @property
+    def realized_total(self):
+        """Realisierte Kursgewinne plus Dividenden abzüglich Gebühren"""
+        return self.realized + self.dividends - self.fees
+
+    def unrealized(self, price):
+        return self.quantity * price - self.cost
+
+    def insert(self, tx):
+        """Ordne eine Transaktion ein, nur rückdatierte lösen einen Neuaufbau aus"""
+        key = _order_key(tx)
+        i = bisect_right(self._order, key)
+        self._order.insert(i, key)
+        self.transactions.insert(i, tx)
+        if i == len(self.transactions) - 1:
+            self._apply(tx)
+        else:
+            self.rebuild()
+
+    def extend(self, transactions):
+        """Ordne mehrere Transaktionen ein und baue die Position einmal neu auf"""
+        self.transactions.extend(transactions)
+        self.transactions.sort(key=_order_key)
+        self._order = [_order_key(tx) for tx in self.transactions]
+        self.rebuild()
+
+    def rebuild(self):
+        self._reset()
+        for tx in self.transactions:
+            self._apply(tx)
+
+    def _apply(self, tx):
+        if tx.kind == BUY:
+            self.lots.append([tx.quantity, tx.price, tx.date])
+            self.quantity += tx.quantity
+            self.cost += tx.quantity * tx.price
+        elif tx.kind == SELL:
+            remaining = min(tx.quantity, self.quantity)
+            while remaining > 1e-12 and self.lots:
+                lot = self.lots[0]
+                used = min(lot[0], remaining)
+                self.realized += used * (tx.price - lot[1])
+                self.cost -= used * lot[1]
+                lot[0] -= used
+                self.quantity -= used
+                remaining -= used
+                if lot[0] <= 1e-12:
+                    self.lots.popleft()
+            if not self.lots:
+                self.quantity = self.cost = 0.0
+        elif tx.kind == FEE:
+            self.fees += tx.amount
+        elif tx.kind == DIVIDEND:
+            self.dividends += tx.amount
+        elif tx.kind == ADJUST:
+            date = self.first_date or tx.date
+            self.lots.clear()
+            if tx.quantity > 0:
+                self.lots.append([tx.quantity, tx.price, date])
+            self.quantity = tx.quantity
+            self.cost = tx.quantity * tx.price
+
+
+class Ledger:
+    """Nur anhängendes Journal aller Transaktionen mit einem Positionsindex pro Asset"""
+
+    def __init__(self):
+        self.positions = {}
+        self._next_id = 1
+        self._count = 0
+        self.version = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, asset):
+        return asset in self.positions
+
+    def get(self, asset):
+        return self.positions.get(asset)
+
+    def validate(self, asset, symbol, kind, quantity=0.0, price=0.0, amount=0.0, date=None):
+        """Prüfe eine Transaktion gegen den aktuellen Bestand und gib sie ohne id zurück
+
+        Ändert nichts, die id vergibt danach die Datenbank (siehe extend).
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unbekannte Transaktionsart: {kind}")
+        position = self.positions.get(asset)
+        if position is None and kind != BUY:
+            raise ValueError(f"Für {asset} gibt es noch keinen Kauf")
+        if kind == SELL and quantity > position.quantity + 1e-9:
+            raise ValueError(f"Verkauf von {quantity} übersteigt den Bestand von {asset}")
+        return Transaction(None, asset, symbol, kind, float(quantity), float(price), float(amount), str(date or _today()))
+
+    def record(self, asset, symbol, kind, quantity=0.0, price=0.0, amount=0.0, date=None, id=None):
+        """Erfasse eine Transaktion mit eigener id (ohne Datenbank) und führe die Position nach"""
+        tx = self.validate(asset, symbol, kind, quantity, price, amount, date)
+        tx = tx._replace(id=self._next_id if id is None else id)
+        self.extend([tx])
+        return tx
+
+    def extend(self, transactions):
+        """Übernimm Transaktionen mit id, jede betroffene Position wird nur einmal nachgeführt"""
+        by_asset = {}
+        for tx in transactions:
+            by_asset.setdefault(tx.asset, []).append(tx)
+            self._next_id = max(self._next_id, tx.id + 1)
+            self._count += 1
+        for asset, added in by_asset.items():
+            position = self.positions.get(asset)
+            if position is None:
+                position = self.positions[asset] = Position(asset, added[0].symbol)
+            if len(added) == 1:
+                position.insert(added[0])
+            else:
+                position.extend(added)
+        if by_asset:
+            self.version += 1
+
+    def load(self, transactions):
+        """Baue den Index aus gespeicherten Transaktionen in einem Durchgang auf"""
+        self.extend(transactions)
+
+    def openings(self, store):
+        """Eröffnungskäufe (ohne id) für Assets des Portfolios ohne offene Position"""
+        return [
+            self.validate(name, record["symbol"], BUY, record["quantity"], record["purchase_price"],
+                          date=record["purchase_date"] or None)
+            for name, record in store.items()
+            if name not in self.positions or self.positions[name].quantity <= 0
+        ]
+
+
+def sync_position(store, position, **fields):
+    """Übernimm Menge, Einstandspreis und Kaufdatum einer Position in den PortfolioStore
+
+    fields sind Stammdaten (type, currency, sector, current_price) für neue Assets.
+    """
+    if position.quantity <= 0:
+        if position.asset in store:
+            store.remove(position.asset)
+        return
+    values = dict(quantity=position.quantity, purchase_price=position.average_cost, purchase_date=position.first_date)
+    if position.asset in store:
+        store.update(position.asset, **values)
+    else:
+        fields.setdefault("current_price", position.average_cost)
+        store.add(position.asset, symbol=position.symbol, **values, **fields)
+
+
+def import_purchases(rows):
+    """Käufe (ohne id) für die importierten Zeilen aus csv_import und Stammdaten {Asset: Felder}
+
+    Jede Zeile wird ein eigener Kauf mit eigenem Datum, damit FIFO-Lots und
+    realisierte Gewinne den tatsächlichen Käufen entsprechen.
+    """
+    columns = [rows[col].tolist() for col in ("asset", "symbol", "quantity", "price", "date")]
+    transactions = [
+        Transaction(None, asset, symbol, BUY, float(quantity), float(price), 0.0, date or _today())
+        for asset, symbol, quantity, price, date in zip(*columns)
+    ]
+    first = rows.drop_duplicates("asset")
+    fields = {
+        asset: dict(type=asset_type, currency=currency, sector=sector)
+        for asset, asset_type, currency, sector in first[["asset", "type", "currency", "sector"]].itertuples(index=False, name=None)
+    }
+    return transactions, fields
@@ -0,0 +1,151 @@
+"""Lokaler CoinGecko-kompatibler Kurs-Server für Offline-Tests und Benchmarks
+
+Start:  python mock_quote_server.py --port 8765 --latency 0.05 --error-rate 0.1
+App:    COINGECKO_BASE_URL=http://127.0.0.1:8765/api/v3 streamlit run app.py
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+
+# Erster Tag der simulierten Tagesverläufe (2015-01-01)
+HISTORY_EPOCH_DAY = 16436
+
+
+class MockQuoteServer(ThreadingHTTPServer):
+    """HTTP-Server mit steuerbarer Latenz sowie Fehler- und Rate-Limit-Quote"""
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, seed=None):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.prices = {}
+        self.fiat_per_usd = {"USD": 1.0, "CHF": 0.88, "EUR": 0.92, "GBP": 0.79, "JPY": 150.0, "CNY": 7.2}
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v3"
+
+    def quote(self, coin_id):
+        """Random Walk pro ID, damit aufeinanderfolgende Abrufe sich unterscheiden"""
+        with self._lock:
+            price = self.prices.get(coin_id) or self.random.uniform(1, 50000)
+            price *= 1 + self.random.gauss(0, 0.01)
+            self.prices[coin_id] = price
+            return price
+
+    def daily_history(self, coin_id, start, end):
+        """Ein Punkt pro Tag (00:00 UTC) von start bis end (Sekunden), pro ID und Tag immer gleich"""
+        first_day, last_day = int(start // 86400) + (start % 86400 > 0), int(end // 86400)
+        # Random Walk ab einem festen Tag, damit sich überlappende Abfragen gleiche Kurse liefern
+        walk = random.Random(zlib.crc32(coin_id.encode("utf-8")))
+        price = walk.uniform(1, 50000)
+        points = []
+        for day in range(min(first_day, HISTORY_EPOCH_DAY), last_day + 1):
+            price *= 1 + walk.gauss(0, 0.02)
+            if day >= first_day:
+                points.append([day * 86400 * 1000, price])
+        return points
+
+    def exchange_rates(self):
+        """Wechselkurse pro 1 BTC im Format von /exchange_rates"""
+        btc_usd = self.quote("bitcoin")
+        return {
+            currency.lower(): {"name": currency, "unit": currency, "value": btc_usd * units, "type": "fiat"}
+            for currency, units in self.fiat_per_usd.items()
+        }
+
+    def start_background(self):
+        """Starte den Server in einem Daemon-Thread und gib ihn zurück"""
+        thread = threading.Thread(target=self.serve_forever, name="mock-quote-server", daemon=True)
+        thread.start()
+        return thread
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MockQuoteServer
+
+    def do_GET(self):
+        server = self.server
+        with server._lock:
+            server.requests_served += 1
+            delay = max(server.latency + server.random.uniform(-server.jitter, server.jitter), 0)
+            roll = server.random.random()
+        time.sleep(delay)
+
+        url = urlparse(self.path)
+        path = url.path.rstrip("/")
+        history = path.startswith("/api/v3/coins/") and path.endswith("/market_chart/range")
+        if path not in ("/api/v3/simple/price", "/api/v3/exchange_rates") and not history:
+            return self._send(404, {"error": "not found"})
+        if roll < server.rate_limit_rate:
+            return self._send(429, {"status": {"error_code": 429, "error_message": "rate limited"}})
+        if roll < server.rate_limit_rate + server.error_rate:
+            return self._send(500, {"error": "internal error"})
+
+        if path == "/api/v3/exchange_rates":
+            return self._send(200, {"rates": server.exchange_rates()})
+
+        params = parse_qs(url.query)
+        if history:
+            coin_id = path[len("/api/v3/coins/"):-len("/market_chart/range")]
+            start = float(params.get("from", ["0"])[0])
+            end = float(params.get("to", ["0"])[0])
+            return self._send(200, {"prices": server.daily_history(coin_id, start, end)})
+        ids = [i for i in params.get("ids", [""])[0].split(",") if i]
+        currencies = [c for c in params.get("vs_currencies", ["usd"])[0].split(",") if c]
+        self._send(200, {coin_id: {c: server.quote(coin_id) for c in currencies} for coin_id in ids})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Antwortzeit in Sekunden")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Zufällige Abweichung der Latenz")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Anteil HTTP-500-Antworten")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Anteil HTTP-429-Antworten")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockQuoteServer(
+        (args.host, args.port),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed
+    )
+    print(f"Mock-Kursserver läuft auf {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
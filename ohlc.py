@@ -0,0 +1,339 @@
+"""Historische Tageskurse (OHLC): kompakte Spaltenablage, Archiv-Import und inkrementeller Backfill
+
+Tage sind ganze Zahlen seit 1970-01-01 (UTC), wie DAY in timeseries.
+Open/High/Low liegen als float32 vor (nur für Kerzen und Spannen), der
+Schlusskurs als float64, weil Renditen und Auswertungen darauf rechnen.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+from instrumentation import increment, span
+from providers import COINGECKO_URL, SYMBOL_TABLE
+from timeseries import DAY
+
+FIELDS = ("open", "high", "low", "close")
+DTYPES = {"open": np.float32, "high": np.float32, "low": np.float32, "close": np.float64}
+# Standardumfang eines Backfills in Tagen
+DEFAULT_DAYS = 5 * 365
+# Gleichzeitige Abfragen beim Backfill über einen Provider
+MAX_WORKERS = 8
+# Spalten eines Kursarchivs, Gross-/Kleinschreibung egal
+ARCHIVE_COLUMNS = ("symbol", "date", "open", "high", "low", "close")
+
+
+def today():
+    return int(time.time() // DAY)
+
+
+def to_days(values):
+    """Datumswerte (Text, datetime64, Timestamp) als Tage seit 1970, ohne Zeitzone als UTC gelesen"""
+    dates = pd.to_datetime(pd.Series(values), utc=True).dt.tz_convert(None)
+    return dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+
+
+def bars_frame(symbol, days, open, high, low, close):
+    """Zeilen im Format von DailyBars.merge, symbol ist ein Text, ein Array oder ein Categorical"""
+    if isinstance(symbol, str):
+        symbol = np.full(len(days), symbol, dtype=object)
+    return pd.DataFrame({
+        "symbol": symbol,
+        "day": np.asarray(days, dtype=np.int64),
+        "open": open,
+        "high": high,
+        "low": low,
+        "close": close,
+    })
+
+
+def daily_ohlc(symbol, timestamps, prices):
+    """Verdichte chronologische (Zeitstempel, Preis)-Punkte zu einer OHLC-Zeile pro Tag"""
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if not len(timestamps):
+        return bars_frame(symbol, [], [], [], [], [])
+    order = np.argsort(timestamps, kind="stable")
+    days = (timestamps[order] // DAY).astype(np.int64)
+    prices = prices[order]
+    starts = np.flatnonzero(np.append(True, days[1:] != days[:-1]))
+    ends = np.append(starts[1:], len(days)) - 1
+    return bars_frame(
+        symbol, days[starts], prices[starts],
+        np.maximum.reduceat(prices, starts), np.minimum.reduceat(prices, starts), prices[ends]
+    )
+
+
+class DailyBars:
+    """Tageskurse aller Symbole als NumPy-Spalten, sortiert nach (Symbol, Tag)
+
+    Jedes Symbol belegt einen zusammenhängenden Bereich, get() liefert ihn
+    ohne Kopie. merge() baut neue Arrays und tauscht sie unter einem Lock aus,
+    Leser sehen also immer einen vollständigen Stand. Zusätzlich wird pro Symbol
+    der bereits geladene Zeitraum geführt, damit spätere Backfills nur Fehlendes holen.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._symbols = []
+        self._code_by_symbol = {}
+        self._code = np.empty(0, dtype=np.int32)
+        self._day = np.empty(0, dtype=np.int32)
+        self._columns = {field: np.empty(0, dtype=DTYPES[field]) for field in FIELDS}
+        self._ranges = {}
+        self._coverage = {}
+        self.version = 0
+
+    @classmethod
+    def from_frame(cls, frame, coverage=()):
+        """Aus Zeilen (symbol, day, open, high, low, close) und (symbol, erster, letzter Tag)"""
+        bars = cls()
+        bars.merge(frame)
+        for symbol, first_day, last_day in coverage:
+            bars.mark_covered(symbol, first_day, last_day)
+        return bars
+
+    def __len__(self):
+        return len(self._day)
+
+    def __contains__(self, symbol):
+        return symbol in self._ranges
+
+    @property
+    def symbols(self):
+        return list(self._ranges)
+
+    @property
+    def nbytes(self):
+        return self._code.nbytes + self._day.nbytes + sum(values.nbytes for values in self._columns.values())
+
+    def coverage(self, symbol):
+        """Bereits geladener Zeitraum (erster, letzter Tag) oder None"""
+        return self._coverage.get(symbol)
+
+    def mark_covered(self, symbol, first_day, last_day):
+        """Erweitere den geladenen Zeitraum, auch wenn die Quelle dafür keine Kurse hatte"""
+        with self._lock:
+            current = self._coverage.get(symbol)
+            if current is not None:
+                first_day, last_day = min(first_day, current[0]), max(last_day, current[1])
+            self._coverage[symbol] = (int(first_day), int(last_day))
+            return self._coverage[symbol]
+
+    def get(self, symbol, field="close"):
+        """(Tage, Werte) eines Symbols als Views ohne Kopie, None wenn unbekannt"""
+        with self._lock:
+            bounds = self._ranges.get(symbol)
+            if bounds is None:
+                return None
+            day, values = self._day, self._columns[field]
+        return day[bounds[0]:bounds[1]], values[bounds[0]:bounds[1]]
+
+    def frame(self, symbol):
+        """OHLC eines Symbols mit Datumsindex"""
+        with self._lock:
+            start, stop = self._ranges.get(symbol, (0, 0))
+            day, columns = self._day, self._columns
+        index = pd.to_datetime(day[start:stop].astype(np.int64) * DAY, unit="s")
+        return pd.DataFrame({field: columns[field][start:stop] for field in FIELDS}, index=index)
+
+    def merge(self, frame):
+        """Übernimm Zeilen (symbol, day, open, high, low, close), neue Werte ersetzen gleiche (Symbol, Tag)
+
+        Gibt die Anzahl bisher fehlender (Symbol, Tag)-Paare zurück.
+        """
+        if not len(frame):
+            return 0
+        with self._lock:
+            # Neue Symbole bekommen fortlaufende Codes, bestehende behalten ihren
+            inverse, uniques = pd.factorize(frame["symbol"])
+            for symbol in uniques:
+                if symbol not in self._code_by_symbol:
+                    self._code_by_symbol[symbol] = len(self._symbols)
+                    self._symbols.append(symbol)
+            mapping = np.array([self._code_by_symbol[symbol] for symbol in uniques], dtype=np.int32)
+
+            code = np.concatenate([self._code, mapping[inverse]])
+            day = np.concatenate([self._day, frame["day"].to_numpy(dtype=np.int32)])
+            # Stabil sortieren: bei gleichem (Symbol, Tag) steht die neue Zeile hinten und gewinnt
+            key = code.astype(np.int64) << 32 | (day.astype(np.int64) + 2 ** 31)
+            order = np.argsort(key, kind="stable")
+            key = key[order]
+            keep = order[np.append(key[1:] != key[:-1], True)]
+
+            added = len(keep) - len(self._day)
+            columns = {}
+            for field in FIELDS:
+                values = frame[field].to_numpy(dtype=DTYPES[field])
+                columns[field] = np.concatenate([self._columns[field], values])[keep]
+            self._code, self._day, self._columns = code[keep], day[keep], columns
+
+            starts = np.flatnonzero(np.append(True, self._code[1:] != self._code[:-1]))
+            stops = np.append(starts[1:], len(self._code))
+            self._ranges = {
+                self._symbols[c]: (int(start), int(stop))
+                for c, start, stop in zip(self._code[starts], starts, stops)
+            }
+            self.version += 1
+        return added
+
+    def to_frame(self):
+        """Alle Zeilen als langes Frame (symbol, day, open, high, low, close)"""
+        with self._lock:
+            code, day, columns = self._code, self._day, self._columns
+            symbols = np.array(self._symbols, dtype=object)
+        return bars_frame(symbols[code], day, *(columns[field] for field in FIELDS))
+
+
+def read_archive(source, symbols=None):
+    """Lies ein Kursarchiv (Parquet oder CSV) in einem Zug als Zeilen für DailyBars.merge
+
+    Erwartete Spalten: symbol, date und close, optional open, high, low.
+    Symbol und Datum werden als Kategorien gelesen, jedes Datum also nur einmal umgewandelt.
+    """
+    name = str(getattr(source, "name", source)).lower()
+    if name.endswith((".parquet", ".pq")):
+        try:
+            frame = pd.read_parquet(source)
+        except ImportError as e:
+            raise ImportError("Parquet-Archive benötigen pyarrow (pip install pyarrow)") from e
+    else:
+        header = pd.read_csv(source, nrows=0).columns
+        if hasattr(source, "seek"):
+            source.seek(0)
+        columns = [column for column in header if column.strip().lower() in ARCHIVE_COLUMNS]
+        categories = {column: "category" for column in columns if column.strip().lower() in ("symbol", "date")}
+        frame = pd.read_csv(source, usecols=columns, dtype=categories)
+    frame.columns = [str(column).strip().lower() for column in frame.columns]
+    missing = {"symbol", "date", "close"} - set(frame.columns)
+    if missing:
+        raise ValueError(f"Im Kursarchiv fehlen die Spalten: {', '.join(sorted(missing))}")
+
+    if symbols is not None:
+        frame = frame[frame["symbol"].isin(list(symbols))]
+    # Zeilen ohne Datum oder Schlusskurs verwerfen, sonst zeigt ihr Code -1 auf das letzte Datum
+    frame = frame.dropna(subset=["date", "close"])
+    dates = frame["date"].astype("category").cat.remove_unused_categories()
+    parsed = pd.to_datetime(pd.Series(dates.cat.categories), utc=True, errors="coerce")
+    invalid = dates.cat.categories[parsed.isna().to_numpy()]
+    if len(invalid):
+        raise ValueError(f"Ungültige Daten im Kursarchiv: {', '.join(map(str, invalid[:5]))}")
+    symbols = frame["symbol"].astype("category")
+    close = frame["close"].to_numpy(dtype=np.float64)
+    return bars_frame(
+        symbols.cat.rename_categories(symbols.cat.categories.astype(str)).array,
+        to_days(parsed)[dates.cat.codes.to_numpy()],
+        *(frame[field].to_numpy(dtype=np.float64) if field in frame else close for field in ("open", "high", "low")),
+        close
+    )
+
+
+class CoinGeckoHistoryProvider:
+    """Tagesverlauf von CoinGecko (/coins/{id}/market_chart/range), OHLC aus den Punkten eines Tages"""
+
+    name = "coingecko"
+
+    def __init__(self, base_url=COINGECKO_URL, quote_currency="usd", symbol_table=SYMBOL_TABLE, timeout=30.0):
+        self.base_url = base_url.rstrip("/")
+        self.quote_currency = quote_currency
+        self.symbol_table = symbol_table
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def supports(self, symbol):
+        return self.symbol_table.external_id(symbol, self.name) is not None
+
+    def fetch(self, symbol, first_day, last_day):
+        """Tageskurse von first_day bis last_day (einschliesslich)"""
+        coin_id = self.symbol_table.external_id(symbol, self.name)
+        try:
+            with span("history_request"):
+                response = self._session.get(
+                    f"{self.base_url}/coins/{coin_id}/market_chart/range",
+                    params={"vs_currency": self.quote_currency, "from": first_day * DAY, "to": (last_day + 1) * DAY - 1},
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                points = np.asarray(response.json().get("prices") or [], dtype=np.float64).reshape(-1, 2)
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 429:
+                increment("upstream_rate_limited_total", provider=self.name)
+            else:
+                increment("upstream_errors_total", provider=self.name)
+            raise
+        except Exception:
+            increment("upstream_errors_total", provider=self.name)
+            raise
+        return daily_ohlc(symbol, points[:, 0] / 1000, points[:, 1])
+
+
+def missing_ranges(bars, symbol, first_day, last_day):
+    """Noch nicht geladene Tagesbereiche [(von, bis)] eines Symbols, vor und nach dem geladenen Zeitraum"""
+    if first_day > last_day:
+        return []
+    coverage = bars.coverage(symbol)
+    if coverage is None:
+        return [(first_day, last_day)]
+    ranges = []
+    if first_day < coverage[0]:
+        ranges.append((first_day, min(last_day, coverage[0] - 1)))
+    if last_day > coverage[1]:
+        ranges.append((max(first_day, coverage[1] + 1), last_day))
+    return ranges
+
+
+class BackfillResult:
+    """Neu übernommene Zeilen (zum Speichern), geladene Zeiträume und Fehler pro Symbol"""
+
+    def __init__(self):
+        self.frame = bars_frame([], [], [], [], [], [])
+        self.added = 0
+        self.coverage = {}
+        self.errors = {}
+
+
+def backfill(bars, symbols, first_day, last_day, provider=None, archive=None, max_workers=MAX_WORKERS):
+    """Ergänze bars für symbols im Zeitraum [first_day, last_day]
+
+    Zuerst aus dem Archiv (ein Lesevorgang), danach nur noch fehlende Bereiche
+    vom Provider, parallel und am Ende in einem einzigen merge übernommen.
+    """
+    result = BackfillResult()
+    symbols = list(dict.fromkeys(symbols))
+    frames = []
+
+    if archive is not None:
+        frame = read_archive(archive, symbols)
+        frame = frame[(frame["day"] >= first_day) & (frame["day"] <= last_day)]
+        frames.append(frame)
+        if len(frame):
+            spans = frame.groupby("symbol", sort=False, observed=True)["day"].agg(["min", "max"])
+            for symbol, first, last in spans.itertuples(name=None):
+                result.coverage[symbol] = bars.mark_covered(symbol, first, last)
+
+    if provider is not None:
+        jobs = [
+            (symbol, start, stop)
+            for symbol in symbols if provider.supports(symbol)
+            for start, stop in missing_ranges(bars, symbol, first_day, last_day)
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backfill") as executor:
+            futures = {executor.submit(provider.fetch, *job): job for job in jobs}
+            for future, (symbol, start, stop) in futures.items():
+                try:
+                    frames.append(future.result())
+                except Exception as e:
+                    increment("backfill_errors_total", provider=provider.name)
+                    result.errors[symbol] = str(e)
+                    continue
+                # Auch ohne Kurse (z.B. vor dem ersten Handelstag) gilt der Bereich als geladen
+                result.coverage[symbol] = bars.mark_covered(symbol, start, stop)
+
+    frames = [frame for frame in frames if len(frame)]
+    if frames:
+        result.frame = pd.concat(frames, ignore_index=True)
+        result.added = bars.merge(result.frame)
+    return result
@@ -0,0 +1,450 @@
+"""Portfolio ohne Oberfläche: Laden, Kurse, Import, Transaktionen und Bewertung
+
+Die Streamlit-App ist nur eine Ansicht auf PortfolioEngine. Batch-Jobs,
+Benchmarks und Worker-Prozesse verwenden dieselbe API ohne streamlit:
+
+    engine = PortfolioEngine.open()
+    engine.refresh_prices()
+    frame, totals = engine.metrics()
+"""
+from datetime import datetime
+import io
+import os
+import threading
+
+from analytics import portfolio_analytics
+from csv_import import import_csv
+from export import build_tables, write_export
+from fx import DEFAULT_BASE_CURRENCY, FxEngine, build_fx_provider
+from instrumentation import METRICS, increment, span
+from ledger import ADJUST, DIVIDEND, FEE, import_purchases, sync_position
+from ohlc import DEFAULT_DAYS, CoinGeckoHistoryProvider, backfill, today
+from portfolio_store import PortfolioStore
+from providers import CachedProvider, SimulationProvider, build_provider, route_symbols
+from quote_cache import QuoteCache
+from rebalance import rebalance
+from refresh import refresh_quotes
+from storage import PortfolioDatabase
+from valuation import compute_metrics, portfolio_metrics
+
+# Gültigkeit und Größe des prozessweiten Kurs-Caches
+QUOTE_CACHE_TTL = float(os.environ.get("QUOTE_CACHE_TTL", 60))
+QUOTE_CACHE_SIZE = int(os.environ.get("QUOTE_CACHE_SIZE", 10000))
+
+# Live-Kursquelle: "coingecko" (optional mit lokalem Stub über COINGECKO_BASE_URL) oder "file"
+QUOTE_PROVIDER = os.environ.get("QUOTE_PROVIDER", "coingecko")
+
+# Gültigkeit der Wechselkurstabelle in Sekunden
+FX_TTL = float(os.environ.get("FX_TTL", 3600))
+
+# Beispiel-Daten für Demo-Zwecke
+DEMO_PORTFOLIO = {
+    "Vanguard FTSE All-World (VWRA)": {
+        "symbol": "VWRA.AS",
+        "quantity": 15.5,
+        "purchase_price": 95.40,
+        "purchase_date": "2023-05-15",
+        "current_price": 102.30,
+        "type": "ETF",
+        "currency": "EUR",
+        "sector": "Global"
+    },
+    "Bitcoin (BTC)": {
+        "symbol": "BTC-USD",
+        "quantity": 0.25,
+        "purchase_price": 38500.00,
+        "purchase_date": "2023-08-10",
+        "current_price": 42000.00,
+        "type": "Krypto",
+        "currency": "USD",
+        "sector": "Kryptowährung"
+    },
+    "Apple Inc. (AAPL)": {
+        "symbol": "AAPL",
+        "quantity": 5,
+        "purchase_price": 170.50,
+        "purchase_date": "2023-10-05",
+        "current_price": 185.20,
+        "type": "Aktie",
+        "currency": "USD",
+        "sector": "Technology"
+    },
+    "iShares Core S&P 500 (IVV)": {
+        "symbol": "IVV",
+        "quantity": 8,
+        "purchase_price": 420.75,
+        "purchase_date": "2023-03-22",
+        "current_price": 455.30,
+        "type": "ETF",
+        "currency": "USD",
+        "sector": "US Large Cap"
+    },
+    "Nestlé SA (NESN)": {
+        "symbol": "NESN.SW",
+        "quantity": 10,
+        "purchase_price": 105.20,
+        "purchase_date": "2023-07-18",
+        "current_price": 112.50,
+        "type": "Aktie",
+        "currency": "CHF",
+        "sector": "Consumer Goods"
+    }
+}
+
+
+def build_quote_cache():
+    """Kurs-Cache nach QUOTE_CACHE_TTL/QUOTE_CACHE_SIZE, Treffer und Fehlzugriffe als Zähler"""
+    cache = QuoteCache(ttl=QUOTE_CACHE_TTL, max_entries=QUOTE_CACHE_SIZE)
+    # Treffer und Fehlzugriffe zählt der Cache selbst, die Diagnose liest sie beim Export
+    METRICS.register_counter("quote_cache_hits_total", lambda: cache.hits, reset=cache.reset_stats)
+    METRICS.register_counter("quote_cache_misses_total", lambda: cache.misses, reset=cache.reset_stats)
+    return cache
+
+
+def build_live_provider(cache):
+    """Live-Kursquelle nach QUOTE_PROVIDER, gelesen durch cache"""
+    if QUOTE_PROVIDER == "file":
+        provider = build_provider("file", path=os.environ.get("QUOTE_FILE", "quotes.json"))
+    elif "COINGECKO_BASE_URL" in os.environ:
+        provider = build_provider(QUOTE_PROVIDER, base_url=os.environ["COINGECKO_BASE_URL"])
+    else:
+        provider = build_provider(QUOTE_PROVIDER)
+    return CachedProvider(provider, cache)
+
+
+def build_history_provider():
+    """Quelle für historische Tageskurse, wie die Live-Kurse über COINGECKO_BASE_URL umlenkbar"""
+    if "COINGECKO_BASE_URL" in os.environ:
+        return CoinGeckoHistoryProvider(os.environ["COINGECKO_BASE_URL"])
+    return CoinGeckoHistoryProvider()
+
+
+def build_fx_engine():
+    """Wechselkurse nach FX_PROVIDER mit FX_TTL"""
+    return FxEngine(build_fx_provider(), ttl=FX_TTL)
+
+
+class PortfolioEngine:
+    """Zustand eines Portfolios (Bestände, Journal, Preisverlauf) mit allen Operationen darauf
+
+    database, live_provider, fx_engine und bars (Tageskurse) können zwischen
+    mehreren Engines geteilt werden (z.B. eine pro Streamlit-Session), der Rest
+    gehört der Engine.
+    """
+
+    def __init__(self, database, live_provider, fx_engine, bars=None, history_provider=None):
+        self.database = database
+        self.live_provider = live_provider
+        self.fx_engine = fx_engine
+        self.bars = bars if bars is not None else database.load_bars()
+        self.history_provider = history_provider
+        self.store = database.load_store()
+        self.ledger = database.load_ledger()
+        self.price_history = database.load_price_history()
+        self.last_price_update = database.load_last_update()
+        self.base_currency = database.load_setting('base_currency', DEFAULT_BASE_CURRENCY)
+        # Zuletzt übernommener Snapshot des scheduler.PriceScheduler und dessen (Kurse, veraltete Symbole)
+        self.snapshot_version = 0
+        self._snapshot_quotes = None
+        # Fertige Exporte je (Format, Tabellen), gültig solange sich die Quellen nicht ändern
+        self._exports = {}
+        self._export_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path=None, demo=False):
+        """Engine mit eigener Datenbank und Kursquellen aus der Umgebung (für Skripte und Worker)"""
+        database = PortfolioDatabase(path) if path else PortfolioDatabase()
+        engine = cls(database, build_live_provider(build_quote_cache()), build_fx_engine(),
+                     history_provider=build_history_provider())
+        if demo and not engine.store:
+            engine.load_demo()
+        engine.open_missing()
+        return engine
+
+    def load_demo(self):
+        """Ersetze ein leeres Portfolio durch DEMO_PORTFOLIO (wird erst mit der ersten Änderung gespeichert)"""
+        self.store = PortfolioStore.from_dict(DEMO_PORTFOLIO)
+
+    def open_missing(self):
+        """Bestände ohne Transaktionen (Demo-Daten, ältere Datenbanken) als Eröffnungskäufe erfassen"""
+        opening = self._commit(self.ledger.openings(self.store))
+        if opening:
+            self.save()
+        return opening
+
+    def _commit(self, transactions, fingerprints=()):
+        """Speichere geprüfte Transaktionen (ids vergibt die Datenbank), erst danach ins Journal
+
+        fingerprints werden auch ohne Transaktionen gespeichert (Import nur übersprungener Zeilen).
+        """
+        if not transactions and not len(fingerprints):
+            return []
+        transactions = self.database.append_transactions(transactions, fingerprints)
+        self.ledger.extend(transactions)
+        return transactions
+
+    def save(self):
+        """Schreibe geänderte und gelöschte Assets in die Datenbank"""
+        self.database.save_changes(self.store)
+
+    # Kurse und Bewertung
+
+    def rates(self, base=None):
+        return self.fx_engine.table(base or self.base_currency)
+
+    def set_base_currency(self, currency):
+        self.base_currency = currency
+        self.database.save_setting('base_currency', currency)
+
+    def metrics(self, base=None):
+        """(Tabelle pro Asset, PortfolioTotals) in der Basiswährung, einmal pro Version berechnet"""
+        return portfolio_metrics(self.store, self.rates(base))
+
+    def analytics(self, base=None):
+        """analytics.AnalyticsResult aus eigenem Verlauf und geladenen Tageskursen, None ohne genug Verlauf"""
+        return portfolio_analytics(self.store, self.price_history, self.rates(base), self.bars)
+
+    @span("rebalance")
+    def rebalance(self, targets, by=None, base=None, **constraints):
+        """Trades auf Zielgewichte pro Asset oder Spalte by, Beträge in der Basiswährung
+
+        constraints sind cash, lot_size, fee_rate, fee_fixed, min_trade und
+        no_sell wie bei rebalance.rebalance.
+        """
+        return rebalance(self.store.frame(), targets, by, self.rates(base), **constraints)
+
+    @span("backfill")
+    def backfill_history(self, days=DEFAULT_DAYS, archive=None):
+        """Lade Tageskurse aller Symbole im Portfolio bis gestern, nur noch fehlende Zeiträume
+
+        archive ist ein Pfad oder eine Datei (Parquet/CSV), danach fragt der
+        history_provider ab, was er kennt. Gibt das ohlc.BackfillResult zurück.
+        """
+        last_day = today() - 1
+        symbols = sorted(set(self.store.column('symbol')))
+        result = backfill(self.bars, symbols, last_day - days + 1, last_day,
+                          provider=self.history_provider, archive=archive)
+        self.database.save_bars(result.frame, result.coverage)
+        return result
+
+    @span("update_prices")
+    def refresh_prices(self, on_progress=None):
+        """Hole Kurse für alle Assets, übernimm sie ins Portfolio und speichere den Verlauf
+
+        on_progress(done, total) wie bei refresh.refresh_quotes, gibt das RefreshResult zurück.
+        """
+        # Wechselkurse einmal pro Aktualisierung laden (innerhalb der TTL aus dem Cache)
+        self.fx_engine.refresh()
+        frame = self.store.frame()
+
+        # Symbole den Kursquellen zuordnen und parallel abfragen
+        simulation = SimulationProvider(dict(zip(frame['symbol'], frame['purchase_price'])))
+        assignments = route_symbols(zip(frame['symbol'], frame['type']), self.live_provider, simulation)
+        result = refresh_quotes(assignments, on_progress=on_progress)
+
+        # Ohne Kurs von der Live-Quelle (Fehler, Deadline verpasst) wie beim Scheduler
+        # den letzten Preis behalten und als veraltet markieren, simuliert wird nur,
+        # was nie an eine Live-Quelle ging
+        result.stale.update(
+            s for source, symbols in assignments.items() if source is not simulation
+            for s in symbols if s not in result.prices
+        )
+        # Live-Kurse sind in der Währung der Quelle, simulierte schon in der Währung der Zeile
+        missing = [s for s in assignments.get(simulation, ()) if s not in result.prices and s not in result.stale]
+        self.store.apply_quotes(result.prices, stale=result.stale, rates=self.quote_rates())
+        self.store.apply_quotes(simulation.fetch(missing))
+
+        # Preisverlauf speichern (veraltete Preise nicht erneut eintragen)
+        self.last_price_update = datetime.now()
+        now = self.last_price_update.timestamp()
+        fresh = ~self.store.column('stale')
+        names = [name for name, ok in zip(self.store.names(), fresh) if ok]
+        prices = self.store.column('current_price')[fresh]
+        self.price_history.append_many(names, now, prices)
+        points = [(name, now, float(price)) for name, price in zip(names, prices)]
+
+        self.save()
+        self.database.append_price_history(points, updated_at=self.last_price_update)
+        return result
+
+    def quote_rates(self):
+        """fx.RateTable zur Umrechnung der Live-Kurse aus der Währung der Quelle, None ohne Angabe"""
+        currency = getattr(self.live_provider, "quote_currency", None)
+        return self.fx_engine.table(currency.upper()) if currency else None
+
+    def live_symbols(self):
+        """Symbole, deren Kurse von der Live-Quelle kommen"""
+        return self.store.cached("live_symbols", _live_symbols, self.live_provider)
+
+    def follow(self, scheduler):
+        """Melde die Live-Symbole beim Scheduler an und übernimm dessen neuesten Snapshot, ohne zu warten"""
+        scheduler.watch(self, self.live_symbols())
+        return self.apply_snapshot(scheduler.snapshot)
+
+    def apply_snapshot(self, snapshot):
+        """Übernimm die Live-Kurse eines scheduler.PriceSnapshot, simulierte Kurse bleiben unverändert
+
+        Gibt False zurück, wenn der Snapshot schon übernommen, älter als die
+        letzte Aktualisierung oder inhaltlich unverändert ist. Gespeichert werden
+        nur Kurs und stale der betroffenen Zeilen (siehe storage.save_changes).
+        """
+        if snapshot.version <= self.snapshot_version or snapshot.updated_at is None:
+            return False
+        self.snapshot_version = snapshot.version
+        if self.last_price_update is not None and snapshot.updated_at <= self.last_price_update:
+            return False
+        # Jede Session übernimmt den Snapshot bei einem Rerun, gleiche Kurse nicht erneut schreiben
+        quotes = (snapshot.prices, snapshot.stale)
+        if quotes == self._snapshot_quotes:
+            return False
+        self._snapshot_quotes = quotes
+
+        prices = {s: price for s, price in snapshot.prices.items() if s not in snapshot.stale}
+        self.store.apply_quotes(prices, stale=snapshot.stale, rates=self.quote_rates())
+        self.last_price_update = snapshot.updated_at
+        now = snapshot.updated_at.timestamp()
+        # Umgerechnete Kurse pro Zeile aus dem Store in den Verlauf
+        names = [name for symbol in prices for name in self.store.names_for_symbol(symbol)]
+        values = [self.store.get(name)["current_price"] for name in names]
+        self.price_history.append_many(names, now, values)
+        points = [(name, now, float(price)) for name, price in zip(names, values)]
+
+        # Alle Sessions übernehmen denselben Snapshot, gespeichert wird jeder Punkt nur einmal
+        self.save()
+        self.database.append_price_history(points, updated_at=self.last_price_update, skip_existing=True)
+        return True
+
+    # Transaktionen
+
+    @span("process_csv")
+    def import_csv(self, fileobj):
+        """Importiere eine CSV-Datei, bereits importierte Zeilen (gleicher Inhalt) werden übersprungen
+
+        Gibt das csv_import.ImportResult zurück, Lesefehler werden nicht abgefangen.
+        """
+        result = import_csv(fileobj, seen=self.database.load_fingerprints())
+        transactions, fields = import_purchases(result.rows)
+        transactions = self._commit(transactions, result.fingerprints)
+        for asset, asset_fields in fields.items():
+            sync_position(self.store, self.ledger.get(asset), **asset_fields)
+        self.save()
+        return result
+
+    def record(self, asset, symbol, kind, quantity=0.0, price=0.0, date=None, **fields):
+        """Erfasse Kauf/Verkauf (quantity, price) oder Gebühr/Dividende (price als Betrag)
+
+        fields sind Stammdaten (type, currency, sector) für neue Assets.
+        Ungültige Transaktionen lösen ValueError aus, ohne etwas zu ändern.
+        """
+        if kind in (FEE, DIVIDEND):
+            transaction = self.ledger.validate(asset, symbol, kind, amount=price, date=date)
+        else:
+            transaction = self.ledger.validate(asset, symbol, kind, quantity, price, date=date)
+        transaction, = self._commit([transaction])
+        # Menge und Einstandspreis kommen aus dem Journal, neue Assets starten mit dem Kaufpreis
+        sync_position(self.store, self.ledger.get(asset), **fields)
+        self.save()
+        return transaction
+
+    def adjust(self, asset, quantity, price):
+        """Setze Menge und Einstandspreis direkt, im Journal als Korrektur erfasst"""
+        return self.apply_edits({asset: (quantity, price)})[0]
+
+    def remove(self, asset):
+        """Schliesse eine Position, die Historie im Journal bleibt erhalten"""
+        self.apply_edits(removals=[asset])
+
+    def apply_edits(self, adjustments=None, removals=()):
+        """Übernimm Korrekturen {Asset: (Menge, Einstandspreis)} und Löschungen in einem Durchgang
+
+        Alles wird vor der ersten Änderung geprüft, ungültige Werte lösen
+        ValueError aus. Gibt die erfassten Transaktionen zurück.
+        """
+        removals = list(dict.fromkeys(removals))
+        adjustments = {asset: values for asset, values in (adjustments or {}).items() if asset not in removals}
+        unknown = [asset for asset in (*adjustments, *removals) if asset not in self.store]
+        if unknown:
+            raise ValueError(f"Unbekannte Assets: {', '.join(map(str, unknown))}")
+        invalid = [asset for asset, (quantity, price) in adjustments.items() if not quantity > 0 or not price >= 0]
+        if invalid:
+            raise ValueError(f"Menge muss positiv und Kaufpreis nicht negativ sein: {', '.join(invalid)}")
+
+        transactions = [
+            self.ledger.validate(asset, self.store[asset]['symbol'], ADJUST, quantity, price)
+            for asset, (quantity, price) in adjustments.items()
+        ] + [
+            self.ledger.validate(asset, self.store[asset]['symbol'], ADJUST, 0.0, 0.0)
+            for asset in removals
+        ]
+        transactions = self._commit(transactions)
+        for asset in adjustments:
+            sync_position(self.store, self.ledger.get(asset))
+        for asset in removals:
+            self.store.remove(asset)
+            self.price_history.pop(asset, None)
+        if transactions:
+            self.save()
+        return transactions
+
+    # Verwaltung
+
+    def positions_page(self, text="", page=0, page_size=50, sort=None, descending=False):
+        """Eine Seite der gefilterten Positionen mit Gewinn/Verlust in Positionswährung
+
+        Gibt (Frame der Seite, Anzahl Treffer insgesamt) zurück. Kennzahlen
+        werden nur für die Zeilen der Seite berechnet.
+        """
+        positions = self.store.query(text, sort, descending)
+        start = max(page, 0) * page_size
+        frame = self.store.frame().iloc[positions[start:start + page_size]]
+        return compute_metrics(frame), len(positions)
+
+    def positions_rows(self, names):
+        """Kennzahlen der noch vorhandenen Assets names in dieser Reihenfolge"""
+        frame = self.store.frame()
+        return compute_metrics(frame.loc[[name for name in names if name in frame.index]])
+
+    # Export
+
+    def _export_sources(self, tables):
+        sources = {"portfolio": self.store, "transactions": self.ledger, "price_history": self.price_history}
+        return tuple((sources[table], sources[table].version) for table in tables if table in sources)
+
+    @span("export_portfolio")
+    def export_to(self, target, fmt="csv", tables=("portfolio",)):
+        """Schreibe die Tabellen blockweise in das binäre Dateiobjekt target (ohne Cache)"""
+        write_export(target, fmt, build_tables(tables, self.store, self.ledger, self.price_history))
+
+    def export(self, fmt="csv", tables=("portfolio",)):
+        """Export als bytes, wiederverwendet bis sich eine der beteiligten Tabellen ändert
+
+        Darf aus einem anderen Thread aufgerufen werden (Streamlit erzeugt
+        Downloads erst beim Klick in einem eigenen Thread).
+        """
+        tables = tuple(tables)
+        key = (fmt, tables)
+        token = self._export_sources(tables)
+        with self._export_lock:
+            cached = self._exports.get(key)
+            if cached is not None and cached[0] == token:
+                increment("export_cache_hits_total")
+                return cached[1]
+            buffer = io.BytesIO()
+            self.export_to(buffer, fmt, tables)
+            payload = buffer.getvalue()
+            # Veraltete Exporte sofort freigeben, nicht erst beim nächsten Abruf desselben Formats
+            self._exports = {k: v for k, v in self._exports.items() if v[0] == self._export_sources(k[1])}
+            self._exports[key] = (token, payload)
+            return payload
+
+    def export_csv(self):
+        """Portfolio als CSV-Text, None bei leerem Portfolio"""
+        if self.store:
+            return self.export("csv").decode("utf-8")
+        return None
+
+
+def _live_symbols(store, live_provider):
+    frame = store.frame()
+    # Ohne Simulation: alles, was nicht an die Live-Quelle geht, landet unter None
+    return frozenset(route_symbols(zip(frame['symbol'], frame['type']), live_provider, None).get(live_provider, ()))
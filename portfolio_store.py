@@ -0,0 +1,355 @@
+"""Spaltenbasierter Portfolio-Speicher mit Index für Namen und Symbole"""
+import numpy as np
+import pandas as pd
+
+# Spalten eines Assets in der Reihenfolge der bisherigen Dict-Einträge
+FLOAT_COLUMNS = ("quantity", "purchase_price", "current_price")
+OBJECT_COLUMNS = ("symbol", "purchase_date")
+CATEGORY_COLUMNS = ("type", "currency", "sector")
+BOOL_COLUMNS = ("stale",)
+COLUMNS = (
+    "symbol", "quantity", "purchase_price", "purchase_date",
+    "current_price", "type", "currency", "sector", "stale"
+)
+
+DEFAULTS = {
+    "quantity": 0.0,
+    "purchase_price": 0.0,
+    "purchase_date": "",
+    "type": "Aktie",
+    "currency": "USD",
+    "sector": "Allgemein",
+    "stale": False,
+}
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+class PortfolioStore:
+    """Hält alle Positionen als typisierte NumPy-Spalten statt als Dict von Dicts
+
+    Zeilen werden über einen Namensindex in O(1) gefunden und direkt in den
+    Spalten geändert. Gelöschte Zeilen werden nur markiert und beim nächsten
+    Wachstum kompaktiert. Jede Änderung erhöht `version`, damit abgeleitete
+    Daten (DataFrame, Kennzahlen, Charts) gezielt neu berechnet werden können.
+    """
+
+    def __init__(self, capacity=64):
+        self._size = 0
+        self._names = np.empty(capacity, dtype=object)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._columns = {}
+        for col in FLOAT_COLUMNS:
+            self._columns[col] = np.zeros(capacity, dtype=np.float64)
+        for col in OBJECT_COLUMNS:
+            self._columns[col] = np.empty(capacity, dtype=object)
+        for col in CATEGORY_COLUMNS:
+            self._columns[col] = np.full(capacity, -1, dtype=np.int32)
+        for col in BOOL_COLUMNS:
+            self._columns[col] = np.zeros(capacity, dtype=bool)
+        self._categories = {col: [] for col in CATEGORY_COLUMNS}
+        self._category_codes = {col: {} for col in CATEGORY_COLUMNS}
+        self._row_by_name = {}
+        self._rows_by_symbol = {}
+        self._dead = 0
+        self.version = 0
+        self._derived = {}
+        self._changed = set()
+        self._priced = set()
+        self._removed = set()
+
+    @classmethod
+    def from_dict(cls, portfolio):
+        """Erzeuge einen Speicher aus dem bisherigen {Name: {Feld: Wert}}-Format"""
+        store = cls(capacity=max(64, len(portfolio)))
+        for name, record in portfolio.items():
+            store.add(name, **record)
+        return store
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Erzeuge einen Speicher spaltenweise aus einem DataFrame mit Asset-Namen als Index"""
+        size = len(frame)
+        store = cls(capacity=max(64, size))
+        store._size = size
+        store._names[:size] = frame.index.to_numpy(dtype=object)
+        store._alive[:size] = True
+        for col in FLOAT_COLUMNS:
+            store._columns[col][:size] = frame[col].to_numpy(dtype=np.float64)
+        for col in OBJECT_COLUMNS:
+            store._columns[col][:size] = frame[col].to_numpy(dtype=object)
+        for col in CATEGORY_COLUMNS:
+            codes, categories = pd.factorize(frame[col])
+            store._columns[col][:size] = codes
+            store._categories[col] = [str(c) for c in categories]
+            store._category_codes[col] = {c: i for i, c in enumerate(store._categories[col])}
+        store._columns["stale"][:size] = frame["stale"].to_numpy(dtype=bool)
+        store._row_by_name = {name: row for row, name in enumerate(store._names[:size])}
+        for row, symbol in enumerate(store._columns["symbol"][:size]):
+            store._rows_by_symbol.setdefault(symbol, set()).add(row)
+        return store
+
+    def to_dict(self):
+        return {name: self.get(name) for name in self.names()}
+
+    # Abfragen
+
+    def __len__(self):
+        return len(self._row_by_name)
+
+    def __bool__(self):
+        return bool(self._row_by_name)
+
+    def __contains__(self, name):
+        return name in self._row_by_name
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def names(self):
+        return list(self._row_names())
+
+    def items(self):
+        for name in self.names():
+            yield name, self.get(name)
+
+    def get(self, name):
+        """Gib eine Kopie des Eintrags als Dict zurück"""
+        row = self._row_by_name[name]
+        return {col: self._value(col, row) for col in COLUMNS}
+
+    def rows_for_symbol(self, symbol):
+        return sorted(self._rows_by_symbol.get(symbol, ()))
+
+    def names_for_symbol(self, symbol):
+        return [self._names[row] for row in self.rows_for_symbol(symbol)]
+
+    def column(self, col):
+        """Werte einer Spalte für alle aktiven Zeilen (Kategorien als Codes)"""
+        values = self._columns[col][:self._size]
+        return values if self._dead == 0 else values[self._alive[:self._size]]
+
+    def frame(self):
+        """DataFrame mit kategorialen Spalten, zwischengespeichert pro Version"""
+        return self.cached("frame", PortfolioStore._build_frame)
+
+    def query(self, text="", sort=None, descending=False):
+        """Positionen (wie in frame()) der Assets, deren Name oder Symbol text enthält
+
+        Gross-/Kleinschreibung spielt keine Rolle. sort ist eine Spalte aus
+        COLUMNS oder "name", ohne sort bleibt die Reihenfolge von frame().
+        Das Ergebnis wird pro Version und Abfrage zwischengespeichert.
+        """
+        if sort is not None and sort != "name" and sort not in COLUMNS:
+            raise KeyError(f"Unbekanntes Feld: {sort}")
+        return self.cached("query", PortfolioStore._build_query, text.strip().lower(), sort, descending)
+
+    def cached(self, key, build, *depends):
+        """Gib build(self, *depends) zurück, neu berechnet nur bei neuer Version oder anderen depends"""
+        token = (self.version, depends)
+        entry = self._derived.get(key)
+        if entry is None or entry[0] != token:
+            entry = (token, build(self, *depends))
+            self._derived[key] = entry
+        return entry[1]
+
+    # Änderungen
+
+    def add(self, name, **fields):
+        """Füge ein Asset hinzu oder überschreibe ein bestehendes"""
+        if name in self._row_by_name:
+            self.update(name, **fields)
+            return
+        if self._size == len(self._names):
+            self._grow()
+        row = self._size
+        self._size += 1
+        self._names[row] = name
+        self._alive[row] = True
+        self._row_by_name[name] = row
+        record = dict(DEFAULTS, symbol=name)
+        record["current_price"] = fields.get("purchase_price", 0.0)
+        record.update(fields)
+        self._write(row, record)
+        self._touch(name)
+
+    def update(self, name, **fields):
+        """Ändere einzelne Felder eines bestehenden Assets direkt in den Spalten"""
+        self._write(self._row_by_name[name], fields)
+        self._touch(name)
+
+    def remove(self, name):
+        row = self._row_by_name.pop(name)
+        self._unindex_symbol(row)
+        self._alive[row] = False
+        self._names[row] = None
+        self._dead += 1
+        self._touch()
+        self._changed.discard(name)
+        self._priced.discard(name)
+        self._removed.add(name)
+
+    def apply_quotes(self, prices, stale=(), rates=None):
+        """Setze Kurse pro Symbol für alle passenden Zeilen in einem Durchgang
+
+        Mit rates (fx.RateTable) sind die Kurse in dessen Basiswährung und
+        werden in die Währung jeder Zeile umgerechnet.
+        """
+        current = self._columns["current_price"]
+        stale_flags = self._columns["stale"]
+        rows = []
+        values = []
+        for symbol, price in prices.items():
+            for row in self._rows_by_symbol.get(symbol, ()):
+                rows.append(row)
+                values.append(price)
+        if rows:
+            if rates is not None:
+                currencies = [self._value("currency", row) for row in rows]
+                values = np.asarray(values, dtype=np.float64) / rates.factors(currencies)
+            current[rows] = values
+            stale_flags[rows] = False
+        stale_rows = [row for symbol in stale for row in self._rows_by_symbol.get(symbol, ())]
+        if stale_rows:
+            stale_flags[stale_rows] = True
+        if rows or stale_rows:
+            self._touch()
+            # Nur Kurs und stale geändert, die übrigen Felder gehören evtl. einer anderen Session
+            self._priced.update(self._names[rows + stale_rows])
+
+    def pop_changes(self):
+        """Gib seit dem letzten Aufruf geänderte, nur im Kurs geänderte und gelöschte Namen zurück"""
+        changed, priced, removed = self._changed, self._priced - self._changed, self._removed
+        self._changed, self._priced, self._removed = set(), set(), set()
+        return changed, priced, removed
+
+    # Interna
+
+    def _touch(self, name=None):
+        self.version += 1
+        if name is not None:
+            self._changed.add(name)
+            self._removed.discard(name)
+
+    def _value(self, col, row):
+        value = self._columns[col][row]
+        if col in CATEGORY_COLUMNS:
+            return self._categories[col][value] if value >= 0 else None
+        if col in FLOAT_COLUMNS:
+            return float(value)
+        if col in BOOL_COLUMNS:
+            return bool(value)
+        return value
+
+    def _write(self, row, fields):
+        for col, value in fields.items():
+            if col not in self._columns:
+                raise KeyError(f"Unbekanntes Feld: {col}")
+            if col == "symbol":
+                self._unindex_symbol(row)
+                self._columns[col][row] = value
+                self._rows_by_symbol.setdefault(value, set()).add(row)
+            elif col in CATEGORY_COLUMNS:
+                self._columns[col][row] = self._encode(col, value)
+            elif col in FLOAT_COLUMNS:
+                self._columns[col][row] = float(value)
+            elif col == "purchase_date":
+                self._columns[col][row] = "" if _is_missing(value) else str(value)
+            else:
+                self._columns[col][row] = value
+
+    def _encode(self, col, value):
+        if _is_missing(value):
+            return -1
+        value = str(value)
+        codes = self._category_codes[col]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self._categories[col])
+            self._categories[col].append(value)
+        return code
+
+    def _unindex_symbol(self, row):
+        symbol = self._columns["symbol"][row]
+        rows = self._rows_by_symbol.get(symbol)
+        if rows is not None:
+            rows.discard(row)
+            if not rows:
+                del self._rows_by_symbol[symbol]
+
+    def _grow(self):
+        # Erst gelöschte Zeilen entfernen, nur wenn das nicht reicht die Kapazität verdoppeln
+        if self._dead * 2 >= self._size:
+            self._compact()
+            if self._size < len(self._names):
+                return
+        capacity = max(2 * len(self._names), 64)
+        self._names = self._resize(self._names, capacity, None)
+        self._alive = self._resize(self._alive, capacity, False)
+        for col, values in self._columns.items():
+            fill = -1 if col in CATEGORY_COLUMNS else None
+            self._columns[col] = self._resize(values, capacity, fill)
+
+    @staticmethod
+    def _resize(values, capacity, fill):
+        grown = np.empty(capacity, dtype=values.dtype) if fill is None else np.full(capacity, fill, dtype=values.dtype)
+        grown[:len(values)] = values
+        return grown
+
+    def _compact(self):
+        keep = np.flatnonzero(self._alive[:self._size])
+        size = len(keep)
+        self._names[:size] = self._names[keep]
+        self._names[size:] = None
+        self._alive[:size] = True
+        self._alive[size:] = False
+        for values in self._columns.values():
+            values[:size] = values[keep]
+        self._columns["symbol"][size:] = None
+        self._size = size
+        self._dead = 0
+        self._row_by_name = {name: row for row, name in enumerate(self._names[:size])}
+        self._rows_by_symbol = {}
+        for row, symbol in enumerate(self._columns["symbol"][:size]):
+            self._rows_by_symbol.setdefault(symbol, set()).add(row)
+
+    def _build_frame(self):
+        data = {}
+        for col in COLUMNS:
+            values = self.column(col)
+            if col in CATEGORY_COLUMNS:
+                data[col] = pd.Categorical.from_codes(values, categories=self._categories[col])
+            else:
+                data[col] = values.copy()
+        index = pd.Index(self._row_names(), dtype=object)
+        return pd.DataFrame(data, index=index, columns=list(COLUMNS))
+
+    def _build_search_keys(self):
+        # Name und Symbol in Kleinbuchstaben, getrennt durch ein Zeichen, das in keiner Suche vorkommt
+        frame = self.frame()
+        keys = frame.index.to_series().astype(str).str.cat(frame["symbol"].astype(str), sep="\x00")
+        return keys.str.lower().reset_index(drop=True)
+
+    def _build_query(self, text, sort, descending):
+        positions = np.arange(len(self))
+        if text:
+            keys = self.cached("search_keys", PortfolioStore._build_search_keys)
+            positions = positions[keys.str.contains(text, regex=False).to_numpy(dtype=bool)]
+        if sort is not None and len(positions):
+            frame = self.frame()
+            values = frame.index[positions] if sort == "name" else frame[sort].iloc[positions]
+            # Kategorien alphabetisch statt nach Code, fehlende Werte ans Ende
+            if sort in CATEGORY_COLUMNS:
+                values = values.astype(object)
+            order = pd.Series(np.asarray(values)).sort_values(ascending=not descending, kind="stable", na_position="last")
+            positions = positions[order.index.to_numpy()]
+        return positions
+
+    def _row_names(self):
+        names = self._names[:self._size]
+        return names if self._dead == 0 else names[self._alive[:self._size]]
@@ -0,0 +1,302 @@
+"""Austauschbare Kursquellen: CoinGecko, Simulation und lokale Stub-Daten"""
+import json
+import os
+import time
+
+import numpy as np
+import requests
+
+from instrumentation import increment, span
+
+COINGECKO_URL = "https://api.coingecko.com/api/v3"
+
+
+class SymbolTable:
+    """Indizierte Zuordnung Ticker-Symbol -> (Provider, externe ID)"""
+
+    def __init__(self, entries=()):
+        self._index = {}
+        for symbol, provider, external_id in entries:
+            self.add(symbol, provider, external_id)
+
+    @staticmethod
+    def normalize(symbol):
+        return str(symbol).strip().upper()
+
+    def add(self, symbol, provider, external_id):
+        self._index[self.normalize(symbol)] = (provider, external_id)
+
+    def resolve(self, symbol):
+        """Gib (Provider, externe ID) zurück oder None wenn das Symbol unbekannt ist"""
+        return self._index.get(self.normalize(symbol))
+
+    def external_id(self, symbol, provider):
+        entry = self.resolve(symbol)
+        if entry is not None and entry[0] == provider:
+            return entry[1]
+        return None
+
+    def __contains__(self, symbol):
+        return self.normalize(symbol) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+
+# Bekannte Kryptowährungen mit ihrer CoinGecko-ID
+_COINGECKO_COINS = {
+    "BTC": "bitcoin",
+    "XBT": "bitcoin",
+    "ETH": "ethereum",
+    "XRP": "ripple",
+    "LTC": "litecoin",
+    "ADA": "cardano",
+    "SOL": "solana",
+    "DOT": "polkadot",
+    "DOGE": "dogecoin",
+    "AVAX": "avalanche-2",
+    "LINK": "chainlink",
+    "LNK": "chainlink",
+    "XLM": "stellar",
+    "MATIC": "matic-network",
+    "BNB": "binancecoin",
+    "TRX": "tron",
+    "BCH": "bitcoin-cash",
+    "ATOM": "cosmos",
+    "UNI": "uniswap",
+    "ALGO": "algorand",
+}
+
+SYMBOL_TABLE = SymbolTable(
+    [(f"{ticker}-USD", "coingecko", coin_id) for ticker, coin_id in _COINGECKO_COINS.items()]
+    + [(ticker, "coingecko", coin_id) for ticker, coin_id in _COINGECKO_COINS.items()]
+)
+
+
+class QuoteProvider:
+    """Basisklasse für Kursquellen, nutzbar als Quelle für refresh.refresh_quotes"""
+
+    name = "base"
+    quote_currency = "usd"
+
+    def __init__(self, timeout=10.0, batch_size=100):
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+    def supports(self, symbol):
+        return True
+
+    def fetch(self, symbols, timeout=None):
+        """Gib {symbol: Kurs} für die Symbole zurück, die gefunden wurden"""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+
+class CoinGeckoProvider(QuoteProvider):
+    """CoinGecko-kompatible HTTP-Quelle, base_url kann auf einen lokalen Stub zeigen"""
+
+    name = "coingecko"
+
+    def __init__(self, base_url=COINGECKO_URL, quote_currency="usd", symbol_table=SYMBOL_TABLE,
+                 timeout=10.0, batch_size=100):
+        super().__init__(timeout=timeout, batch_size=batch_size)
+        self.base_url = base_url.rstrip("/")
+        self.quote_currency = quote_currency
+        self.symbol_table = symbol_table
+        self._session = requests.Session()
+
+    def supports(self, symbol):
+        return self.symbol_table.external_id(symbol, self.name) is not None
+
+    def fetch(self, symbols, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        ids_by_symbol = {}
+        for symbol in set(symbols):
+            coin_id = self.symbol_table.external_id(symbol, self.name)
+            if coin_id is not None:
+                ids_by_symbol[symbol] = coin_id
+        ids = sorted(set(ids_by_symbol.values()))
+        quotes = {}
+
+        # Eine Anfrage pro Block statt einer pro Asset
+        for start in range(0, len(ids), self.batch_size):
+            chunk = ids[start:start + self.batch_size]
+            try:
+                with span("quote_request"):
+                    response = self._session.get(
+                        f"{self.base_url}/simple/price",
+                        params={"ids": ",".join(chunk), "vs_currencies": self.quote_currency},
+                        timeout=timeout
+                    )
+                    response.raise_for_status()
+                    data = response.json()
+            except requests.HTTPError as e:
+                if e.response is not None and e.response.status_code == 429:
+                    increment("upstream_rate_limited_total", provider=self.name)
+                else:
+                    increment("upstream_errors_total", provider=self.name)
+                continue
+            except Exception:
+                increment("upstream_errors_total", provider=self.name)
+                continue
+            for coin_id in chunk:
+                price = data.get(coin_id, {}).get(self.quote_currency)
+                if price is not None:
+                    quotes[coin_id] = price
+
+        return {s: quotes[coin_id] for s, coin_id in ids_by_symbol.items() if coin_id in quotes}
+
+
+# Volatilität pro Basis-Ticker, alle anderen nutzen DEFAULT_VOLATILITY
+VOLATILITY_BY_TICKER = {
+    "AAPL": 0.08,  # Apple ist relativ stabil
+    "TSLA": 0.15,  # Tesla ist volatiler
+    "NVDA": 0.12,  # NVIDIA ist mittel volatil
+}
+DEFAULT_VOLATILITY = 0.10
+
+
+def base_ticker(symbol):
+    """Reduziere 'NESN.SW' oder 'BTC-USD' auf den Basis-Ticker"""
+    return str(symbol).split(".")[0].split("-")[0].upper()
+
+
+def volatility_for(symbol):
+    return VOLATILITY_BY_TICKER.get(base_ticker(symbol), DEFAULT_VOLATILITY)
+
+
+# Funktion zum Simulieren von Aktienpreisen basierend auf historischen Trends
+def simulate_stock_price(symbol, purchase_price):
+    """Simuliere realistische Aktienpreise basierend auf dem Kaufpreis"""
+    # Zufällige Preisänderung basierend auf Volatilität
+    change_percent = np.random.normal(0, volatility_for(symbol))
+    new_price = purchase_price * (1 + change_percent)
+
+    # Sicherstellen, dass der Preis nicht negativ wird
+    return max(new_price, purchase_price * 0.5)
+
+
+def simulate_prices(symbols, reference_prices, rng=np.random):
+    """simulate_stock_price für viele Symbole mit einer einzigen Ziehung"""
+    reference = np.asarray(reference_prices, dtype=np.float64)
+    vols = np.array([volatility_for(s) for s in symbols], dtype=np.float64)
+    new_prices = reference * (1 + rng.normal(0, 1, len(reference)) * vols)
+    return np.maximum(new_prices, reference * 0.5)
+
+
+class SimulationProvider(QuoteProvider):
+    """Simulierte Kurse rund um einen Referenzpreis (z.B. den Kaufpreis)"""
+
+    name = "simulation"
+
+    def __init__(self, reference_prices, timeout=1.0, batch_size=1000):
+        super().__init__(timeout=timeout, batch_size=batch_size)
+        self.reference_prices = reference_prices
+
+    def supports(self, symbol):
+        return symbol in self.reference_prices
+
+    def fetch(self, symbols, timeout=None):
+        symbols = [s for s in symbols if s in self.reference_prices]
+        prices = simulate_prices(symbols, [self.reference_prices[s] for s in symbols])
+        return dict(zip(symbols, prices.tolist()))
+
+
+class FileQuoteProvider(QuoteProvider):
+    """Kurse aus einer lokalen JSON-Datei {symbol: Kurs}, neu gelesen bei Änderung
+
+    fetch prüft die Datei einmal pro Abruf, supports höchstens alle
+    check_interval Sekunden statt bei jedem Symbol. Eine fehlende Datei
+    bedeutet: keine Kurse, kein Symbol wird unterstützt.
+    """
+
+    name = "file"
+
+    def __init__(self, path, quote_currency="usd", timeout=1.0, batch_size=1000, check_interval=1.0):
+        super().__init__(timeout=timeout, batch_size=batch_size)
+        self.path = path
+        self.quote_currency = quote_currency
+        self.check_interval = check_interval
+        self._mtime = None
+        self._checked = None
+        self._quotes = {}
+
+    def _load(self, force=False):
+        now = time.monotonic()
+        if not force and self._checked is not None and now - self._checked < self.check_interval:
+            return self._quotes
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._mtime, self._quotes = None, {}
+            return self._quotes
+        if mtime != self._mtime:
+            with open(self.path, encoding="utf-8") as f:
+                self._quotes = {SymbolTable.normalize(k): float(v) for k, v in json.load(f).items()}
+            self._mtime = mtime
+        return self._quotes
+
+    def supports(self, symbol):
+        return SymbolTable.normalize(symbol) in self._load()
+
+    def fetch(self, symbols, timeout=None):
+        quotes = self._load(force=True)
+        return {s: quotes[SymbolTable.normalize(s)] for s in symbols if SymbolTable.normalize(s) in quotes}
+
+
+class CachedProvider(QuoteProvider):
+    """Liest die Kurse eines Providers durch einen quote_cache.QuoteCache"""
+
+    def __init__(self, provider, cache):
+        super().__init__(timeout=provider.timeout, batch_size=provider.batch_size)
+        self.provider = provider
+        self.cache = cache
+        self.name = provider.name
+        self.quote_currency = provider.quote_currency
+
+    def supports(self, symbol):
+        return self.provider.supports(symbol)
+
+    @span("get_crypto_price")
+    def fetch(self, symbols, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        return self.cache.get_many(
+            [s for s in symbols if self.provider.supports(s)],
+            self.quote_currency,
+            lambda missing: self.provider.fetch(missing, timeout),
+            wait_timeout=timeout
+        )
+
+
+# Auswahl der Live-Kursquelle über ihren Namen
+PROVIDERS = {
+    "coingecko": CoinGeckoProvider,
+    "file": FileQuoteProvider,
+}
+
+
+def build_provider(name, **options):
+    """Erzeuge einen Provider aus PROVIDERS, z.B. build_provider('file', path='quotes.json')"""
+    try:
+        provider_class = PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f"Unbekannter Kurs-Provider: {name}") from None
+    return provider_class(**options)
+
+
+def route_symbols(assets, live_provider, simulation_provider):
+    """Verteile (symbol, typ)-Paare auf die zuständigen Provider
+
+    Krypto-Assets gehen an die Live-Quelle, sofern sie das Symbol kennt,
+    alles andere an die Simulation.
+    """
+    assignments = {live_provider: [], simulation_provider: []}
+    for symbol, asset_type in assets:
+        if asset_type == "Krypto" and live_provider.supports(symbol):
+            assignments[live_provider].append(symbol)
+        else:
+            assignments[simulation_provider].append(symbol)
+    return {p: symbols for p, symbols in assignments.items() if symbols}
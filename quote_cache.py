@@ -0,0 +1,113 @@
+"""Prozessweiter Kurs-Cache mit TTL, LRU-Verdrängung und gebündelten Abrufen"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class _Flight:
+    """Laufender Abruf eines Symbols, auf den weitere Anfragen warten"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.price = None
+
+
+class QuoteCache:
+    """Thread-sicherer Cache für Kurse, Schlüssel ist (Symbol, Währung)"""
+
+    def __init__(self, ttl=60.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reset_stats(self):
+        """Treffer und Fehlzugriffe auf 0 setzen (instrumentation.Metrics.reset)"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, symbol, currency):
+        """Gib einen gültigen Kurs aus dem Cache zurück oder None"""
+        with self._lock:
+            return self._lookup((symbol, currency), time.monotonic())
+
+    def put(self, symbol, currency, price):
+        """Lege einen Kurs im Cache ab"""
+        with self._lock:
+            self._store((symbol, currency), price, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_many(self, symbols, currency, fetch, wait_timeout=None):
+        """Lies Kurse durch den Cache, fehlende werden über fetch(symbols) nachgeladen
+
+        Laufen für ein Symbol bereits Abrufe in einem anderen Thread, wird auf deren
+        Ergebnis gewartet statt einen zweiten Upstream-Request abzusetzen.
+        """
+        results = {}
+        to_fetch = []
+        waiting = {}
+        now = time.monotonic()
+
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                key = (symbol, currency)
+                price = self._lookup(key, now)
+                if price is not None:
+                    results[symbol] = price
+                elif key in self._inflight:
+                    waiting[symbol] = self._inflight[key]
+                else:
+                    self.misses += 1
+                    self._inflight[key] = _Flight()
+                    to_fetch.append(symbol)
+
+        if to_fetch:
+            fetched = {}
+            try:
+                fetched = fetch(to_fetch)
+            finally:
+                # Wartende Threads immer freigeben, auch wenn der Abruf fehlschlägt
+                with self._lock:
+                    now = time.monotonic()
+                    for symbol in to_fetch:
+                        key = (symbol, currency)
+                        flight = self._inflight.pop(key)
+                        flight.price = fetched.get(symbol)
+                        if flight.price is not None:
+                            self._store(key, flight.price, now)
+                        flight.event.set()
+            results.update({s: fetched[s] for s in to_fetch if fetched.get(s) is not None})
+
+        for symbol, flight in waiting.items():
+            if flight.event.wait(wait_timeout) and flight.price is not None:
+                results[symbol] = flight.price
+
+        return results
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        price, expires = entry
+        if expires <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return price
+
+    def _store(self, key, price, now):
+        self._entries[key] = (price, now + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,221 @@
+"""Umschichtung auf Zielgewichte pro Asset, Typ, Sektor oder Währung mit möglichst wenigen Trades
+
+Gesucht ist die Trade-Liste mit dem kleinsten Umschlag, die die Zielgewichte
+erreicht. Das zugehörige lineare Programm (minimiere Summe |Trade| unter den
+Gruppenzielen und dem Budget) zerfällt in unabhängige Gruppen, deren Lösung
+direkt feststeht: pro Gruppe wird nur gekauft oder nur verkauft, und jede
+Aufteilung innerhalb der Gruppe kostet gleich viel. Gewählt wird die
+Eckenlösung mit den wenigsten Trades, verkauft wird aus den grössten
+Positionen zuerst, gekauft nur die grösste Position der Gruppe. Alles
+läuft vektorisiert über die Spalten des Portfolios, auch bei tausenden Positionen.
+
+Nebenbedingungen: Handelseinheiten (lot_size), Gebühren pro Trade (fix und
+proportional), Mindestgrösse eines Trades und Assets, die nicht verkauft
+werden dürfen (no_sell).
+"""
+import numpy as np
+import pandas as pd
+
+from ledger import BUY, SELL
+
+# Gruppe für Assets ohne Typ, Sektor oder Währung
+MISSING_GROUP = "Nicht angegeben"
+# Rechenungenauigkeit, unterhalb der Beträge als 0 gelten
+EPSILON = 1e-9
+
+
+class RebalancePlan:
+    """Trade-Liste mit Gewichten vor und nach der Umschichtung"""
+
+    def __init__(self, trades, groups, cash, unreachable):
+        self.trades = trades
+        self.groups = groups
+        self.cash = float(cash)
+        self.unreachable = unreachable
+
+    def __len__(self):
+        return len(self.trades)
+
+    @property
+    def turnover(self):
+        return float(self.trades["value"].abs().sum())
+
+    @property
+    def fees(self):
+        return float(self.trades["fee"].sum())
+
+    @property
+    def max_deviation(self):
+        """Grösste Abweichung vom Zielgewicht nach der Umschichtung"""
+        return float((self.groups["new_weight"] - self.groups["target_weight"]).abs().max()) if len(self.groups) else 0.0
+
+
+def normalize_targets(targets):
+    """Zielgewichte als Series mit Summe 1, negative Gewichte lösen ValueError aus"""
+    weights = pd.Series(targets, dtype=np.float64).fillna(0.0)
+    if (weights < 0).any():
+        raise ValueError("Zielgewichte dürfen nicht negativ sein")
+    total = weights.sum()
+    if not total > 0:
+        raise ValueError("Die Summe der Zielgewichte muss positiv sein")
+    return weights / total
+
+
+def group_keys(frame, by=None):
+    """Gruppe jedes Assets: der Name (by=None) oder die Spalte by"""
+    if by is None:
+        return pd.Index(frame.index.astype(str))
+    return pd.Index(frame[by].astype(object).fillna(MISSING_GROUP).astype(str))
+
+
+def _lots(frame, lot_size):
+    if lot_size is None:
+        return np.zeros(len(frame))
+    if isinstance(lot_size, dict):
+        return frame.index.map(lambda name: lot_size.get(name, 0.0)).to_numpy(dtype=np.float64)
+    return np.full(len(frame), float(lot_size))
+
+
+def _group_trades(codes, values, targets, total, sellable, buyable, n_groups):
+    """Soll-Änderung pro Gruppe, begrenzt durch verkaufbare Bestände und kaufbare Assets"""
+    current = np.bincount(codes, weights=values, minlength=n_groups)
+    delta = targets * total - current
+    capacity = np.bincount(codes, weights=np.where(sellable, values, 0.0), minlength=n_groups)
+    can_buy = np.bincount(codes, weights=buyable, minlength=n_groups) > 0
+    sells = np.minimum(np.maximum(-delta, 0.0), capacity)
+    buys = np.where(can_buy, np.maximum(delta, 0.0), 0.0)
+    return sells, buys
+
+
+def _distribute(codes, values, sells, buys, sellable, buyable):
+    """Verteile die Gruppen-Trades auf Assets: Verkäufe aus den grössten Positionen, Kauf der grössten"""
+    trade = np.zeros(len(values))
+    # Nach Gruppe und absteigendem Wert sortiert, innerhalb der Gruppe kumuliert
+    order = np.lexsort((-values, codes))
+    sorted_codes = codes[order]
+    available = np.where(sellable, values, 0.0)[order]
+    cumulative = np.cumsum(available)
+    group_start = np.r_[0, np.flatnonzero(np.diff(sorted_codes)) + 1]
+    before = (cumulative - available) - np.repeat(cumulative[group_start] - available[group_start],
+                                                  np.diff(np.r_[group_start, len(order)]))
+    trade[order] -= np.clip(sells[sorted_codes] - before, 0.0, available)
+
+    # Kauf: erste kaufbare Position jeder Gruppe in der Sortierung, also die grösste
+    candidates = order[buyable[order]]
+    groups, first = np.unique(codes[candidates], return_index=True)
+    trade[candidates[first]] += buys[groups]
+    return trade
+
+
+def _round_lots(quantity, lots, held):
+    """Runde auf die nächste ganze Handelseinheit, Verkäufe höchstens bis zum Bestand
+
+    Ein vollständiger Verkauf bleibt exakt. Käufe, die nach dem Runden das
+    Budget übersteigen, kürzt rebalance() danach wieder.
+    """
+    rounded = np.where(lots > 0, np.round(quantity / np.where(lots > 0, lots, 1.0)) * lots, quantity)
+    rounded = np.maximum(rounded, -held)
+    sell_all = (quantity < 0) & np.isclose(-quantity, held)
+    return np.where(sell_all, -held, rounded)
+
+
+def rebalance(frame, targets, by=None, rates=None, cash=0.0, lot_size=None,
+              fee_rate=0.0, fee_fixed=0.0, min_trade=0.0, no_sell=()):
+    """Trades, die frame (PortfolioStore.frame()) auf die Zielgewichte targets bringen
+
+    targets ordnet Gruppen (Asset-Namen bei by=None, sonst Werte der Spalte
+    by) ein Gewicht zu, fehlende Gruppen werden vollständig verkauft. cash
+    ist zusätzlich investierbares Geld in der Basiswährung von rates
+    (negativ = Entnahme). lot_size ist eine Zahl oder {Asset: Einheit},
+    0/None erlaubt Bruchteile. no_sell enthält Asset-Namen oder Symbole.
+
+    Gruppen mit Zielgewicht ohne kaufbares Asset landen in
+    RebalancePlan.unreachable, ihr Gewicht wird auf die übrigen verteilt.
+    """
+    weights = normalize_targets(targets)
+    if fee_rate < 0 or fee_fixed < 0 or min_trade < 0:
+        raise ValueError("Gebühren und Mindestgrösse dürfen nicht negativ sein")
+
+    quantity = frame["quantity"].to_numpy(dtype=np.float64)
+    price = frame["current_price"].to_numpy(dtype=np.float64)
+    factors = rates.factors(frame["currency"]) if rates is not None and len(frame) else np.ones(len(frame))
+    base_price = price * factors
+    values = quantity * base_price
+    # Ohne Kurs lässt sich keine Menge berechnen, solche Positionen bleiben unverändert
+    tradable = base_price > 0
+    locked = frame.index.isin(list(no_sell)) | frame["symbol"].isin(list(no_sell)).to_numpy()
+    sellable = tradable & ~locked & (quantity > 0)
+    buyable = tradable
+
+    keys = group_keys(frame, by)
+    codes, groups = pd.factorize(keys)
+    groups = pd.Index(groups)
+    can_buy = pd.Series(np.bincount(codes, weights=buyable, minlength=len(groups)) > 0, index=groups)
+    reachable = weights[can_buy.reindex(weights.index, fill_value=False).to_numpy()]
+    unreachable = [str(g) for g in weights.index[weights > 0] if g not in reachable.index]
+    if not reachable.sum() > 0:
+        raise ValueError("Keine der Zielgruppen enthält ein handelbares Asset")
+    target = (reachable / reachable.sum()).reindex(groups, fill_value=0.0).to_numpy()
+
+    # Zweiter Durchgang mit den Gebühren des ersten, damit die Ziele nach Gebühren stimmen
+    fees = 0.0
+    for _ in range(2):
+        total = values.sum() + cash - fees
+        sells, buys = _group_trades(codes, values, target, total, sellable, buyable, len(groups))
+        # Käufe nur so weit, wie Verkaufserlös und cash nach Gebühren reichen
+        budget = cash + sells.sum() * (1 - fee_rate) - fee_fixed * np.count_nonzero(sells > EPSILON)
+        need = buys.sum() * (1 + fee_rate) + fee_fixed * np.count_nonzero(buys > EPSILON)
+        if need > budget:
+            buys = buys * max(budget - fee_fixed * np.count_nonzero(buys > EPSILON), 0.0) / (buys.sum() * (1 + fee_rate))
+        trade = _distribute(codes, values, sells, buys, sellable, buyable)
+        fees = fee_rate * np.abs(trade).sum() + fee_fixed * np.count_nonzero(np.abs(trade) > EPSILON)
+
+    # In Stück umrechnen, auf Handelseinheiten runden und zu kleine Trades verwerfen
+    lots = _lots(frame, lot_size)
+    units = _round_lots(np.divide(trade, base_price, out=np.zeros(len(trade)), where=tradable), lots, quantity)
+    units[np.abs(units * base_price) < max(min_trade, EPSILON)] = 0.0
+
+    # Durch Rundung fehlendes Geld bei den grössten Käufen einsparen
+    def shortfall():
+        value = units * base_price
+        fee = fee_rate * np.abs(value).sum() + fee_fixed * np.count_nonzero(units)
+        return value.sum() + fee - cash
+
+    for i in np.argsort(-(units * base_price)):
+        missing = shortfall()
+        if missing <= EPSILON or units[i] <= 0:
+            break
+        step = lots[i] if lots[i] > 0 else 0.0
+        reduce = missing / (base_price[i] * (1 + fee_rate))
+        reduce = np.ceil(reduce / step) * step if step else reduce
+        units[i] = max(units[i] - reduce, 0.0)
+        if units[i] * base_price[i] < min_trade:
+            units[i] = 0.0
+
+    value = units * base_price
+    fee = np.where(units != 0, fee_fixed + fee_rate * np.abs(value), 0.0)
+    traded = np.flatnonzero(units)
+    trades = pd.DataFrame({
+        "symbol": frame["symbol"].to_numpy()[traded],
+        "kind": np.where(units[traded] > 0, BUY, SELL),
+        "quantity": np.abs(units[traded]),
+        "price": price[traded],
+        "currency": frame["currency"].astype(object).to_numpy()[traded],
+        "value": value[traded],
+        "fee": fee[traded],
+    }, index=frame.index[traded])
+    # Verkäufe zuerst, sie finanzieren die Käufe
+    trades = trades.sort_values(["kind", "value"], key=lambda col: col.map({SELL: 0, BUY: 1}) if col.name == "kind" else col.abs(),
+                                ascending=[True, False], kind="stable")
+
+    after = values + value
+    total_before = values.sum()
+    total_after = after.sum()
+    current = np.bincount(codes, weights=values, minlength=len(groups))
+    new = np.bincount(codes, weights=after, minlength=len(groups))
+    group_frame = pd.DataFrame({
+        "current_weight": current / total_before if total_before > 0 else 0.0,
+        "target_weight": target,
+        "new_weight": new / total_after if total_after > 0 else 0.0,
+    }, index=groups)
+    return RebalancePlan(trades, group_frame, cash - value.sum() - fee.sum(), unreachable)
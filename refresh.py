@@ -0,0 +1,95 @@
+"""Nebenläufige Preisaktualisierung mit Timeouts pro Quelle und globaler Deadline"""
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
+
+from instrumentation import increment
+
+# Gemeinsamer Thread-Pool für alle Aktualisierungen im Prozess
+MAX_WORKERS = 16
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="price-refresh")
+
+# Standard-Deadline für eine komplette Aktualisierung in Sekunden
+DEFAULT_DEADLINE = 12.0
+
+
+class QuoteSource:
+    """Preisquelle mit eigenem Timeout und maximaler Blockgröße pro Abruf"""
+
+    def __init__(self, name, fetch, timeout=10.0, batch_size=100):
+        # fetch(symbols, timeout) -> {symbol: price}
+        self.name = name
+        self.fetch = fetch
+        self.timeout = timeout
+        self.batch_size = batch_size
+
+    def __repr__(self):
+        return f"QuoteSource({self.name!r})"
+
+
+class RefreshResult:
+    """Ergebnis einer Aktualisierung: gefundene Preise und veraltete Symbole"""
+
+    def __init__(self):
+        self.prices = {}
+        self.stale = set()
+        self.errors = {}
+
+
+def refresh_quotes(assignments, deadline=DEFAULT_DEADLINE, on_progress=None):
+    """Frage alle Quellen parallel ab und sammle die Preise bis zur Deadline
+
+    assignments: {Quelle: [symbol, ...]}, Quelle ist eine QuoteSource oder ein
+    providers.QuoteProvider (beide haben name, timeout, batch_size und fetch)
+    on_progress(done, total): wird nach jedem abgeschlossenen Block aufgerufen
+    """
+    result = RefreshResult()
+    started = time.monotonic()
+    global_deadline = started + deadline
+
+    # Symbole pro Quelle in Blöcke aufteilen und gleichzeitig abfragen
+    jobs = {}
+    total = 0
+    for source, symbols in assignments.items():
+        symbols = list(dict.fromkeys(symbols))
+        for start in range(0, len(symbols), source.batch_size):
+            chunk = symbols[start:start + source.batch_size]
+            future = _executor.submit(source.fetch, chunk, source.timeout)
+            jobs[future] = (source, chunk, min(started + source.timeout, global_deadline))
+            total += len(chunk)
+
+    done_count = 0
+    if on_progress is not None and total == 0:
+        on_progress(0, 0)
+
+    pending = set(jobs)
+    while pending:
+        now = time.monotonic()
+        next_deadline = min(jobs[f][2] for f in pending)
+        finished, pending = wait(pending, timeout=max(next_deadline - now, 0), return_when=FIRST_COMPLETED)
+
+        for future in finished:
+            source, chunk, _ = jobs[future]
+            try:
+                result.prices.update(future.result())
+            except Exception as e:
+                increment("refresh_errors_total", source=source.name)
+                result.errors[source.name] = str(e)
+                result.stale.update(chunk)
+            done_count += len(chunk)
+            if on_progress is not None:
+                on_progress(done_count, total)
+
+        # Blöcke über ihrem Timeout aufgeben, sie behalten ihren letzten Preis
+        now = time.monotonic()
+        for future in [f for f in pending if jobs[f][2] <= now]:
+            source, chunk, _ = jobs[future]
+            future.cancel()
+            increment("refresh_timeouts_total", source=source.name)
+            result.errors[source.name] = "Timeout"
+            result.stale.update(chunk)
+            pending.discard(future)
+            done_count += len(chunk)
+            if on_progress is not None:
+                on_progress(done_count, total)
+
+    return result
@@ -0,0 +1,150 @@
+"""Prozessweite Hintergrund-Aktualisierung der Live-Kurse mit Backoff bei Fehlern
+
+Sessions melden ihre Live-Symbole mit watch() an und lesen das Ergebnis aus
+PriceScheduler.snapshot, ohne auf die Quelle zu warten. Pro Intervall gibt
+es genau eine Abfrage für die Vereinigung aller angemeldeten Symbole.
+"""
+from datetime import datetime
+import random
+import threading
+import weakref
+
+from instrumentation import METRICS, increment, span
+from refresh import refresh_quotes
+
+# Standard-Intervall zwischen zwei Aktualisierungen in Sekunden
+DEFAULT_INTERVAL = 300.0
+# Längste Wartezeit nach wiederholten Fehlern, als Vielfaches des Intervalls
+MAX_BACKOFF_FACTOR = 16
+# Zufällige Streuung der Wartezeit, damit mehrere Prozesse nicht gleichzeitig abfragen
+JITTER = 0.1
+
+
+class PriceSnapshot:
+    """Unveränderlicher Stand der Live-Kurse, wird als Ganzes ersetzt"""
+
+    def __init__(self, version=0, prices=None, stale=frozenset(), updated_at=None, errors=None):
+        self.version = version
+        self.prices = prices or {}
+        self.stale = stale
+        self.updated_at = updated_at
+        self.errors = errors or {}
+
+    def __len__(self):
+        return len(self.prices)
+
+
+class PriceScheduler:
+    """Ein Hintergrund-Thread, der alle angemeldeten Symbole im Intervall abfragt
+
+    Bei Fehlern verdoppelt sich die Wartezeit bis interval * MAX_BACKOFF_FACTOR,
+    nach dem ersten erfolgreichen Lauf gilt wieder das normale Intervall.
+    """
+
+    def __init__(self, provider, interval=DEFAULT_INTERVAL, max_backoff=None, deadline=None):
+        self.provider = provider
+        self.interval = interval
+        self.max_backoff = max_backoff if max_backoff is not None else interval * MAX_BACKOFF_FACTOR
+        self.deadline = deadline if deadline is not None else provider.timeout + 2.0
+        self.snapshot = PriceSnapshot()
+        self.failures = 0
+        self.next_run = None
+        # Anmeldungen verschwinden mit ihrem Besitzer (z.B. der Engine einer beendeten Session)
+        self._watchers = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        METRICS.register_gauge("scheduler_backoff_seconds", self.delay)
+        METRICS.register_gauge("scheduler_symbols", lambda: len(self.symbols()))
+
+    # Anmeldung
+
+    def watch(self, owner, symbols):
+        """Ersetze die Symbole von owner, neue Symbole lösen sofort eine Aktualisierung aus"""
+        symbols = frozenset(symbols)
+        with self._lock:
+            if self._watchers.get(owner) == symbols:
+                return
+            self._watchers[owner] = symbols
+        # Während des Backoffs nicht vorziehen, sonst würde jede neue Session die Quelle erneut belasten
+        if not self.failures and not symbols <= self.snapshot.prices.keys():
+            self.trigger()
+
+    def unwatch(self, owner):
+        with self._lock:
+            self._watchers.pop(owner, None)
+
+    def symbols(self):
+        """Vereinigung aller angemeldeten Symbole"""
+        with self._lock:
+            watched = list(self._watchers.values())
+        return frozenset().union(*watched)
+
+    # Steuerung
+
+    def start(self):
+        """Starte den Thread, mehrfache Aufrufe sind unschädlich"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return self
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._loop, name="price-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def trigger(self):
+        """Nächste Aktualisierung sofort statt nach Ablauf des Intervalls"""
+        self._wake.set()
+
+    def delay(self):
+        """Wartezeit bis zur nächsten Aktualisierung ohne Streuung"""
+        if not self.failures:
+            return self.interval
+        return min(self.interval * 2 ** self.failures, self.max_backoff)
+
+    # Aktualisierung
+
+    def run_once(self):
+        """Frage alle angemeldeten Symbole ab und veröffentliche einen neuen Snapshot"""
+        symbols = sorted(self.symbols())
+        if not symbols:
+            return self.snapshot
+        with span("scheduler.refresh"):
+            try:
+                result = refresh_quotes({self.provider: symbols}, deadline=self.deadline)
+                errors = result.errors
+                failed = bool(errors) or not result.prices
+            except Exception as e:
+                result, errors, failed = None, {self.provider.name: str(e)}, True
+
+        # Nicht mehr angemeldete Symbole fallen aus dem Snapshot
+        previous = self.snapshot
+        prices = {s: previous.prices[s] for s in symbols if s in previous.prices}
+        if result is not None:
+            prices.update(result.prices)
+        # Was diesmal keinen Kurs bekam, behält den letzten und gilt als veraltet
+        stale = frozenset(s for s in symbols if result is None or s not in result.prices)
+        self.snapshot = PriceSnapshot(previous.version + 1, prices, stale, datetime.now(), errors)
+
+        if failed:
+            self.failures += 1
+            increment("scheduler_failures_total")
+        else:
+            self.failures = 0
+        increment("scheduler_runs_total")
+        return self.snapshot
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self.run_once()
+            delay = self.delay() * random.uniform(1 - JITTER, 1 + JITTER)
+            self.next_run = datetime.now().timestamp() + delay
+            self._wake.wait(delay)
+            self._wake.clear()
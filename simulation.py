@@ -0,0 +1,135 @@
+"""Monte-Carlo-Simulation des Portfoliowerts für Value-at-Risk und Expected Shortfall"""
+import numpy as np
+import pandas as pd
+
+from providers import volatility_for
+
+# Speicher pro Block der Zufallszahlen, grössere Läufe werden in Blöcken gerechnet
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+# Anzahl Pfade, die für die Grafik vollständig aufbewahrt werden
+DEFAULT_SAMPLE_PATHS = 50
+
+
+def volatilities(symbols):
+    """Volatilität pro Symbol, nachgeschlagen einmal pro eindeutigem Symbol"""
+    codes, uniques = pd.factorize(pd.Series(symbols, dtype=object))
+    lookup = np.array([volatility_for(s) for s in uniques] + [0.0], dtype=np.float64)
+    return lookup[codes]
+
+
+def covariance_matrix(vols, correlation=0.0):
+    """Kovarianz aus Volatilitäten und einer Korrelationsmatrix (oder einem einheitlichen Wert)"""
+    vols = np.asarray(vols, dtype=np.float64)
+    if np.isscalar(correlation):
+        corr = np.full((len(vols), len(vols)), float(correlation))
+        np.fill_diagonal(corr, 1.0)
+    else:
+        corr = np.asarray(correlation, dtype=np.float64)
+    return corr * np.outer(vols, vols)
+
+
+def cholesky_factor(covariance):
+    """Untere Dreiecksmatrix L mit L @ L.T = covariance, numerisch leicht stabilisiert"""
+    covariance = np.asarray(covariance, dtype=np.float64)
+    try:
+        return np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        # Nicht positiv definit (z.B. aus lückenhaften Daten geschätzt): Eigenwerte nach unten begrenzen
+        eigenvalues, vectors = np.linalg.eigh(covariance)
+        floor = max(eigenvalues.max(), 1.0) * 1e-10
+        repaired = (vectors * np.maximum(eigenvalues, floor)) @ vectors.T
+        return np.linalg.cholesky((repaired + repaired.T) / 2)
+
+
+class SimulationResult:
+    """Endwerte aller Pfade und eine Stichprobe vollständiger Pfade"""
+
+    def __init__(self, initial_value, terminal_values, sample_paths):
+        self.initial_value = float(initial_value)
+        self.terminal_values = terminal_values
+        self.sample_paths = sample_paths
+
+    def __len__(self):
+        return len(self.terminal_values)
+
+    @property
+    def pnl(self):
+        return self.terminal_values - self.initial_value
+
+    def value_at_risk(self, level=0.95):
+        """Verlust, der mit Wahrscheinlichkeit level nicht überschritten wird (positiv = Verlust)"""
+        return float(-np.quantile(self.pnl, 1 - level))
+
+    def expected_shortfall(self, level=0.95):
+        """Durchschnittlicher Verlust in den schlechtesten (1 - level) der Pfade"""
+        pnl = np.sort(self.pnl)
+        tail = max(int(np.ceil(len(pnl) * (1 - level))), 1)
+        return float(-pnl[:tail].mean())
+
+
+class MonteCarloSimulator:
+    """Geometrische Brownsche Bewegung für alle Assets gleichzeitig
+
+    Ein Schritt entspricht einer Kursaktualisierung von simulate_stock_price,
+    die Schocks sind über die Cholesky-Zerlegung der Kovarianz korreliert.
+    """
+
+    def __init__(self, values, vols, correlation=0.0, drift=0.0, seed=None):
+        self.values = np.asarray(values, dtype=np.float64)
+        covariance = covariance_matrix(vols, correlation)
+        self.cholesky = cholesky_factor(covariance)
+        # Ito-Korrektur, damit der erwartete Wert ohne Drift konstant bleibt
+        self.log_drift = drift - 0.5 * np.diag(covariance)
+        self.rng = np.random.default_rng(seed)
+
+    def chunk_size(self, steps, memory_budget=DEFAULT_MEMORY_BUDGET):
+        # Zufallszahlen und korrelierte Schocks liegen gleichzeitig im Speicher
+        per_path = 2 * steps * max(len(self.values), 1) * 8
+        return max(int(memory_budget // per_path), 1)
+
+    def iter_paths(self, n_paths, steps, memory_budget=DEFAULT_MEMORY_BUDGET):
+        """Portfoliowerte pro Pfad und Schritt, blockweise als Arrays (Pfade, steps)
+
+        Mit gleichem Seed ist das Ergebnis unabhängig von der Blockgrösse.
+        """
+        chunk = self.chunk_size(steps, memory_budget)
+        for start in range(0, n_paths, chunk):
+            size = min(chunk, n_paths - start)
+            normals = self.rng.standard_normal((size * steps, len(self.values)))
+            shocks = (normals @ self.cholesky.T).reshape(size, steps, len(self.values))
+            del normals
+            shocks += self.log_drift
+            np.cumsum(shocks, axis=1, out=shocks)
+            np.exp(shocks, out=shocks)
+            values = shocks @ self.values
+            del shocks
+            yield values
+
+    def run(self, n_paths, steps, memory_budget=DEFAULT_MEMORY_BUDGET, sample_paths=DEFAULT_SAMPLE_PATHS):
+        terminal = np.empty(n_paths, dtype=np.float64)
+        samples = []
+        kept = 0
+        offset = 0
+        for paths in self.iter_paths(n_paths, steps, memory_budget):
+            terminal[offset:offset + len(paths)] = paths[:, -1]
+            offset += len(paths)
+            if kept < sample_paths:
+                samples.append(paths[:sample_paths - kept].copy())
+                kept += len(samples[-1])
+        initial = self.values.sum()
+        sample = np.concatenate(samples) if samples else np.empty((0, steps))
+        # Startwert voranstellen, damit die Pfade bei Schritt 0 beginnen
+        sample = np.hstack([np.full((len(sample), 1), initial), sample])
+        return SimulationResult(initial, terminal, sample)
+
+
+def simulate_portfolio(frame, value_column, n_paths=10_000, steps=10, correlation=0.0, seed=None,
+                       memory_budget=DEFAULT_MEMORY_BUDGET):
+    """Simuliere den Wert aller Positionen eines Kennzahlen-Frames über steps Schritte"""
+    simulator = MonteCarloSimulator(
+        frame[value_column].to_numpy(dtype=np.float64),
+        volatilities(frame["symbol"]),
+        correlation=correlation,
+        seed=seed
+    )
+    return simulator.run(n_paths, steps, memory_budget)
@@ -0,0 +1,303 @@
+"""Dauerhafte Ablage von Portfolio und Preisverlauf in SQLite"""
+from datetime import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from portfolio_store import COLUMNS, PortfolioStore
+from csv_import import FingerprintSet
+from ledger import Ledger, Transaction
+from ohlc import DailyBars
+from timeseries import DEFAULT_TIERS, HOUR, PriceHistory
+
+# Pfad der Datenbank, über PORTFOLIO_DB änderbar
+DEFAULT_DB_PATH = os.environ.get("PORTFOLIO_DB", "portfolio.db")
+
+# Abstand in Sekunden, in dem der gespeicherte Preisverlauf wie die Ringpuffer verdichtet wird
+COMPACT_INTERVAL = HOUR
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS holdings (
+    name TEXT PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    quantity REAL NOT NULL,
+    purchase_price REAL NOT NULL,
+    purchase_date TEXT,
+    current_price REAL NOT NULL,
+    type TEXT,
+    currency TEXT,
+    sector TEXT,
+    stale INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_holdings_symbol ON holdings (symbol);
+
+CREATE TABLE IF NOT EXISTS price_history (
+    name TEXT NOT NULL,
+    ts REAL NOT NULL,
+    price REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_price_history_name_ts ON price_history (name, ts);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    asset TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    quantity REAL NOT NULL DEFAULT 0,
+    price REAL NOT NULL DEFAULT 0,
+    amount REAL NOT NULL DEFAULT 0,
+    date TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS import_fingerprints (
+    fingerprint INTEGER PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS daily_bars (
+    symbol TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL NOT NULL,
+    PRIMARY KEY (symbol, day)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS bar_coverage (
+    symbol TEXT PRIMARY KEY,
+    first_day INTEGER NOT NULL,
+    last_day INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class PortfolioDatabase:
+    """SQLite-Datenbank mit einer Verbindung pro Prozess, geschützt durch ein Lock"""
+
+    def __init__(self, path=DEFAULT_DB_PATH, tiers=DEFAULT_TIERS):
+        self.path = path
+        self.tiers = tiers
+        self._last_compaction = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._conn.executescript(SCHEMA)
+        # Ältere Datenbanken enthalten noch den unverdichteten Verlauf
+        with self._lock, self._conn:
+            self._compact_price_history(time.time())
+
+    def _migrate(self):
+        # Preisverlauf mit Datums-Text auf numerische Zeitstempel umstellen
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(price_history)")]
+        if "date" in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE price_history RENAME TO price_history_old")
+                self._conn.execute("DROP INDEX IF EXISTS idx_price_history_name_date")
+                self._conn.executescript(SCHEMA)
+                self._conn.execute(
+                    "INSERT INTO price_history (name, ts, price) "
+                    "SELECT name, CAST(strftime('%s', date) AS REAL), price FROM price_history_old"
+                )
+                self._conn.execute("DROP TABLE price_history_old")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Laden
+
+    def has_holdings(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM holdings LIMIT 1").fetchone() is not None
+
+    def load_store(self):
+        """Lies alle Positionen in einem Zug in einen PortfolioStore"""
+        with self._lock:
+            frame = pd.read_sql_query(
+                f"SELECT name, {', '.join(COLUMNS)} FROM holdings ORDER BY rowid",
+                self._conn,
+                index_col="name"
+            )
+        frame["purchase_date"] = frame["purchase_date"].fillna("")
+        return PortfolioStore.from_frame(frame)
+
+    def load_price_history(self, tiers=None):
+        """Lies den Preisverlauf innerhalb der längsten Aufbewahrung in Ringpuffer"""
+        tiers = self.tiers if tiers is None else tiers
+        history = PriceHistory(tiers)
+        since = time.time() - max(retention for _, retention in tiers)
+        with self._lock:
+            frame = pd.read_sql_query(
+                "SELECT name, ts, price FROM price_history WHERE ts >= ? ORDER BY name, ts",
+                self._conn, params=(since,)
+            )
+        for name, group in frame.groupby("name", sort=False):
+            history.series(name).extend(group["ts"].to_numpy(), group["price"].to_numpy())
+        return history
+
+    def load_ledger(self):
+        """Lies alle Transaktionen und baue daraus den Positionsindex auf"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(Transaction._fields)} FROM transactions").fetchall()
+        ledger = Ledger()
+        ledger.load(Transaction(*row) for row in rows)
+        return ledger
+
+    def load_bars(self):
+        """Lies alle Tageskurse in einem Zug in eine DailyBars-Spaltenablage"""
+        with self._lock:
+            frame = pd.read_sql_query("SELECT symbol, day, open, high, low, close FROM daily_bars", self._conn)
+            coverage = self._conn.execute("SELECT symbol, first_day, last_day FROM bar_coverage").fetchall()
+        return DailyBars.from_frame(frame, coverage)
+
+    def load_fingerprints(self):
+        """Fingerprints aller bereits importierten CSV-Zeilen"""
+        with self._lock:
+            rows = self._conn.execute("SELECT fingerprint FROM import_fingerprints").fetchall()
+        # SQLite speichert vorzeichenbehaftet, die Hashes sind uint64
+        return FingerprintSet(np.array([row[0] for row in rows], dtype=np.int64).view(np.uint64))
+
+    def load_setting(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (f"setting:{key}",)).fetchone()
+        return row[0] if row else default
+
+    def save_setting(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (f"setting:{key}", value))
+
+    def load_last_update(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'last_price_update'").fetchone()
+        return datetime.fromisoformat(row[0]) if row else None
+
+    # Schreiben
+
+    def save_changes(self, store):
+        """Schreibe nur die seit dem letzten Aufruf geänderten Positionen
+
+        Reine Kursänderungen schreiben nur current_price und stale, damit eine
+        Kursaktualisierung keine Bestände überschreibt, die eine andere
+        Session inzwischen geändert hat.
+        """
+        changed, priced, removed = store.pop_changes()
+        if not changed and not priced and not removed:
+            return
+        rows = []
+        for name in changed:
+            record = store.get(name)
+            rows.append((name, *(record[col] for col in COLUMNS)))
+        prices = []
+        for name in priced:
+            record = store.get(name)
+            prices.append((record["current_price"], record["stale"], name))
+        with self._lock, self._conn:
+            if removed:
+                self._conn.executemany("DELETE FROM holdings WHERE name = ?", [(n,) for n in removed])
+                self._conn.executemany("DELETE FROM price_history WHERE name = ?", [(n,) for n in removed])
+            if rows:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO holdings (name, {', '.join(COLUMNS)}) "
+                    f"VALUES ({', '.join('?' * (len(COLUMNS) + 1))})",
+                    rows
+                )
+            if prices:
+                self._conn.executemany("UPDATE holdings SET current_price = ?, stale = ? WHERE name = ?", prices)
+
+    def append_transactions(self, transactions, fingerprints=()):
+        """Hänge neue Transaktionen an und gib sie mit der vergebenen id zurück
+
+        Die ids vergibt die Datenbank unter einer Schreibsperre, damit mehrere
+        Sessions (oder Prozesse) auf derselben Datei nie dieselbe id erhalten.
+        fingerprints (uint64) der importierten Zeilen werden in derselben
+        Datenbank-Transaktion gespeichert, damit ein Abbruch keinen Import halb markiert.
+        """
+        transactions = list(transactions)
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            next_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM transactions").fetchone()[0]
+            transactions = [tx._replace(id=next_id + i) for i, tx in enumerate(transactions)]
+            self._conn.executemany(
+                f"INSERT INTO transactions ({', '.join(Transaction._fields)}) "
+                f"VALUES ({', '.join('?' * len(Transaction._fields))})",
+                transactions
+            )
+            if len(fingerprints):
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO import_fingerprints (fingerprint) VALUES (?)",
+                    ((int(value),) for value in np.asarray(fingerprints, dtype=np.uint64).view(np.int64))
+                )
+        return transactions
+
+    def save_bars(self, frame, coverage=None):
+        """Schreibe Tageskurse (symbol, day, open, high, low, close) und die geladenen Zeiträume {symbol: (von, bis)}"""
+        rows = zip(
+            frame["symbol"].tolist(), frame["day"].tolist(),
+            *(frame[field].astype(np.float64).tolist() for field in ("open", "high", "low", "close"))
+        )
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO daily_bars (symbol, day, open, high, low, close) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            if coverage:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO bar_coverage (symbol, first_day, last_day) VALUES (?, ?, ?)",
+                    ((symbol, first, last) for symbol, (first, last) in coverage.items())
+                )
+
+    def append_price_history(self, points, updated_at=None, skip_existing=False):
+        """Hänge neue Preispunkte (name, ts, price) an
+
+        skip_existing: Punkte mit bereits gespeichertem (name, ts) auslassen, z.B. wenn
+        mehrere Sessions denselben Snapshot des Schedulers übernehmen.
+        """
+        with self._lock, self._conn:
+            if skip_existing:
+                self._conn.executemany(
+                    "INSERT INTO price_history (name, ts, price) SELECT ?, ?, ? "
+                    "WHERE NOT EXISTS (SELECT 1 FROM price_history WHERE name = ? AND ts = ?)",
+                    ((name, ts, price, name, ts) for name, ts, price in points)
+                )
+            else:
+                self._conn.executemany("INSERT INTO price_history (name, ts, price) VALUES (?, ?, ?)", points)
+            if updated_at is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_price_update', ?)",
+                    (updated_at.isoformat(),)
+                )
+            now = time.time()
+            if now - self._last_compaction >= COMPACT_INTERVAL:
+                self._compact_price_history(now)
+
+    def _compact_price_history(self, now):
+        """Verdichte den gespeicherten Verlauf nach denselben Stufen wie PriceSeries
+
+        Hinter der Aufbewahrung einer Stufe bleibt pro Zeitfenster der nächsten
+        Stufe nur der letzte Punkt, hinter der längsten Aufbewahrung nichts.
+        Aufruf mit gehaltenem Lock innerhalb einer Transaktion.
+        """
+        for (_, retention), (resolution, _) in zip(self.tiers, self.tiers[1:]):
+            self._conn.execute(
+                "DELETE FROM price_history WHERE rowid IN ("
+                "SELECT rowid FROM (SELECT rowid, ROW_NUMBER() OVER ("
+                "PARTITION BY name, CAST(ts / ? AS INTEGER) ORDER BY ts DESC, rowid DESC) AS rank "
+                "FROM price_history WHERE ts < ?) WHERE rank > 1)",
+                (resolution, now - retention)
+            )
+        self._conn.execute(
+            "DELETE FROM price_history WHERE ts < ?",
+            (now - max(retention for _, retention in self.tiers),)
+        )
+        self._last_compaction = now
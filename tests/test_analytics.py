@@ -0,0 +1,43 @@
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import compute_analytics, pairwise_correlation
+from timeseries import DAY, PriceHistory
+
+
+def _frame(names, symbols):
+    return pd.DataFrame({
+        "symbol": symbols,
+        "quantity": 1.0,
+        "purchase_price": 100.0,
+        "purchase_date": "2000-01-01",
+        "currency": "CHF",
+    }, index=names)
+
+
+def test_twr_counts_late_first_price_as_inflow():
+    history = PriceHistory()
+    first = (int(time.time()) // DAY - 9) * DAY
+    for day in range(10):
+        history.append_many(["A"], first + day * DAY, [100.0])
+    # B hat erst ab Tag 7 Kurse, z.B. weil nur A Tageskurse nachgeladen hat
+    history.append_many(["B"], first + 7 * DAY, [1000.0])
+    history.append_many(["B"], first + 8 * DAY, [1100.0])
+    history.append_many(["B"], first + 9 * DAY, [1100.0])
+
+    result = compute_analytics(_frame(["A", "B"], ["A", "B"]), history)
+
+    assert result.twr == pytest.approx(1200 / 1100 - 1)
+
+
+def test_pairwise_correlation_without_returns_does_not_warn():
+    returns = pd.DataFrame({"A": [np.nan, 0.01, 0.02, -0.01], "B": [np.nan] * 4})
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        corr = pairwise_correlation(returns)
+    assert np.isnan(corr.loc["A", "B"])
+    assert corr.loc["A", "A"] == 1.0
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+import io
+
+import pytest
+
+from fx import FxEngine, StaticRateProvider
+from portfolio_engine import PortfolioEngine
+from scheduler import PriceSnapshot
+from storage import PortfolioDatabase
+
+
+def _engine(database):
+    return PortfolioEngine(database, live_provider=None, fx_engine=None)
+
+
+def _seed(path):
+    database = PortfolioDatabase(path)
+    engine = _engine(database)
+    engine.record("Bitcoin (BTC)", "BTC-USD", "buy", 1, 40000.0, date="2024-01-01",
+                  type="Krypto", currency="USD", sector="Kryptowährung")
+    return database
+
+
+def test_snapshot_keeps_holdings_of_other_session(tmp_path):
+    database = _seed(str(tmp_path / "portfolio.db"))
+    session_a, session_b = _engine(database), _engine(database)
+    session_a.apply_edits({"Bitcoin (BTC)": (2.0, 40000.0)}, [])
+
+    snapshot = PriceSnapshot(1, {"BTC-USD": 50000.0}, frozenset(), datetime.now())
+    assert session_b.apply_snapshot(snapshot)
+
+    saved = database.load_store().get("Bitcoin (BTC)")
+    assert saved["quantity"] == 2.0
+    assert saved["current_price"] == 50000.0
+
+
+def test_unchanged_snapshot_is_not_saved_again(tmp_path):
+    database = _seed(str(tmp_path / "portfolio.db"))
+    engine = _engine(database)
+    now = datetime.now()
+    assert engine.apply_snapshot(PriceSnapshot(1, {"BTC-USD": 50000.0}, frozenset(), now))
+    version = engine.store.version
+
+    repeated = PriceSnapshot(2, {"BTC-USD": 50000.0}, frozenset(), now + timedelta(minutes=1))
+    assert not engine.apply_snapshot(repeated)
+    assert engine.store.version == version
+
+
+def test_reimport_skips_filtered_and_invalid_rows(tmp_path):
+    engine = _engine(PortfolioDatabase(str(tmp_path / "portfolio.db")))
+    text = (
+        "DATE;ACTIVITY TYPE;ACTIVITY NAME;ASSET;PRICE PER UNIT;DEBIT CURRENCY\n"
+        "15.01.2023;INVEST_ORDER_EXECUTED;2x Apple;AAPL;150;USD\n"
+        "16.01.2023;CASH_TRANSFER_RECEIVED;Einzahlung;;;CHF\n"
+        "17.01.2023;INVEST_ORDER_EXECUTED;0x Tesla;TSLA;200;USD\n"
+    )
+    first = engine.import_csv(io.BytesIO(text.encode()))
+    assert (first.transactions, first.skipped) == (1, 1)
+
+    again = engine.import_csv(io.BytesIO(text.encode()))
+    assert (again.transactions, again.skipped, again.duplicates) == (0, 0, 3)
+    assert len(engine.ledger) == 1
+
+
+class FixedQuotes:
+    """Live-Quelle mit festen Kursen in USD"""
+
+    name = "fixed"
+    quote_currency = "usd"
+    timeout = 1.0
+    batch_size = 100
+
+    def __init__(self, prices):
+        self.prices = prices
+
+    def supports(self, symbol):
+        return symbol in self.prices
+
+    def fetch(self, symbols, timeout=None):
+        return {s: self.prices[s] for s in symbols if s in self.prices}
+
+
+def test_live_quotes_are_converted_into_row_currency(tmp_path):
+    engine = PortfolioEngine(PortfolioDatabase(str(tmp_path / "portfolio.db")),
+                             live_provider=FixedQuotes({"BTC": 50000.0}), fx_engine=FxEngine(StaticRateProvider()))
+    engine.record("Bitcoin (BTC)", "BTC", "buy", 1, 40000.0, date="2024-01-01",
+                  type="Krypto", currency="CHF", sector="Kryptowährung")
+
+    engine.refresh_prices()
+
+    # 50'000 USD zu 0.88 CHF pro USD
+    assert engine.store.get("Bitcoin (BTC)")["current_price"] == pytest.approx(44000.0)
+    assert engine.price_history.get("Bitcoin (BTC)").to_arrays()[1][-1] == pytest.approx(44000.0)
@@ -0,0 +1,21 @@
+from instrumentation import Metrics
+from quote_cache import QuoteCache
+
+
+def test_reset_clears_read_counters_exported_as_counters():
+    metrics = Metrics()
+    cache = QuoteCache()
+    metrics.register_counter("quote_cache_hits_total", lambda: cache.hits, reset=cache.reset_stats)
+    metrics.register_gauge("scheduler_symbols", lambda: 3)
+    metrics.increment("upstream_errors_total", provider="coingecko")
+    cache.hits = 5
+
+    text = metrics.to_prometheus()
+    assert "# TYPE portfolio_quote_cache_hits_total counter" in text
+    assert "portfolio_quote_cache_hits_total 5" in text
+    assert "# TYPE portfolio_scheduler_symbols gauge" in text
+
+    metrics.reset()
+    counters = {c["name"]: c["value"] for c in metrics.snapshot()["counters"]}
+    assert counters == {"quote_cache_hits_total": 0}
+    assert metrics.snapshot()["gauges"][0]["value"] == 3
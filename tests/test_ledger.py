@@ -0,0 +1,42 @@
+import io
+
+import pytest
+
+from csv_import import import_csv
+from ledger import SELL, Ledger, import_purchases
+
+
+def _import(text):
+    result = import_csv(io.BytesIO(text.encode()))
+    transactions, _ = import_purchases(result.rows)
+    ledger = Ledger()
+    ledger.extend([tx._replace(id=i) for i, tx in enumerate(transactions, start=1)])
+    return result, ledger
+
+
+def test_fifo_with_non_iso_dates():
+    # Der spätere Kauf steht zuerst und würde als Text vor dem früheren sortiert
+    result, ledger = _import(
+        "Ticker,Quantity,Price,Date\n"
+        "AAPL,10,200,02.03.2024\n"
+        "AAPL,10,100,15.01.2023\n"
+    )
+    assert sorted(result.rows["date"]) == ["2023-01-15", "2024-03-02"]
+
+    ledger.record("AAPL (AAPL)", "AAPL", SELL, 10, 150, date="2024-06-01")
+    position = ledger.get("AAPL (AAPL)")
+
+    assert position.realized == pytest.approx(500.0)
+    assert position.first_date == "2024-03-02"
+    assert position.average_cost == pytest.approx(200.0)
+
+
+def test_unparsable_dates_are_skipped():
+    result, ledger = _import(
+        "Ticker,Quantity,Price,Date\n"
+        "AAPL,10,100,15.01.2023\n"
+        "AAPL,10,200,kein Datum\n"
+    )
+    assert result.transactions == 1
+    assert result.skipped == 1
+    assert ledger.get("AAPL (AAPL)").quantity == pytest.approx(10.0)
@@ -0,0 +1,26 @@
+import json
+import os
+
+from providers import FileQuoteProvider
+
+
+def test_missing_quote_file_supports_nothing(tmp_path):
+    provider = FileQuoteProvider(str(tmp_path / "quotes.json"))
+    assert not provider.supports("BTC")
+    assert provider.fetch(["BTC"]) == {}
+
+    (tmp_path / "quotes.json").write_text(json.dumps({"btc": 50000}))
+    assert provider.fetch(["BTC"]) == {"BTC": 50000.0}
+
+
+def test_quote_file_is_checked_once_per_cycle(tmp_path, monkeypatch):
+    path = tmp_path / "quotes.json"
+    path.write_text(json.dumps({"BTC": 50000, "ETH": 3000}))
+    provider = FileQuoteProvider(str(path), check_interval=60.0)
+    calls = []
+    getmtime = os.path.getmtime
+    monkeypatch.setattr(os.path, "getmtime", lambda p: calls.append(p) or getmtime(p))
+
+    assert all(provider.supports(s) for s in ["BTC", "ETH"] * 100)
+    provider.fetch(["BTC", "ETH"])
+    assert len(calls) == 2
@@ -0,0 +1,22 @@
+from portfolio_store import PortfolioStore
+from storage import PortfolioDatabase
+
+
+def test_price_update_keeps_holdings_of_other_session(tmp_path):
+    database = PortfolioDatabase(str(tmp_path / "portfolio.db"))
+    store = PortfolioStore()
+    store.add("Apple Inc. (AAPL)", symbol="AAPL", quantity=5, purchase_price=170.5, currency="USD")
+    database.save_changes(store)
+
+    # Zwei Sessions mit eigener Kopie derselben Datenbank
+    session_a = database.load_store()
+    session_b = database.load_store()
+    session_a.update("Apple Inc. (AAPL)", quantity=50)
+    database.save_changes(session_a)
+    session_b.apply_quotes({"AAPL": 190.0}, stale=())
+    database.save_changes(session_b)
+
+    saved = database.load_store().get("Apple Inc. (AAPL)")
+    assert saved["quantity"] == 50
+    assert saved["current_price"] == 190.0
+    database.close()
@@ -0,0 +1,193 @@
+"""Kompakter Preisverlauf: Ringpuffer pro Asset mit abgestufter Verdichtung"""
+import numpy as np
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# Stufen als (Auflösung, Aufbewahrung) in Sekunden: Minuten für einen Tag,
+# Stunden für 30 Tage, Tage für 5 Jahre. Ältere Punkte fallen heraus.
+DEFAULT_TIERS = ((MINUTE, DAY), (HOUR, 30 * DAY), (DAY, 5 * 365 * DAY))
+
+
+class RingBuffer:
+    """Vorab allozierter Ringpuffer für (Zeitstempel, Preis) als float64
+
+    Jeder Wert wird doppelt geschrieben (Position i und i + Kapazität), so
+    dass der Inhalt immer als zusammenhängender Slice ohne Kopie lesbar ist.
+    Der Speicher wächst bis max_capacity und überschreibt dann die ältesten Werte.
+    """
+
+    def __init__(self, max_capacity, initial_capacity=16):
+        self.max_capacity = max_capacity
+        self._capacity = min(initial_capacity, max_capacity)
+        self._data = np.empty((2, 2 * self._capacity), dtype=np.float64)
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._data.nbytes
+
+    def last(self):
+        """Letzter Punkt als (Zeitstempel, Preis) oder None"""
+        if not self._count:
+            return None
+        i = self._start + self._count - 1
+        return self._data[0, i], self._data[1, i]
+
+    def replace_last(self, ts, value):
+        i = (self._start + self._count - 1) % self._capacity
+        self._data[0, i] = self._data[0, i + self._capacity] = ts
+        self._data[1, i] = self._data[1, i + self._capacity] = value
+
+    def append(self, ts, value):
+        """Hänge einen Punkt an und gib den verdrängten Punkt zurück (oder None)"""
+        evicted = None
+        if self._count == self._capacity:
+            if self._capacity < self.max_capacity:
+                self._grow()
+            else:
+                evicted = (self._data[0, self._start], self._data[1, self._start])
+                self._start = (self._start + 1) % self._capacity
+                self._count -= 1
+        i = (self._start + self._count) % self._capacity
+        self._data[0, i] = self._data[0, i + self._capacity] = ts
+        self._data[1, i] = self._data[1, i + self._capacity] = value
+        self._count += 1
+        return evicted
+
+    def view(self):
+        """Zeitstempel und Preise als schreibgeschützte Views ohne Kopie"""
+        window = self._data[:, self._start:self._start + self._count]
+        window.flags.writeable = False
+        return window[0], window[1]
+
+    def _grow(self):
+        ts, values = self.view()
+        capacity = min(2 * self._capacity, self.max_capacity)
+        data = np.empty((2, 2 * capacity), dtype=np.float64)
+        data[0, :self._count] = ts
+        data[1, :self._count] = values
+        data[:, capacity:capacity + self._count] = data[:, :self._count]
+        self._data = data
+        self._capacity = capacity
+        self._start = 0
+
+
+class PriceSeries:
+    """Preisverlauf eines Assets über mehrere Auflösungsstufen
+
+    Neue Punkte landen in der feinsten Stufe, je Zeitfenster gilt der letzte
+    Preis. Aus einer Stufe verdrängte Punkte werden in die nächstgröbere
+    übernommen, aus der letzten Stufe fallen sie heraus.
+    """
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.resolutions = [resolution for resolution, _ in tiers]
+        self.buffers = [RingBuffer(max(int(retention // resolution), 1)) for resolution, retention in tiers]
+
+    def __len__(self):
+        return sum(len(buffer) for buffer in self.buffers)
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self.buffers)
+
+    def append(self, ts, price):
+        point = (ts, price)
+        for resolution, buffer in zip(self.resolutions, self.buffers):
+            point = self._insert(buffer, resolution, *point)
+            if point is None:
+                return
+
+    @staticmethod
+    def _insert(buffer, resolution, ts, price):
+        last = buffer.last()
+        if last is not None and ts // resolution == last[0] // resolution:
+            buffer.replace_last(ts, price)
+            return None
+        return buffer.append(ts, price)
+
+    def extend(self, timestamps, prices):
+        """Füge viele chronologisch sortierte Punkte hinzu"""
+        if not len(self) and len(timestamps):
+            self._bulk_load(np.asarray(timestamps, dtype=np.float64), np.asarray(prices, dtype=np.float64))
+            return
+        for ts, price in zip(timestamps, prices):
+            self.append(ts, price)
+
+    def _bulk_load(self, timestamps, prices):
+        # Von fein nach grob: jede Stufe behält die jüngsten Zeitfenster,
+        # der ältere Rest wird in der nächsten Stufe weiter verdichtet
+        for resolution, buffer in zip(self.resolutions, self.buffers):
+            if not len(timestamps):
+                break
+            buckets = timestamps // resolution
+            last_in_bucket = np.flatnonzero(np.append(buckets[1:] != buckets[:-1], True))
+            keep = last_in_bucket[-buffer.max_capacity:]
+            for ts, price in zip(timestamps[keep], prices[keep]):
+                buffer.append(ts, price)
+            older = last_in_bucket[:-buffer.max_capacity] if len(last_in_bucket) > buffer.max_capacity else last_in_bucket[:0]
+            timestamps, prices = timestamps[older], prices[older]
+
+    def views(self):
+        """[(Zeitstempel, Preise)] pro Stufe, von der ältesten zur neuesten, ohne Kopie"""
+        return [buffer.view() for buffer in reversed(self.buffers) if len(buffer)]
+
+    def latest(self):
+        """Jüngster Punkt als (Zeitstempel, Preis) oder None"""
+        return self.buffers[0].last()
+
+    def to_arrays(self):
+        """Alle Punkte chronologisch als zusammenhängende Arrays (kopiert)"""
+        views = self.views()
+        if not views:
+            return np.empty(0), np.empty(0)
+        return np.concatenate([v[0] for v in views]), np.concatenate([v[1] for v in views])
+
+
+class PriceHistory:
+    """Preisverläufe aller Assets, Schlüssel ist der Asset-Name"""
+
+    def __init__(self, tiers=DEFAULT_TIERS):
+        self.tiers = tiers
+        self._series = {}
+        self.version = 0
+
+    def __contains__(self, name):
+        return name in self._series
+
+    def __len__(self):
+        return len(self._series)
+
+    def __iter__(self):
+        return iter(self._series)
+
+    def get(self, name):
+        return self._series.get(name)
+
+    def series(self, name):
+        """PriceSeries eines Assets, wird bei Bedarf angelegt"""
+        series = self._series.get(name)
+        if series is None:
+            series = self._series[name] = PriceSeries(self.tiers)
+        return series
+
+    def append_many(self, names, ts, prices):
+        """Hänge denselben Zeitstempel für mehrere Assets an"""
+        for name, price in zip(names, prices):
+            self.series(name).append(ts, float(price))
+        self.version += 1
+
+    def pop(self, name, default=None):
+        series = self._series.pop(name, default)
+        self.version += 1
+        return series
+
+    @property
+    def nbytes(self):
+        return sum(series.nbytes for series in self._series.values())
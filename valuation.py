@@ -0,0 +1,65 @@
+"""Vektorisierte Portfolio-Kennzahlen für Dashboard und Auswertungen"""
+import numpy as np
+import pandas as pd
+
+# Spaltennamen der berechneten Kennzahlen
+INVESTED = "Investiert"
+CURRENT_VALUE = "Aktueller Wert"
+GAIN = "Gewinn/Verlust"
+GAIN_PERCENT = "Gewinn/Verlust %"
+
+
+def percent_change(gain, base):
+    """gain / base * 100, 0 wo die Basis nicht positiv ist"""
+    gain = np.asarray(gain, dtype=np.float64)
+    base = np.asarray(base, dtype=np.float64)
+    out = np.zeros(np.broadcast(gain, base).shape)
+    np.divide(gain, base, out=out, where=base > 0)
+    return out * 100
+
+
+def compute_metrics(frame, rates=None):
+    """Hänge Investiert, Aktueller Wert und Gewinn/Verlust als Spalten an den Frame an
+
+    Mit einer fx.RateTable werden die Werte in deren Basiswährung umgerechnet.
+    """
+    quantity = frame["quantity"].to_numpy(dtype=np.float64)
+    invested = quantity * frame["purchase_price"].to_numpy(dtype=np.float64)
+    current = quantity * frame["current_price"].to_numpy(dtype=np.float64)
+    if rates is not None and len(frame):
+        factors = rates.factors(frame["currency"])
+        invested = invested * factors
+        current = current * factors
+    gain = current - invested
+    return frame.assign(**{
+        INVESTED: invested,
+        CURRENT_VALUE: current,
+        GAIN: gain,
+        GAIN_PERCENT: percent_change(gain, invested),
+    })
+
+
+class PortfolioTotals:
+    """Summen über das gesamte Portfolio"""
+
+    def __init__(self, invested, current, count):
+        self.invested = float(invested)
+        self.current = float(current)
+        self.gain = self.current - self.invested
+        self.gain_percent = float(percent_change(self.gain, self.invested))
+        self.count = count
+
+
+def compute_totals(metrics):
+    return PortfolioTotals(metrics[INVESTED].sum(), metrics[CURRENT_VALUE].sum(), len(metrics))
+
+
+def portfolio_metrics(store, rates=None):
+    """Kennzahlen und Summen eines PortfolioStore, nur einmal pro Version und Kurstabelle berechnet"""
+    return store.cached("metrics", _build_metrics, rates)
+
+
+def _build_metrics(store, rates):
+    frame = store.frame() if len(store) else pd.DataFrame(columns=["quantity", "purchase_price", "current_price", "currency"])
+    metrics = compute_metrics(frame, rates)
+    return metrics, compute_totals(metrics)